@@ -0,0 +1,31 @@
+import os
+import tempfile
+
+
+# Atomically and durably replace the contents of path with the string data.
+# The data goes to a temporary file in the same directory, which is flushed,
+# fsynced and renamed over path, so readers see either the old contents or
+# the new ones and a crash never leaves a partial file. The directory is
+# fsynced as well where the platform allows it, so the rename is durable too.
+# Temporary files are private (0600) unless permissions are given.
+def atomic_write(path, data, permissions=None):
+    directory = os.path.dirname(os.path.abspath(path))
+    name = os.path.basename(path)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f'.{name}-', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        if permissions is not None:
+            os.chmod(temp_path, permissions)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    if hasattr(os, 'O_DIRECTORY'):
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
@@ -0,0 +1,89 @@
+import bisect
+
+
+# Local copy of each guild's ban list, kept in sync from ban and unban
+# events. Answers "is this user banned" in O(1) and supports prefix search
+# over usernames through a sorted list of (lowercase name, user ID).
+# Ban events that arrive while a ban list is being paged are buffered and
+# applied once it is complete, so none are lost.
+class BanIndex:
+    def __init__(self):
+        self.bans = {}
+        self.names = {}
+        self.loaded = set()
+        # Guild ID -> (user ID, username or None for an unban) events seen during its load
+        self.pending = {}
+
+    def is_loaded(self, guild_id):
+        return guild_id in self.loaded
+
+    def is_loading(self, guild_id):
+        return guild_id in self.pending
+
+    # Page through the guild's whole ban list once. A load that is
+    # forgotten or replaced by a newer one before it finishes is discarded.
+    async def load(self, guild):
+        events = []
+        self.pending[guild.id] = events
+        bans = {}
+        try:
+            async for entry in guild.bans(limit=None):
+                bans[entry.user.id] = entry.user.name
+        finally:
+            current = self.pending.get(guild.id) is events
+            if current:
+                del self.pending[guild.id]
+        if not current:
+            return
+        for user_id, name in events:
+            if name is None:
+                bans.pop(user_id, None)
+            else:
+                bans[user_id] = name
+        self.bans[guild.id] = bans
+        self.names[guild.id] = sorted((name.lower(), user_id) for user_id, name in bans.items())
+        self.loaded.add(guild.id)
+
+    def add(self, guild_id, user):
+        events = self.pending.get(guild_id)
+        if events is not None:
+            events.append((user.id, user.name))
+        if guild_id not in self.loaded:
+            return
+        self.remove(guild_id, user.id)
+        self.bans[guild_id][user.id] = user.name
+        bisect.insort(self.names[guild_id], (user.name.lower(), user.id))
+
+    def remove(self, guild_id, user_id):
+        events = self.pending.get(guild_id)
+        if events is not None:
+            events.append((user_id, None))
+        if guild_id not in self.loaded:
+            return
+        name = self.bans[guild_id].pop(user_id, None)
+        if name is not None:
+            names = self.names[guild_id]
+            index = bisect.bisect_left(names, (name.lower(), user_id))
+            if index < len(names) and names[index] == (name.lower(), user_id):
+                del names[index]
+
+    def is_banned(self, guild_id, user_id):
+        return user_id in self.bans.get(guild_id, ())
+
+    def forget(self, guild_id):
+        self.bans.pop(guild_id, None)
+        self.names.pop(guild_id, None)
+        self.pending.pop(guild_id, None)
+        self.loaded.discard(guild_id)
+
+    # Up to limit (user ID, username) pairs whose username starts with prefix
+    def search(self, guild_id, prefix, limit=25):
+        names = self.names.get(guild_id, [])
+        prefix = prefix.lower()
+        results = []
+        index = bisect.bisect_left(names, (prefix,))
+        while index < len(names) and len(results) < limit and names[index][0].startswith(prefix):
+            user_id = names[index][1]
+            results.append((user_id, self.bans[guild_id][user_id]))
+            index += 1
+        return results
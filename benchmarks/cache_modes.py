@@ -0,0 +1,157 @@
+# Startup time and resident memory of the member cache modes (see
+# member_cache.py). Serves a fake Discord from fake_gateway.py and, for each
+# mode, starts a fresh process that logs in with that mode's cache options,
+# waits for ready and reports time to ready, RSS and cached members. It then
+# fetches the largest guild's members on demand the way the role audit and
+# /ban_role do, and reports the time that takes and the RSS after it.
+# Exits with an error if lazy mode holds more than the bot's own member per
+# guild after that fetch, i.e. if fetched member lists end up cached (no
+# member joins during the run, so lazy mode has no joined members to keep).
+#
+# Only the bot's connection and cache are measured, not the cogs, so the
+# numbers isolate what the mode changes.
+#
+# Usage: python benchmarks/cache_modes.py [--guilds 50] [--members 5000]
+#            [--modes full lazy] [--output cache_modes.json]
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def rss_mb():
+    # Current RSS on Linux, otherwise the peak
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024, 1)
+
+
+# Runs in the child process: log in with one cache mode and measure
+async def measure(mode):
+    import discord
+    from discord.ext import commands
+    from cluster import apply_api_override
+    from member_cache import guild_members, member_cache_options
+
+    apply_api_override()
+    started = time.perf_counter()
+    intents = discord.Intents.default()
+    intents.members = True
+    bot = commands.Bot(command_prefix="!", intents=intents, **member_cache_options(mode))
+    result = {"mode": mode, "rss_before_login_mb": rss_mb()}
+
+    @bot.event
+    async def on_ready():
+        result["ready_s"] = round(time.perf_counter() - started, 3)
+        result["guilds"] = len(bot.guilds)
+        result["members"] = sum(guild.member_count or 0 for guild in bot.guilds)
+        result["cached_members"] = sum(len(guild.members) for guild in bot.guilds)
+        result["rss_ready_mb"] = rss_mb()
+
+        guild = max(bot.guilds, key=lambda guild: guild.member_count or 0)
+        fetch_started = time.perf_counter()
+        members = await guild_members(guild)
+        result["on_demand_members"] = len(members)
+        result["on_demand_s"] = round(time.perf_counter() - fetch_started, 3)
+        del members
+        result["cached_members_after"] = sum(len(guild.members) for guild in bot.guilds)
+        result["rss_after_on_demand_mb"] = rss_mb()
+        await bot.close()
+
+    await bot.start('fake-token')
+    print(json.dumps(result))
+
+
+async def run_child(mode, api_base):
+    env = dict(os.environ, DISCORD_API_BASE=api_base)
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.abspath(__file__), '--child', mode,
+        env=env, stdout=asyncio.subprocess.PIPE
+    )
+    stdout, _ = await process.communicate()
+    lines = stdout.decode().strip().splitlines()
+    if process.returncode != 0 or not lines:
+        raise RuntimeError(f"The {mode} run failed with exit code {process.returncode}")
+    return json.loads(lines[-1])
+
+
+async def run(args):
+    from aiohttp import web
+    from fake_gateway import FakeDiscord
+
+    fake = FakeDiscord(args.guilds, args.members, 1, args.port, args.seed)
+    app = web.Application()
+    app.add_routes(fake.routes())
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', args.port).start()
+    try:
+        results = []
+        for mode in args.modes:
+            result = await run_child(mode, f"http://127.0.0.1:{args.port}")
+            print(
+                f"{mode:<6} ready {result['ready_s']:>7.2f} s  RSS {result['rss_ready_mb']:>8} MB  "
+                f"cached {result['cached_members']:>9}  on demand {result['on_demand_s']:>6.2f} s  "
+                f"RSS after {result['rss_after_on_demand_mb']:>8} MB  cached after {result['cached_members_after']:>9}"
+            )
+            results.append(result)
+        return results
+    finally:
+        await runner.cleanup()
+
+
+# Why a run's cache is larger than its mode allows, or None
+def cache_problem(result):
+    if result["mode"] == "lazy" and result["cached_members_after"] > result["guilds"]:
+        return (
+            f"lazy mode cached {result['cached_members_after']} members in {result['guilds']} guilds "
+            f"after an on-demand fetch; it should cache only the bot itself"
+        )
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare startup time and memory of the member cache modes.")
+    parser.add_argument('--guilds', type=int, default=50)
+    parser.add_argument('--members', type=int, default=5000, help="members per guild")
+    parser.add_argument('--modes', nargs='+', choices=['full', 'lazy'], default=['full', 'lazy'])
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='cache_modes.json', help="where to save the JSON results")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        asyncio.run(measure(args.child))
+        return
+
+    results = asyncio.run(run(args))
+    with open(args.output, 'w') as f:
+        json.dump({"config": {"guilds": args.guilds, "members": args.members}, "modes": results}, f, indent=2)
+    print(f"Results saved to {args.output}")
+    problems = [problem for problem in map(cache_problem, results) if problem]
+    if problems:
+        sys.exit("\n".join(problems))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,261 @@
+# Local stand-in for the Discord API and gateway, for running the real bot
+# (single process, AutoShardedBot or cluster_launcher.py) against synthetic
+# guilds without touching Discord. Implements just enough of the REST API
+# and gateway protocol for discord.py to log in, identify each shard,
+# receive its guilds, chunk or list members and send messages.
+#
+# Like Discord, GUILD_CREATE only carries the bot's own member for guilds
+# above the identify large_threshold; the rest arrive through member chunk
+# requests.
+#
+# Usage: python benchmarks/fake_gateway.py [--guilds 50] [--members 1000] [--shards 4] [--port 8765]
+#   then: DISCORD_API_BASE=http://127.0.0.1:8765 python main.py
+#   or:   python cluster_launcher.py --clusters 2 --shards 4 --api http://127.0.0.1:8765
+import argparse
+import datetime
+import itertools
+import json
+import random
+from aiohttp import web
+
+DISCORD_EPOCH_MS = 1420070400000
+CHUNK_SIZE = 1000  # Members per GUILD_MEMBERS_CHUNK, as on Discord
+
+
+class SnowflakeFactory:
+    def __init__(self):
+        self.increment = itertools.count()
+        self.timestamp = int(datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc).timestamp() * 1000)
+
+    # Distinct timestamps spread guilds evenly over shards
+    def __call__(self):
+        self.timestamp += 1
+        return str(((self.timestamp - DISCORD_EPOCH_MS) << 22) | (next(self.increment) & 0xFFF))
+
+
+def user_payload(user_id, name, bot=False):
+    return {
+        "id": user_id, "username": name, "discriminator": "0", "global_name": None,
+        "avatar": None, "bot": bot, "public_flags": 0,
+    }
+
+
+# discord.py only decodes bodies whose Content-Type is exactly
+# application/json, and aiohttp's json_response adds "; charset=utf-8"
+def json_response(data, status=200):
+    return web.Response(body=json.dumps(data).encode(), status=status, headers={"Content-Type": "application/json"})
+
+
+def member_payload(user, role_ids):
+    return {
+        "user": user, "roles": role_ids, "joined_at": "2024-01-01T00:00:00+00:00",
+        "deaf": False, "mute": False, "flags": 0, "pending": False, "nick": None,
+    }
+
+
+class FakeDiscord:
+    def __init__(self, guild_count, member_count, shard_count, port, seed=0):
+        self.snowflake = SnowflakeFactory()
+        self.rng = random.Random(seed)
+        self.shard_count = shard_count
+        self.port = port
+        self.bot_user = user_payload(self.snowflake(), "FakeBot", bot=True)
+        self.application_id = self.bot_user["id"]
+        self.sequence = itertools.count(1)
+        self.guilds = [self.build_guild(index, member_count) for index in range(guild_count)]
+        self.guilds_by_id = {guild["id"]: guild for guild in self.guilds}
+
+    def build_guild(self, index, member_count):
+        guild_id = self.snowflake()
+        roles = [
+            {"id": guild_id, "name": "@everyone", "permissions": "104324673", "position": 0},
+            {"id": self.snowflake(), "name": "Verified", "permissions": "0", "position": 1},
+            {"id": self.snowflake(), "name": "Unverified", "permissions": "0", "position": 1},
+            {"id": self.snowflake(), "name": "FakeBot", "permissions": "8", "position": 10, "managed": True},
+        ]
+        for role in roles:
+            role.update({"color": 0, "hoist": False, "mentionable": False, "flags": 0})
+            role.setdefault("managed", False)
+        category_id = self.snowflake()
+        channels = [
+            {"id": category_id, "type": 4, "name": "Text Channels", "position": 0, "permission_overwrites": []},
+        ] + [
+            {
+                "id": self.snowflake(), "type": 0, "name": f"channel-{i}", "position": i,
+                "parent_id": category_id, "permission_overwrites": [], "topic": None, "nsfw": False,
+            }
+            for i in range(5)
+        ]
+        members = [member_payload(self.bot_user, [roles[3]["id"]])]
+        for i in range(member_count):
+            user = user_payload(self.snowflake(), f"member{index}-{i}")
+            members.append(member_payload(user, [roles[1]["id"] if self.rng.random() < 0.9 else roles[2]["id"]]))
+        return {
+            "id": guild_id, "name": f"Fake Guild {index}", "icon": None, "owner_id": self.bot_user["id"],
+            "roles": roles, "channels": channels, "members": members, "member_count": len(members),
+            "emojis": [], "stickers": [], "features": [], "presences": [], "voice_states": [],
+            "threads": [], "stage_instances": [], "guild_scheduled_events": [],
+            "verification_level": 0, "default_message_notifications": 0, "explicit_content_filter": 0,
+            "mfa_level": 0, "nsfw_level": 0, "premium_tier": 0, "preferred_locale": "en-US",
+            "system_channel_flags": 0, "afk_timeout": 300, "unavailable": False,
+            "joined_at": "2024-01-01T00:00:00+00:00",
+        }
+
+    # --- REST ---
+
+    def routes(self):
+        return [
+            web.get('/api/v10/users/@me', self.get_user),
+            web.get('/api/v10/oauth2/applications/@me', self.get_application),
+            web.get('/api/v10/gateway', self.get_gateway),
+            web.get('/api/v10/gateway/bot', self.get_gateway),
+            web.put('/api/v10/applications/{application_id}/commands', self.put_commands),
+            web.post('/api/v10/channels/{channel_id}/messages', self.post_message),
+            web.get('/api/v10/guilds/{guild_id}/bans', self.get_bans),
+            web.get('/api/v10/guilds/{guild_id}/members', self.get_members),
+            web.get('/', self.gateway),
+            web.route('*', '/api/v10/{path:.*}', self.fallback),
+        ]
+
+    async def get_user(self, request):
+        return json_response(self.bot_user)
+
+    async def get_application(self, request):
+        return json_response({
+            "id": self.application_id, "name": "FakeBot", "icon": None, "description": "",
+            "rpc_origins": [], "bot_public": True, "bot_require_code_grant": False,
+            "owner": self.bot_user, "summary": "", "verify_key": "", "flags": 0, "team": None,
+        })
+
+    async def get_gateway(self, request):
+        return json_response({
+            "url": f"ws://127.0.0.1:{self.port}",
+            "shards": self.shard_count,
+            "session_start_limit": {"total": 1000, "remaining": 1000, "reset_after": 0, "max_concurrency": 16},
+        })
+
+    async def put_commands(self, request):
+        commands = await request.json()
+        for command in commands:
+            command.setdefault("id", self.snowflake())
+            command.setdefault("application_id", self.application_id)
+            command.setdefault("version", "1")
+            command.setdefault("default_member_permissions", None)
+            command.setdefault("dm_permission", True)
+            command.setdefault("nsfw", False)
+        return json_response(commands)
+
+    async def post_message(self, request):
+        data = await request.json()
+        return json_response({
+            "id": self.snowflake(), "channel_id": request.match_info["channel_id"],
+            "author": self.bot_user, "content": data.get("content") or "",
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "edited_timestamp": None, "tts": False, "mention_everyone": False, "mentions": [],
+            "mention_roles": [], "attachments": [], "embeds": data.get("embeds") or [],
+            "pinned": False, "type": 0,
+        })
+
+    # No guild has any bans
+    async def get_bans(self, request):
+        return json_response([])
+
+    # One page of a guild's members; they are stored in ID order
+    async def get_members(self, request):
+        guild = self.guilds_by_id.get(request.match_info["guild_id"])
+        if guild is None:
+            return json_response({"message": "Unknown Guild", "code": 10004}, status=404)
+        limit = int(request.query.get("limit", 1))
+        after = int(request.query.get("after", 0))
+        members = [member for member in guild["members"] if int(member["user"]["id"]) > after]
+        return json_response(members[:limit])
+
+    # Writes succeed without a body; reads of anything not modelled are 404s
+    async def fallback(self, request):
+        if request.method == 'GET':
+            return json_response({"message": "Unknown", "code": 10000}, status=404)
+        return web.Response(status=204)
+
+    # --- Gateway ---
+
+    async def gateway(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        await self.send(ws, 10, {"heartbeat_interval": 41250})
+        async for message in ws:
+            if message.type != web.WSMsgType.TEXT:
+                continue
+            payload = json.loads(message.data)
+            op, data = payload["op"], payload.get("d")
+            if op == 1:
+                await self.send(ws, 11, None)
+            elif op == 2:
+                await self.identify(ws, data)
+            elif op == 6:
+                # No sessions to resume; make the client identify again
+                await self.send(ws, 9, False)
+            elif op == 8:
+                await self.send_member_chunks(ws, data)
+        return ws
+
+    async def send(self, ws, op, data, event=None):
+        payload = {"op": op, "d": data, "s": None, "t": event}
+        if op == 0:
+            payload["s"] = next(self.sequence)
+        await ws.send_str(json.dumps(payload))
+
+    async def identify(self, ws, data):
+        shard_id, shard_count = data.get("shard") or [0, 1]
+        large_threshold = data.get("large_threshold", 250)
+        guilds = [guild for guild in self.guilds if (int(guild["id"]) >> 22) % shard_count == shard_id]
+        await self.send(ws, 0, {
+            "v": 10, "user": self.bot_user, "guilds": [{"id": guild["id"], "unavailable": True} for guild in guilds],
+            "session_id": f"fake-{shard_id}", "resume_gateway_url": f"ws://127.0.0.1:{self.port}",
+            "shard": [shard_id, shard_count], "application": {"id": self.application_id, "flags": 0},
+            "private_channels": [], "relationships": [],
+        }, "READY")
+        for guild in guilds:
+            payload = dict(guild)
+            payload["large"] = guild["member_count"] > large_threshold
+            if payload["large"]:
+                payload["members"] = guild["members"][:1]
+            await self.send(ws, 0, payload, "GUILD_CREATE")
+
+    async def send_member_chunks(self, ws, data):
+        guild = self.guilds_by_id.get(str(data["guild_id"]))
+        if guild is None:
+            return
+        members = guild["members"]
+        if data.get("user_ids"):
+            wanted = {str(user_id) for user_id in data["user_ids"]}
+            members = [member for member in members if member["user"]["id"] in wanted]
+        elif data.get("query"):
+            members = [member for member in members if member["user"]["username"].startswith(data["query"])]
+        if data.get("limit"):
+            members = members[:data["limit"]]
+        chunks = [members[i:i + CHUNK_SIZE] for i in range(0, len(members), CHUNK_SIZE)] or [[]]
+        for index, chunk in enumerate(chunks):
+            await self.send(ws, 0, {
+                "guild_id": guild["id"], "members": chunk, "chunk_index": index,
+                "chunk_count": len(chunks), "nonce": data.get("nonce"), "not_found": [],
+            }, "GUILD_MEMBERS_CHUNK")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a fake Discord API and gateway locally.")
+    parser.add_argument('--guilds', type=int, default=50)
+    parser.add_argument('--members', type=int, default=1000, help="members per guild")
+    parser.add_argument('--shards', type=int, default=4, help="shard count reported by /gateway/bot")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    fake = FakeDiscord(args.guilds, args.members, args.shards, args.port, args.seed)
+    app = web.Application()
+    app.add_routes(fake.routes())
+    print(f"Fake Discord on http://127.0.0.1:{args.port}: {args.guilds} guilds of {args.members} members")
+    web.run_app(app, host='127.0.0.1', port=args.port, print=None)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,300 @@
+# In-memory stand-ins for the Discord models the cogs touch, so handlers
+# can be driven without a gateway connection. Only the attributes and
+# methods the bot uses are implemented. REST calls optionally sleep for
+# `rest_latency` seconds to mimic the network.
+import asyncio
+import itertools
+
+BASE_SNOWFLAKE = 100000000000000000
+
+_ids = itertools.count(1)
+
+
+def next_id():
+    return BASE_SNOWFLAKE + next(_ids) * 7919
+
+
+class FakeREST:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+
+    async def call(self):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        else:
+            await asyncio.sleep(0)
+
+
+class FakeRole:
+    def __init__(self, guild, name, position=1, role_id=None):
+        self.guild = guild
+        self.id = role_id or next_id()
+        self.name = name
+        self.position = position
+
+    @property
+    def mention(self):
+        return f"<@&{self.id}>"
+
+    # Like discord.py, this scans the guild's members
+    @property
+    def members(self):
+        return [member for member in self.guild.members if self.id in member.role_ids]
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __eq__(self, other):
+        return isinstance(other, FakeRole) and other.id == self.id
+
+
+class FakeMember:
+    def __init__(self, guild, name, member_id=None, bot=False):
+        self.guild = guild
+        self.id = member_id or next_id()
+        self.name = name
+        self.display_name = name
+        self.bot = bot
+        self.role_ids = set()
+        self.dms = 0
+
+    @property
+    def mention(self):
+        return f"<@{self.id}>"
+
+    @property
+    def roles(self):
+        return [self.guild.get_role(role_id) for role_id in self.role_ids]
+
+    @property
+    def top_role(self):
+        return max(self.roles, key=lambda role: role.position, default=self.guild.default_role)
+
+    def get_role(self, role_id):
+        return self.guild.get_role(role_id) if role_id in self.role_ids else None
+
+    async def add_roles(self, *roles, reason=None):
+        await self.guild.rest.call()
+        self.role_ids.update(role.id for role in roles)
+
+    async def remove_roles(self, *roles, reason=None):
+        await self.guild.rest.call()
+        self.role_ids.difference_update(role.id for role in roles)
+
+    async def send(self, content=None, **kwargs):
+        await self.guild.rest.call()
+        self.dms += 1
+
+    def __str__(self):
+        return self.name
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __eq__(self, other):
+        return isinstance(other, FakeMember) and other.id == self.id
+
+
+class FakeMessage:
+    def __init__(self, channel, author, content=""):
+        self.id = next_id()
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = content
+
+
+class FakeChannel:
+    def __init__(self, guild, name, category=None, topic=None, overwrites=None):
+        self.guild = guild
+        self.id = next_id()
+        self.name = name
+        self.category = category
+        self.topic = topic
+        self.overwrites = overwrites or {}
+        self.sent = 0
+
+    @property
+    def mention(self):
+        return f"<#{self.id}>"
+
+    async def send(self, content=None, **kwargs):
+        await self.guild.rest.call()
+        self.sent += 1
+        return FakeMessage(self, self.guild.me, content or "")
+
+    def __str__(self):
+        return self.name
+
+
+class FakeCategory(FakeChannel):
+    pass
+
+
+class FakeGuild:
+    def __init__(self, name="Benchmark Guild", rest_latency=0.0):
+        self.id = next_id()
+        self.name = name
+        self.rest = FakeREST(rest_latency)
+        self._roles = {}
+        self._members = {}
+        self._channels = {}
+        # Members only found through query_members, like members outside the gateway cache
+        self.uncached = {}
+        self.default_role = self.add_role("@everyone", position=0, role_id=self.id)
+        self.me = self.add_member("Bot", bot=True)
+        self.me.role_ids.add(self.add_role("Bot", position=100).id)
+
+    def add_role(self, name, position=1, role_id=None):
+        role = FakeRole(self, name, position, role_id)
+        self._roles[role.id] = role
+        return role
+
+    def add_member(self, name, member_id=None, bot=False, cached=True):
+        member = FakeMember(self, name, member_id, bot)
+        if cached:
+            self._members[member.id] = member
+        return member
+
+    def add_channel(self, name, category=None):
+        channel = FakeChannel(self, name, category)
+        self._channels[channel.id] = channel
+        return channel
+
+    @property
+    def roles(self):
+        return list(self._roles.values())
+
+    @property
+    def members(self):
+        return list(self._members.values())
+
+    @property
+    def channels(self):
+        return list(self._channels.values())
+
+    @property
+    def text_channels(self):
+        return [channel for channel in self._channels.values() if not isinstance(channel, FakeCategory)]
+
+    @property
+    def categories(self):
+        return [channel for channel in self._channels.values() if isinstance(channel, FakeCategory)]
+
+    def get_role(self, role_id):
+        return self._roles.get(role_id)
+
+    def get_member(self, member_id):
+        return self._members.get(member_id)
+
+    def get_channel(self, channel_id):
+        return self._channels.get(channel_id)
+
+    async def create_category(self, name, **kwargs):
+        await self.rest.call()
+        category = FakeCategory(self, name)
+        self._channels[category.id] = category
+        return category
+
+    async def create_text_channel(self, name, overwrites=None, category=None, topic=None, **kwargs):
+        await self.rest.call()
+        channel = FakeChannel(self, name, category, topic, overwrites)
+        self._channels[channel.id] = channel
+        return channel
+
+    # Whether every member is cached
+    @property
+    def chunked(self):
+        return not self.uncached
+
+    async def chunk(self, cache=True):
+        await self.rest.call()
+        members = self.members + list(self.uncached.values())
+        if cache:
+            self._members.update(self.uncached)
+            self.uncached.clear()
+        return members
+
+    async def query_members(self, user_ids=None, cache=True, **kwargs):
+        await self.rest.call()
+        found = [self.uncached[user_id] for user_id in user_ids if user_id in self.uncached]
+        if cache:
+            for member in found:
+                self._members[member.id] = self.uncached.pop(member.id)
+        return found
+
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self.interaction = interaction
+        self.done = False
+
+    def is_done(self):
+        return self.done
+
+    async def send_message(self, content=None, **kwargs):
+        await self.interaction.guild.rest.call()
+        self.done = True
+
+    async def defer(self, **kwargs):
+        await self.interaction.guild.rest.call()
+        self.done = True
+
+    async def edit_message(self, **kwargs):
+        await self.interaction.guild.rest.call()
+        self.done = True
+
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self.interaction = interaction
+
+    async def send(self, content=None, **kwargs):
+        await self.interaction.guild.rest.call()
+
+
+class FakeInteraction:
+    def __init__(self, client, guild, user, channel=None):
+        self.client = client
+        self.guild = guild
+        self.guild_id = guild.id
+        self.user = user
+        self.channel = channel
+        self.channel_id = channel.id if channel else None
+        self.command = None
+        self.extras = {}
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+
+
+# Enough of a Bot for cogs constructed outside a real bot
+class FakeClient:
+    def __init__(self, *guilds):
+        self.guilds = list(guilds)
+        self.cogs = {}
+        self.user = guilds[0].me if guilds else None
+
+    def add_cog(self, cog):
+        self.cogs[type(cog).__name__] = cog
+        return cog
+
+    def get_cog(self, name):
+        return self.cogs.get(name)
+
+    def get_guild(self, guild_id):
+        return next((guild for guild in self.guilds if guild.id == guild_id), None)
+
+    def get_channel(self, channel_id):
+        for guild in self.guilds:
+            channel = guild.get_channel(channel_id)
+            if channel is not None:
+                return channel
+        return None
+
+    def is_ready(self):
+        return True
+
+    def dispatch(self, event, *args):
+        pass
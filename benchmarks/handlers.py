@@ -0,0 +1,322 @@
+# Offline benchmarks driving the real cogs against the in-memory fakes in
+# fakes.py: the XP message handler, ticket creation, the role audit,
+# /pick_role and /give. Reports throughput, p50/p99 latency and peak
+# memory per scenario and saves them as JSON for comparing commits.
+#
+# With --rate, events are dispatched as tasks at that many per second and
+# latency is measured from each event's scheduled arrival, so it includes
+# time spent waiting for the event loop. With --rate 0 events run one after
+# another and latency is pure handler time.
+#
+# Usage: python benchmarks/handlers.py [--members 100000] [--rate 1000]
+#            [--output results.json] [--compare previous.json]
+import argparse
+import asyncio
+import atexit
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from fakes import FakeClient, FakeGuild, FakeInteraction, FakeMessage
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(q * len(sorted_values)))
+    return sorted_values[index]
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+# Run handler(event) for every event and summarise the timings
+async def drive(name, events, handler, rate, trace_memory):
+    latencies = []
+
+    async def run_one(event, scheduled):
+        await handler(event)
+        latencies.append(time.perf_counter() - scheduled)
+
+    if trace_memory:
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    if rate:
+        tasks = []
+        for index, event in enumerate(events):
+            scheduled = start + index / rate
+            delay = scheduled - time.perf_counter()
+            if delay > 0.001:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(run_one(event, scheduled)))
+        await asyncio.gather(*tasks)
+    else:
+        for event in events:
+            await run_one(event, time.perf_counter())
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    result = {
+        "events": len(latencies),
+        "seconds": round(elapsed, 4),
+        "throughput_per_s": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    if trace_memory:
+        result["python_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024 ** 2, 2)
+    print(
+        f"{name:<24} {result['events']:>8} events {result['throughput_per_s'] or 0:>10.1f}/s "
+        f"p50 {result['p50_ms']:>8.3f} ms  p99 {result['p99_ms']:>8.3f} ms"
+    )
+    return result
+
+
+def build_guild(args, rng):
+    guild = FakeGuild(rest_latency=args.rest_latency_ms / 1000)
+    guild.verified_role = guild.add_role("Verified", position=2)
+    guild.unverified_role = guild.add_role("Unverified", position=2)
+    guild.verified_plus_role = guild.add_role("Verified+", position=3)
+    for i in range(args.members):
+        member = guild.add_member(f"member{i}")
+        member.role_ids.add(guild.verified_role.id if rng.random() < 0.9 else guild.unverified_role.id)
+    guild.channel_list = [guild.add_channel(f"general-{i}") for i in range(args.channels)]
+    return guild
+
+
+async def bench_on_message(args, rng, guild, client):
+    import non_mod
+    cog = non_mod.FunAndLevelCommands(client)
+    await cog.cog_load()
+    members = guild.members[1:]
+    events = [
+        FakeMessage(rng.choice(guild.channel_list), rng.choice(members), "hello")
+        for _ in range(args.messages)
+    ]
+    try:
+        return await drive("on_message", events, cog.on_message, args.rate, args.trace_memory)
+    finally:
+        await cog.cog_unload()
+
+
+async def bench_create_ticket(args, rng, guild, client):
+    import main
+    from entity_cache import EntityCache
+    guild.add_role("Moderator", position=5)
+    guild.add_role("Administrator", position=6)
+    client.add_cog(EntityCache(client))
+    client.add_cog(main.TicketSystem(client))
+    view = main.TicketButton()
+    members = rng.sample(guild.members[1:], min(args.tickets, len(guild.members) - 1))
+    events = [FakeInteraction(client, guild, member) for member in members]
+
+    async def handler(interaction):
+        await main.TicketButton.create_ticket(view, interaction, None)
+
+    return await drive("create_ticket", events, handler, args.rate, args.trace_memory)
+
+
+async def bench_role_audit(args, rng, guild, client):
+    import main
+    main.bot = client
+    members = guild.members[1:]
+
+    # Each audit follows a burst of drift: some members end up with both or neither role
+    async def handler(_):
+        for member in rng.sample(members, max(1, len(members) // 100)):
+            if rng.random() < 0.5:
+                member.role_ids.update((guild.verified_role.id, guild.unverified_role.id))
+            else:
+                member.role_ids.difference_update((guild.verified_role.id, guild.unverified_role.id))
+        await main.role_consistency_check()
+        while main.pending_role_checks:
+            await main.reconcile_member_roles()
+
+    return await drive("role_consistency_check", range(args.audits), handler, 0, args.trace_memory)
+
+
+async def bench_pick_role(args, rng, guild, client):
+    import role_selection
+    cog = role_selection.RoleSelection(client)
+    cog.questions[guild.id] = [
+        {
+            "question": f"Question {i}",
+            "roles": [{"id": role.id, "name": role.name} for role in (guild.add_role(f"q{i}a"), guild.add_role(f"q{i}b"))]
+        }
+        for i in range(args.questions)
+    ]
+    client.add_cog(cog)
+    members = guild.members[1:]
+    events = [FakeInteraction(client, guild, rng.choice(members)) for _ in range(args.pick_roles)]
+
+    async def handler(interaction):
+        await role_selection.RoleSelection.pick_role.callback(cog, interaction)
+
+    return await drive("pick_role", events, handler, args.rate, args.trace_memory)
+
+
+async def bench_give_role(args, rng, guild, client):
+    import mod_commands
+    cog = mod_commands.ModeratorCommands(client)
+    # Members the /give commands name that are not in the gateway cache
+    for i in range(args.give_users * args.gives):
+        member = guild.add_member(f"uncached{i}", cached=False)
+        guild.uncached[member.id] = member
+    cached = guild.members[1:]
+    uncached = list(guild.uncached.values())
+
+    events = []
+    for i in range(args.gives):
+        role = guild.add_role(f"give{i}", position=4)
+        targets = [
+            rng.choice(cached) if rng.random() < args.give_cached else uncached.pop()
+            for _ in range(args.give_users)
+        ]
+        interaction = FakeInteraction(client, guild, guild.me)
+        events.append((interaction, role, " ".join(member.mention for member in targets)))
+
+    async def handler(event):
+        interaction, role, users = event
+        await mod_commands.ModeratorCommands.give_role.callback(cog, interaction, role, users)
+
+    try:
+        return await drive("give_role", events, handler, 0, args.trace_memory)
+    finally:
+        await cog.case_store.close()
+
+
+async def configure(client, guild):
+    from guild_settings import GuildSettings
+    settings = client.add_cog(GuildSettings(client))
+    await settings.update(
+        guild.id,
+        verified_role_id=guild.verified_role.id,
+        unverified_role_id=guild.unverified_role.id,
+        verified_plus_role_id=guild.verified_plus_role.id,
+        mod_role_name="Moderator",
+        admin_role_name="Administrator"
+    )
+
+
+SCENARIOS = {
+    "on_message": bench_on_message,
+    "create_ticket": bench_create_ticket,
+    "role_consistency_check": bench_role_audit,
+    "pick_role": bench_pick_role,
+    "give_role": bench_give_role,
+}
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, previous_path):
+    with open(previous_path, 'r') as f:
+        previous = json.load(f)
+    print(f"\nCompared with {previous_path} ({previous.get('commit') or 'unknown commit'}):")
+    for name, result in results["scenarios"].items():
+        before = previous.get("scenarios", {}).get(name)
+        if not before:
+            continue
+        changes = []
+        for key in ("throughput_per_s", "p50_ms", "p99_ms"):
+            if before.get(key) and result.get(key) is not None:
+                changes.append(f"{key} {(result[key] - before[key]) / before[key]:+.1%}")
+        print(f"  {name:<24} {', '.join(changes)}")
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    results = {
+        "commit": git_commit(),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "scenarios": {},
+    }
+    for name in args.scenarios:
+        # A fresh guild per scenario so they don't affect each other
+        guild = build_guild(args, rng)
+        client = FakeClient(guild)
+        await configure(client, guild)
+        results["scenarios"][name] = await SCENARIOS[name](args, rng, guild, client)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the bot's handlers against fake Discord models.")
+    parser.add_argument('--members', type=int, default=100000, help="members in the fake guild")
+    parser.add_argument('--channels', type=int, default=20, help="text channels messages are spread over")
+    parser.add_argument('--messages', type=int, default=20000, help="messages sent to on_message")
+    parser.add_argument('--rate', type=float, default=1000, help="events per second (0 runs them back to back)")
+    parser.add_argument('--tickets', type=int, default=1000, help="tickets created")
+    parser.add_argument('--audits', type=int, default=5, help="role audits run")
+    parser.add_argument('--questions', type=int, default=10, help="role questions set up for /pick_role")
+    parser.add_argument('--pick-roles', type=int, default=2000, help="/pick_role invocations")
+    parser.add_argument('--gives', type=int, default=20, help="/give invocations")
+    parser.add_argument('--give-users', type=int, default=200, help="users named per /give")
+    parser.add_argument('--give-cached', type=float, default=0.9, help="share of /give users in the member cache")
+    parser.add_argument('--rest-latency-ms', type=float, default=0, help="simulated latency of each REST call")
+    parser.add_argument('--trace-memory', action='store_true', help="also report Python heap peaks (slower)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--output', default='benchmark_results.json', help="where to save the JSON results")
+    parser.add_argument('--compare', help="earlier results file to compare against")
+    args = parser.parse_args()
+    output = os.path.abspath(args.output)
+    compare_path = os.path.abspath(args.compare) if args.compare else None
+
+    if args.trace_memory:
+        tracemalloc.start()
+
+    # The cogs keep their data files in the working directory
+    with tempfile.TemporaryDirectory(prefix='bot-bench-') as workdir:
+        os.chdir(workdir)
+        from bot_logging import setup_logging
+        listener = setup_logging(os.path.join(workdir, 'bot.log'), console=False)
+        try:
+            results = asyncio.run(run(args))
+        finally:
+            # Stop now so the log file is closed before the directory is removed
+            atexit.unregister(listener.stop)
+            listener.stop()
+        os.chdir(REPO_ROOT)
+
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {output}")
+    if compare_path:
+        compare(results, compare_path)
+
+
+if __name__ == '__main__':
+    main()
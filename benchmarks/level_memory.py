@@ -0,0 +1,73 @@
+# Memory report for the in-memory level layout.
+# Compares the original layout (string snowflake -> dict of three fields)
+# with the LevelRecord layout (int snowflake -> __slots__ record without
+# the cooldown timestamp) for a number of synthetic users.
+#
+# Usage: python benchmarks/level_memory.py [users]
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from level_storage import LevelRecord
+
+BASE_SNOWFLAKE = 100000000000000000
+
+
+def synthetic_users(count, seed=0):
+    rng = random.Random(seed)
+    now = time.time()
+    for i in range(count):
+        yield (
+            BASE_SNOWFLAKE + i * 7919,
+            rng.randrange(0, 5000),
+            rng.randrange(1, 30),
+            now - rng.randrange(0, 86400 * 30)
+        )
+
+
+def build_dict_layout(count):
+    return {
+        str(user_id): {'xp': xp, 'level': level, 'last_message_time': last_message_time}
+        for user_id, xp, level, last_message_time in synthetic_users(count)
+    }
+
+
+def build_record_layout(count):
+    return {
+        user_id: LevelRecord(xp, level)
+        for user_id, xp, level, _ in synthetic_users(count)
+    }
+
+
+# Return the number of bytes still allocated by the structure build() returns
+def measure(build, count):
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    data = build(count)
+    allocated = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    del data
+    return allocated
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    print(f"Level storage memory report for {count:,} synthetic users")
+    results = [
+        ("dict records, str keys", measure(build_dict_layout, count)),
+        ("LevelRecord, int keys", measure(build_record_layout, count)),
+    ]
+    original = results[0][1]
+    for name, allocated in results:
+        print(
+            f"{name:<24} {allocated / 1024 ** 2:>9.1f} MiB "
+            f"{allocated / count:>7.1f} B/user {allocated / original:>6.1%}"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+# Consistency check for levels shared between clusters (SqliteLevelStore
+# with merge, see level_storage.py). Two stores stand in for two cluster
+# processes on one database. XP is earned while a slow flush is in flight,
+# both from the flushing store and from the other one, and the total saved
+# XP is compared with the total earned. Exits with an error if any XP was
+# lost or counted twice.
+#
+# Usage: python benchmarks/shared_levels.py [--rounds 20] [--delay 0.05]
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from level_math import levels_for, totals_for
+from level_storage import LevelRecord, SqliteLevelStore
+
+XP_CURVE = 50
+USER_ID = 1
+
+
+# Same arithmetic as LevelSystem.merge_level_rows in non_mod.py
+def merge_rows(read_row, own_row, current_row):
+    rows = (read_row, own_row, current_row)
+    read_total, own_total, current_total = totals_for([level for _, level in rows], [xp for xp, _ in rows], XP_CURVE)
+    levels, xps = levels_for([max(0, current_total + own_total - read_total)], XP_CURVE)
+    return xps[0], levels[0]
+
+
+# Earn XP the way on_message does: read the record, change it, store it
+def earn(store, amount):
+    data = store.get(USER_ID) or LevelRecord()
+    totals = totals_for([data.level], [data.xp], XP_CURVE)
+    levels, xps = levels_for([totals[0] + amount], XP_CURVE)
+    data.level, data.xp = levels[0], xps[0]
+    store.update(USER_ID, data)
+
+
+# Make a store's database writes take delay seconds, like a busy disk
+def slow_down(store, delay):
+    write_shared_rows = store.write_shared_rows
+
+    def slow_write(rows, read_rows):
+        time.sleep(delay)
+        return write_shared_rows(rows, read_rows)
+    store.write_shared_rows = slow_write
+
+
+def saved_total(path):
+    store = SqliteLevelStore(path, merge=merge_rows)
+    data = store.get(USER_ID) or LevelRecord()
+    store.reader.close()
+    store.writer.close()
+    return totals_for([data.level], [data.xp], XP_CURVE)[0]
+
+
+async def run(rounds, delay, path):
+    first = SqliteLevelStore(path, merge=merge_rows)
+    second = SqliteLevelStore(path, merge=merge_rows)
+    slow_down(first, delay)
+    earned = 0
+    for _ in range(rounds):
+        earn(first, 10)
+        earned += 10
+        flush = asyncio.create_task(first.flush())
+        # Let the flush reach its worker thread before earning more
+        await asyncio.sleep(delay / 2)
+        earn(first, 10)
+        earn(second, 7)
+        await second.flush()
+        earned += 17
+        await flush
+    await first.close()
+    await second.close()
+    return earned
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that clusters sharing the levels database lose no XP.")
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--delay', type=float, default=0.05, help="seconds each flush of the first store takes")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'levels.db')
+        earned = asyncio.run(run(args.rounds, args.delay, path))
+        saved = saved_total(path)
+    print(f"earned {earned} XP, saved {saved} XP")
+    if saved != earned:
+        sys.exit(f"{earned - saved} XP earned during flushes was lost" if saved < earned else "XP was counted twice")
+
+
+if __name__ == '__main__':
+    main()
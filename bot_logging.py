@@ -0,0 +1,66 @@
+import atexit
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+
+# Extra fields copied into each JSON record when a log call passes them,
+# e.g. logging.info("...", extra={"guild_id": guild.id, "user_id": user.id})
+STRUCTURED_FIELDS = ('guild_id', 'user_id', 'channel_id', 'command', 'latency_ms')
+
+
+# Formats records as one JSON object per line
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            "time": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                data[field] = value
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
+# Enqueues a copy of each record with its message already merged. Unlike
+# the standard QueueHandler it keeps exc_info, so tracebacks are formatted
+# on the listener thread rather than by the caller.
+class QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+# Route all logging through a queue so the event loop only enqueues records.
+# A listener thread formats them and writes the rotating JSON log file
+# (and a plain console copy). Returns the listener, stopped at exit.
+def setup_logging(path, level=logging.INFO, max_bytes=10_000_000, backup_count=5, console=True):
+    file_handler = logging.handlers.RotatingFileHandler(
+        path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+    )
+    file_handler.setFormatter(JsonFormatter())
+    handlers = [file_handler]
+    if console:
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setFormatter(logging.Formatter('%(asctime)s:%(levelname)s:%(name)s:%(message)s'))
+        handlers.append(console_handler)
+
+    records = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    root = logging.getLogger()
+    root.handlers.clear()
+    root.addHandler(QueueHandler(records))
+    root.setLevel(level)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
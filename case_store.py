@@ -0,0 +1,102 @@
+import asyncio
+import sqlite3
+import time
+
+
+# One moderation action against a user
+class Case:
+    __slots__ = ('case_id', 'guild_id', 'user_id', 'moderator_id', 'action', 'reason', 'created_at')
+
+    def __init__(self, case_id, guild_id, user_id, moderator_id, action, reason, created_at):
+        self.case_id = case_id
+        self.guild_id = guild_id
+        self.user_id = user_id
+        self.moderator_id = moderator_id
+        self.action = action
+        self.reason = reason
+        self.created_at = created_at
+
+
+# Append-only log of moderation cases in SQLite.
+# Cases are only ever inserted, each in its own committed transaction, so a
+# crash loses at most the case being written. Nothing is loaded at startup:
+# a member's history is read through the (guild, user) index, costing time
+# proportional to the cases returned rather than to the size of the log.
+# The write-ahead log is the "segment" new cases land in; compact() folds it
+# back into the main database file and truncates it.
+class CaseStore:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS cases (
+            case_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            guild_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            moderator_id INTEGER NOT NULL,
+            action TEXT NOT NULL,
+            reason TEXT,
+            created_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS cases_member ON cases (guild_id, user_id, case_id);
+    """
+    COLUMNS = 'case_id, guild_id, user_id, moderator_id, action, reason, created_at'
+
+    def __init__(self, path):
+        self.path = path
+        # Inserts run in worker threads on their own connection; reads stay on the loop
+        self.writer = self.connect(check_same_thread=False)
+        self.writer.executescript(self.SCHEMA)
+        self.reader = self.connect()
+        self.write_lock = asyncio.Lock()
+
+    def connect(self, **kwargs):
+        connection = sqlite3.connect(self.path, **kwargs)
+        connection.execute('PRAGMA journal_mode=WAL')
+        # Cases are rare and must survive a power loss, so sync every commit
+        connection.execute('PRAGMA synchronous=FULL')
+        return connection
+
+    # Record a case and return its number
+    async def add(self, guild_id, user_id, moderator_id, action, reason=None):
+        row = (guild_id, user_id, moderator_id, action, reason, time.time())
+        async with self.write_lock:
+            return await asyncio.to_thread(self.insert, row)
+
+    def insert(self, row):
+        with self.writer:
+            cursor = self.writer.execute(
+                'INSERT INTO cases (guild_id, user_id, moderator_id, action, reason, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                row
+            )
+        return cursor.lastrowid
+
+    # A member's cases, newest first, optionally of one action only
+    def history(self, guild_id, user_id, action=None, limit=10, offset=0):
+        query = f'SELECT {self.COLUMNS} FROM cases WHERE guild_id = ? AND user_id = ?'
+        params = [guild_id, user_id]
+        if action is not None:
+            query += ' AND action = ?'
+            params.append(action)
+        query += ' ORDER BY case_id DESC LIMIT ? OFFSET ?'
+        params += [limit, offset]
+        return [Case(*row) for row in self.reader.execute(query, params)]
+
+    def count(self, guild_id, user_id, action=None):
+        query = 'SELECT COUNT(*) FROM cases WHERE guild_id = ? AND user_id = ?'
+        params = [guild_id, user_id]
+        if action is not None:
+            query += ' AND action = ?'
+            params.append(action)
+        return self.reader.execute(query, params).fetchone()[0]
+
+    # Fold the write-ahead log into the database file and truncate it
+    async def compact(self):
+        async with self.write_lock:
+            await asyncio.to_thread(self.checkpoint)
+
+    def checkpoint(self):
+        self.writer.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    async def close(self):
+        await self.compact()
+        self.reader.close()
+        self.writer.close()
@@ -0,0 +1,217 @@
+import asyncio
+import itertools
+import json
+import logging
+import math
+import os
+import time
+import discord
+from discord.ext import commands, tasks
+from discord import app_commands
+from metrics import metrics
+
+# --- Configuration Values ---
+CLUSTER_REPORT_INTERVAL = 15  # Seconds between stats reports to the coordinator
+CLUSTER_REQUEST_TIMEOUT = 5  # Seconds to wait for the coordinator to answer
+
+# --- End of Configuration Values ---
+
+def env_int(name):
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+
+# Set by cluster_launcher.py for each cluster process. Without them the bot
+# runs as a single process and none of this applies.
+CLUSTER_ID = env_int('BOT_CLUSTER_ID')
+SHARD_COUNT = env_int('BOT_SHARD_COUNT')
+SHARD_IDS = [int(shard_id) for shard_id in os.environ['BOT_SHARD_IDS'].split(',')] if os.environ.get('BOT_SHARD_IDS') else None
+COORDINATOR_ADDRESS = os.environ.get('BOT_COORDINATOR')  # "host:port"
+
+
+# Path of a file that belongs to this process alone, such as its log or
+# metrics file. Persisted bot state is shared by all clusters instead (see
+# state_files.py), so it survives guilds moving to another cluster.
+# "bot.log" becomes "bot.cluster2.log" in cluster 2.
+def cluster_path(path):
+    if CLUSTER_ID is None:
+        return path
+    root, extension = os.path.splitext(path)
+    return f"{root}.cluster{CLUSTER_ID}{extension}"
+
+
+# Whether a guild is on one of this process's shards (Discord's sharding formula)
+def owns_guild(guild_id):
+    return SHARD_IDS is None or (guild_id >> 22) % SHARD_COUNT in SHARD_IDS
+
+
+# Whether this process should do work that must happen once per
+# application rather than once per cluster, such as syncing slash commands
+def is_primary():
+    return CLUSTER_ID is None or CLUSTER_ID == 0
+
+
+# Point discord.py at another API and gateway, e.g. a local fake gateway
+# (benchmarks/fake_gateway.py), when DISCORD_API_BASE is set
+def apply_api_override():
+    base = os.environ.get('DISCORD_API_BASE')
+    if not base:
+        return
+    import yarl
+    from discord.gateway import DiscordWebSocket
+    discord.http.Route.BASE = f"{base.rstrip('/')}/api/v10"
+    if hasattr(DiscordWebSocket, 'DEFAULT_GATEWAY'):
+        DiscordWebSocket.DEFAULT_GATEWAY = yarl.URL(base.replace('http', 'ws', 1))
+    logging.warning(f"Using the Discord API at {base}")
+
+
+# Line-delimited JSON connection to the coordinator run by cluster_launcher.py.
+# Stats are pushed periodically; requests carry a nonce matched to the reply.
+class CoordinatorClient:
+    def __init__(self, address):
+        host, port = address.rsplit(':', 1)
+        self.host = host
+        self.port = int(port)
+        self.reader = None
+        self.writer = None
+        self.pending = {}
+        self.nonces = itertools.count()
+        self.read_task = None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.read_task = asyncio.create_task(self.read_replies())
+
+    @property
+    def connected(self):
+        return self.writer is not None and not self.writer.is_closing()
+
+    async def send(self, message):
+        if not self.connected:
+            await self.connect()
+        self.writer.write(json.dumps(message).encode() + b'\n')
+        await self.writer.drain()
+
+    async def request(self, op, **fields):
+        nonce = next(self.nonces)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[nonce] = future
+        try:
+            await self.send({"op": op, "nonce": nonce, **fields})
+            return await asyncio.wait_for(future, CLUSTER_REQUEST_TIMEOUT)
+        finally:
+            self.pending.pop(nonce, None)
+
+    async def read_replies(self):
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                reply = json.loads(line)
+                future = self.pending.get(reply.get("nonce"))
+                if future is not None and not future.done():
+                    future.set_result(reply)
+        finally:
+            self.writer.close()
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Coordinator connection closed."))
+
+    async def close(self):
+        if self.read_task is not None:
+            self.read_task.cancel()
+        if self.writer is not None:
+            self.writer.close()
+
+
+# Reports this cluster's stats to the coordinator and serves /cluster_stats.
+# Does nothing when the bot is not run by cluster_launcher.py.
+class ClusterLink(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        self.client = CoordinatorClient(COORDINATOR_ADDRESS) if COORDINATOR_ADDRESS else None
+
+    async def cog_load(self):
+        if self.client is not None:
+            self.report_stats.start()
+
+    async def cog_unload(self):
+        if self.client is not None:
+            self.report_stats.cancel()
+            await self.client.close()
+
+    def local_stats(self):
+        return {
+            "shards": sorted(self.bot.shards) if hasattr(self.bot, 'shards') else [0],
+            "guilds": len(self.bot.guilds),
+            "members": sum(guild.member_count or 0 for guild in self.bot.guilds),
+            "cached_members": sum(len(guild.members) for guild in self.bot.guilds),
+            "latency_ms": round(self.bot.latency * 1000, 1) if math.isfinite(self.bot.latency) else None,
+            "handler_calls": sum(stats.calls for stats in metrics.handlers.values()),
+            "handler_errors": sum(stats.errors for stats in metrics.handlers.values()),
+            "rate_limit_waits": metrics.rate_limit_waits,
+            "reported_at": time.time(),
+        }
+
+    # Reserve count ticket numbers from the counter file at path, which the
+    # coordinator owns; returns the highest reserved number
+    async def reserve_tickets(self, path, count):
+        reply = await self.client.request("reserve_tickets", path=path, count=count)
+        if reply.get("op") == "error":
+            raise RuntimeError(reply["error"])
+        return reply["ceiling"]
+
+    @tasks.loop(seconds=CLUSTER_REPORT_INTERVAL)
+    async def report_stats(self):
+        try:
+            await self.client.send({"op": "report", "cluster": CLUSTER_ID, "stats": self.local_stats()})
+        except OSError as e:
+            logging.warning(f"Failed to report to the cluster coordinator: {e}")
+
+    @report_stats.before_loop
+    async def before_report_stats(self):
+        await self.bot.wait_until_ready()
+
+    # Cluster Stats Command
+    @app_commands.command(
+        name="cluster_stats",
+        description="Show guild, member and latency totals across all bot processes."
+    )
+    @app_commands.checks.has_permissions(manage_messages=True)
+    async def cluster_stats(self, interaction: discord.Interaction):
+        if self.client is None:
+            clusters = {"0": self.local_stats()}
+        else:
+            try:
+                reply = await self.client.request("global_stats")
+                clusters = reply["clusters"]
+            except (OSError, ConnectionError, asyncio.TimeoutError) as e:
+                await interaction.response.send_message(
+                    f"The cluster coordinator did not answer: {e}", ephemeral=True
+                )
+                return
+
+        embed = discord.Embed(title="Cluster Statistics", color=discord.Color.blue())
+        embed.description = (
+            f"{len(clusters)} clusters, "
+            f"{sum(stats['guilds'] for stats in clusters.values())} guilds, "
+            f"{sum(stats['members'] for stats in clusters.values())} members"
+        )
+        for cluster_id, stats in sorted(clusters.items(), key=lambda item: int(item[0])):
+            age = int(time.time() - stats["reported_at"])
+            embed.add_field(
+                name=f"Cluster {cluster_id} (shards {', '.join(map(str, stats['shards']))})",
+                value=(
+                    f"{stats['guilds']} guilds, {stats['members']} members "
+                    f"({stats['cached_members']} cached)\n"
+                    f"Latency {stats['latency_ms']} ms, {stats['handler_errors']} errors, "
+                    f"reported {age}s ago"
+                ),
+                inline=False
+            )
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+
+async def setup(bot):
+    await bot.add_cog(ClusterLink(bot))
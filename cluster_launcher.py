@@ -0,0 +1,190 @@
+# Runs the bot as several processes ("clusters"), each an AutoShardedBot for
+# a contiguous slice of the shards, plus a coordinator on localhost that the
+# clusters report their stats to for /cluster_stats and reserve ticket
+# numbers from. All clusters share the bot's state files (see
+# state_files.py), and a crashed cluster is restarted with backoff.
+#
+# Usage: python cluster_launcher.py --clusters 4 [--shards 16]
+#            [--api http://127.0.0.1:8765]  (e.g. benchmarks/fake_gateway.py)
+import argparse
+import asyncio
+import json
+import logging
+import os
+import signal
+import sys
+import time
+from ticket_counter import TicketCounter
+
+# --- Configuration Values ---
+COORDINATOR_HOST = "127.0.0.1"
+COORDINATOR_PORT = 8790  # Port the coordinator listens on
+RESTART_DELAY = 5  # Seconds before restarting a cluster that exited; doubles on repeated crashes
+MAX_RESTART_DELAY = 300  # Longest wait between restarts
+STABLE_RUNTIME = 600  # Seconds a cluster must run for its restart delay to reset
+
+# --- End of Configuration Values ---
+
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+
+
+# Keeps the latest stats each cluster reported and answers queries over them,
+# and hands out blocks of ticket numbers so they stay unique across clusters.
+# Speaks line-delimited JSON; see CoordinatorClient in cluster.py.
+class Coordinator:
+    def __init__(self):
+        self.stats = {}
+        self.ticket_counters = {}
+        self.server = None
+
+    async def start(self, host, port):
+        self.server = await asyncio.start_server(self.handle, host, port)
+        logging.info(f"Coordinator listening on {host}:{port}")
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                reply = await self.dispatch(message)
+                if reply is not None:
+                    reply["nonce"] = message.get("nonce")
+                    writer.write(json.dumps(reply).encode() + b'\n')
+                    await writer.drain()
+        except (ConnectionError, json.JSONDecodeError) as e:
+            logging.warning(f"Dropped a cluster connection: {e}")
+        finally:
+            writer.close()
+
+    async def dispatch(self, message):
+        op = message.get("op")
+        if op == "report":
+            self.stats[str(message["cluster"])] = message["stats"]
+            return None
+        if op == "global_stats":
+            return {"op": "global_stats", "clusters": self.stats}
+        if op == "reserve_tickets":
+            path = message["path"]
+            counter = self.ticket_counters.get(path)
+            if counter is None:
+                counter = TicketCounter(path)
+                self.ticket_counters[path] = counter
+            try:
+                ceiling = await counter.reserve_block(message["count"])
+            except OSError as e:
+                return {"op": "error", "error": f"Could not reserve ticket numbers: {e}"}
+            return {"op": "reserve_tickets", "ceiling": ceiling}
+        return {"op": "error", "error": f"Unknown op {op!r}"}
+
+
+# Split shard IDs into contiguous, nearly equal slices
+def split_shards(shard_count, cluster_count):
+    cluster_count = min(cluster_count, shard_count)
+    per_cluster, extra = divmod(shard_count, cluster_count)
+    slices = []
+    start = 0
+    for cluster_id in range(cluster_count):
+        size = per_cluster + (1 if cluster_id < extra else 0)
+        slices.append(list(range(start, start + size)))
+        start += size
+    return slices
+
+
+# Shard count Discord recommends for the bot
+async def recommended_shards(token, api_base):
+    import aiohttp
+    url = f"{api_base.rstrip('/')}/api/v10/gateway/bot"
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url, headers={"Authorization": f"Bot {token}"}) as response:
+            response.raise_for_status()
+            return (await response.json())["shards"]
+
+
+async def run_cluster(cluster_id, shard_ids, shard_count, base_env, processes, stopping):
+    env = dict(base_env)
+    env.update({
+        "BOT_CLUSTER_ID": str(cluster_id),
+        "BOT_SHARD_IDS": ",".join(map(str, shard_ids)),
+        "BOT_SHARD_COUNT": str(shard_count),
+        "BOT_COORDINATOR": f"{COORDINATOR_HOST}:{COORDINATOR_PORT}",
+    })
+    delay = RESTART_DELAY
+    while not stopping.is_set():
+        started = time.monotonic()
+        process = await asyncio.create_subprocess_exec(sys.executable, MAIN_SCRIPT, env=env)
+        processes[cluster_id] = process
+        logging.info(f"Cluster {cluster_id} started (pid {process.pid}, shards {shard_ids})")
+        code = await process.wait()
+        if stopping.is_set():
+            return
+        if time.monotonic() - started >= STABLE_RUNTIME:
+            delay = RESTART_DELAY
+        logging.error(f"Cluster {cluster_id} exited with code {code}; restarting in {delay}s")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, MAX_RESTART_DELAY)
+
+
+async def launch(args):
+    api_base = args.api or os.environ.get('DISCORD_API_BASE') or "https://discord.com"
+    shard_count = args.shards
+    if shard_count is None:
+        from main import BOT_TOKEN
+        shard_count = await recommended_shards(BOT_TOKEN, api_base)
+        logging.info(f"Discord recommends {shard_count} shards")
+
+    base_env = dict(os.environ)
+    if args.api:
+        base_env["DISCORD_API_BASE"] = args.api
+
+    coordinator = Coordinator()
+    await coordinator.start(COORDINATOR_HOST, COORDINATOR_PORT)
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stopping.set)
+        except NotImplementedError:  # Windows
+            pass
+
+    processes = {}
+    runners = [
+        asyncio.create_task(run_cluster(cluster_id, shard_ids, shard_count, base_env, processes, stopping))
+        for cluster_id, shard_ids in enumerate(split_shards(shard_count, args.clusters))
+    ]
+    try:
+        await stopping.wait()
+    finally:
+        stopping.set()
+        logging.info("Stopping clusters")
+        for process in processes.values():
+            if process.returncode is None:
+                process.terminate()
+        await asyncio.gather(*(process.wait() for process in processes.values()))
+        for runner in runners:
+            runner.cancel()
+        await coordinator.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the bot as several sharded processes.")
+    parser.add_argument('--clusters', type=int, default=os.cpu_count() or 1, help="processes to run")
+    parser.add_argument('--shards', type=int, help="total shards (default: Discord's recommendation)")
+    parser.add_argument('--api', help="base URL of another Discord API, e.g. a local fake gateway")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s:%(levelname)s:%(name)s:%(message)s')
+    try:
+        asyncio.run(launch(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
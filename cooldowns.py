@@ -0,0 +1,99 @@
+import time
+from state_files import SharedFile
+
+
+# In-memory cooldowns that expire in bulk.
+# Keys are bucketed by the second their cooldown ends, so expiring is one
+# dict pop per elapsed second and the tracker only ever holds keys whose
+# cooldown is still running.
+class CooldownTracker:
+    def __init__(self):
+        self.expiries = {}
+        self.slots = {}
+        self.position = int(time.monotonic())
+
+    def __len__(self):
+        return len(self.expiries)
+
+    # Start a cooldown for key unless one is running. Returns False if the
+    # key is still cooling down.
+    def try_start(self, key, window, now=None):
+        if now is None:
+            now = time.monotonic()
+        self.expire(now)
+        expiry = self.expiries.get(key)
+        if expiry is not None and expiry > now:
+            return False
+        expiry = now + window
+        self.expiries[key] = expiry
+        self.slots.setdefault(int(expiry), set()).add(key)
+        return True
+
+    # Drop every cooldown that ended before now
+    def expire(self, now):
+        second = int(now)
+        if second <= self.position:
+            return
+        if second - self.position > len(self.slots):
+            elapsed = [slot for slot in self.slots if slot < second]
+        else:
+            elapsed = range(self.position, second)
+        for slot in elapsed:
+            keys = self.slots.pop(slot, None)
+            if keys is None:
+                continue
+            for key in keys:
+                # Keys restarted after expiring live in a later slot as well
+                if self.expiries.get(key, now) <= now:
+                    self.expiries.pop(key, None)
+        self.position = second
+
+
+# Cooldown windows in seconds with per-guild and per-channel overrides,
+# stored in a JSON file shared by all bot processes and edited through
+# /xp_cooldown. Call reload_if_changed() now and then to pick up changes
+# made by other processes.
+class CooldownSettings:
+    def __init__(self, path, default_window):
+        self.file = SharedFile(path, {})
+        self.default_window = default_window
+        self.guilds = {}
+        self.channels = {}
+        self.load()
+
+    # Updates the override dicts in place, so references to them stay valid
+    def load(self):
+        data = self.file.read()
+        self.guilds.clear()
+        self.guilds.update((int(guild_id), window) for guild_id, window in data.get("guilds", {}).items())
+        self.channels.clear()
+        self.channels.update((int(channel_id), window) for channel_id, window in data.get("channels", {}).items())
+
+    def reload_if_changed(self):
+        if self.file.changed():
+            self.load()
+
+    def save(self):
+        self.file.write({"guilds": self.guilds, "channels": self.channels})
+
+    # Window for a message: channel override, then its parent channel's
+    # (for threads), then the guild's, then the default
+    def window_for(self, guild_id, channel):
+        window = self.channels.get(channel.id)
+        if window is None:
+            parent_id = getattr(channel, "parent_id", None)
+            if parent_id is not None:
+                window = self.channels.get(parent_id)
+        if window is None:
+            window = self.guilds.get(guild_id, self.default_window)
+        return window
+
+    # Set or, with None, clear an override. The file is read again first so
+    # changes made by other processes are kept.
+    def set_window(self, overrides, key, window):
+        self.load()
+        if window is None:
+            overrides.pop(key, None)
+        else:
+            overrides[key] = window
+        self.save()
@@ -0,0 +1,82 @@
+import discord
+from discord.ext import commands
+
+
+# Per-guild cache resolving configured role, category and channel names to
+# IDs, so hot command paths don't scan guild.roles or guild.channels.
+# Results (including "not found") are cached per name and only the names
+# touched by a role or channel create, update or delete event are dropped.
+class EntityCache(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        self.roles = {}
+        self.categories = {}
+        self.channels = {}
+
+    def resolve(self, cache, guild, name, entities, lookup):
+        names = cache.setdefault(guild.id, {})
+        if name not in names:
+            entity = discord.utils.get(entities, name=name)
+            names[name] = entity.id if entity else None
+        entity_id = names[name]
+        return lookup(entity_id) if entity_id is not None else None
+
+    # Role with the given name, or None
+    def get_role(self, guild, name):
+        return self.resolve(self.roles, guild, name, guild.roles, guild.get_role)
+
+    # Category with the given name, or None
+    def get_category(self, guild, name):
+        return self.resolve(self.categories, guild, name, guild.categories, guild.get_channel)
+
+    # Text channel with the given name, or None
+    def get_channel(self, guild, name):
+        return self.resolve(self.channels, guild, name, guild.text_channels, guild.get_channel)
+
+    def invalidate(self, cache, guild_id, *names):
+        names_cache = cache.get(guild_id)
+        if names_cache:
+            for name in names:
+                names_cache.pop(name, None)
+
+    def invalidate_channel(self, channel, *names):
+        if isinstance(channel, discord.CategoryChannel):
+            self.invalidate(self.categories, channel.guild.id, *names)
+        elif isinstance(channel, discord.TextChannel):
+            self.invalidate(self.channels, channel.guild.id, *names)
+
+    @commands.Cog.listener()
+    async def on_guild_role_create(self, role):
+        self.invalidate(self.roles, role.guild.id, role.name)
+
+    @commands.Cog.listener()
+    async def on_guild_role_update(self, before, after):
+        # Position decides which of several same-named roles is returned
+        if before.name != after.name or before.position != after.position:
+            self.invalidate(self.roles, after.guild.id, before.name, after.name)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role):
+        self.invalidate(self.roles, role.guild.id, role.name)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_create(self, channel):
+        self.invalidate_channel(channel, channel.name)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_update(self, before, after):
+        if before.name != after.name or before.position != after.position:
+            self.invalidate_channel(after, before.name, after.name)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel):
+        self.invalidate_channel(channel, channel.name)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild):
+        for cache in (self.roles, self.categories, self.channels):
+            cache.pop(guild.id, None)
+
+
+async def setup(bot):
+    await bot.add_cog(EntityCache(bot))
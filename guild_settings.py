@@ -0,0 +1,252 @@
+import asyncio
+import collections
+import json
+import logging
+import discord
+from discord.ext import commands
+from discord import app_commands
+from cluster import owns_guild
+from state_files import GuildFiles
+
+# --- Configuration Values ---
+GUILD_SETTINGS_DIR = "guild_settings"  # Per-guild role and channel settings, edited with /settings, one file per guild
+DEFAULT_MOD_ROLE_NAME = "MODERATOR_ROLE_NAME"  # Moderator role name for guilds that have not set one
+DEFAULT_ADMIN_ROLE_NAME = "ADMINISTRATOR_ROLE_NAME"  # Administrator role name for guilds that have not set one
+
+# Upgrading a single-server deployment from before /settings: copy the old
+# constants here and they become that server's settings on the next start
+# (only if it has none yet). Leave LEGACY_GUILD_ID as None otherwise.
+LEGACY_GUILD_ID = None  # Old GUILD_ID (main.py)
+LEGACY_VERIFIED_ROLE_ID = None  # Old VERIFIED_ROLE_ID (main.py, non_mod.py)
+LEGACY_UNVERIFIED_ROLE_ID = None  # Old UNVERIFIED_ROLE_ID (main.py)
+LEGACY_VERIFIED_PLUS_ROLE_ID = None  # Old VERIFIED_PLUS_ROLE_ID (non_mod.py)
+LEGACY_MOD_ROLE_NAME = None  # Old MOD_ROLE_NAME (main.py)
+LEGACY_ADMIN_ROLE_NAME = None  # Old ADMIN_ROLE_NAME (main.py)
+LEGACY_TICKET_CHANNEL_ID = None  # Old TICKET_CHANNEL_ID (main.py)
+LEGACY_TICKET_BUTTON_MESSAGE_ID = None  # Old TICKET_BUTTON_MESSAGE_ID (main.py)
+LEGACY_MOD_CHANNEL_ID = None  # Old MOD_CHANNEL_ID (report.py)
+
+# --- End of Configuration Values ---
+
+SETTINGS = (
+    "verified_role_id",
+    "unverified_role_id",
+    "verified_plus_role_id",
+    "mod_role_name",
+    "admin_role_name",
+    "ticket_channel_id",
+    "ticket_button_message_id",
+    "mod_channel_id",
+)
+
+
+# Resolved settings of one guild: its overrides applied over the defaults.
+# Immutable; an update builds a new object and swaps it in, so a handler
+# holding one never sees a half-applied change.
+class GuildConfig(collections.namedtuple('GuildConfig', SETTINGS)):
+    __slots__ = ()
+
+
+DEFAULT_CONFIG = GuildConfig(
+    verified_role_id=None,
+    unverified_role_id=None,
+    verified_plus_role_id=None,
+    mod_role_name=DEFAULT_MOD_ROLE_NAME,
+    admin_role_name=DEFAULT_ADMIN_ROLE_NAME,
+    ticket_channel_id=None,
+    ticket_button_message_id=None,
+    mod_channel_id=None,
+)
+
+
+# Settings given by the LEGACY_ constants, without the unset ones
+LEGACY_SETTINGS = {
+    key: value for key, value in {
+        "verified_role_id": LEGACY_VERIFIED_ROLE_ID,
+        "unverified_role_id": LEGACY_UNVERIFIED_ROLE_ID,
+        "verified_plus_role_id": LEGACY_VERIFIED_PLUS_ROLE_ID,
+        "mod_role_name": LEGACY_MOD_ROLE_NAME,
+        "admin_role_name": LEGACY_ADMIN_ROLE_NAME,
+        "ticket_channel_id": LEGACY_TICKET_CHANNEL_ID,
+        "ticket_button_message_id": LEGACY_TICKET_BUTTON_MESSAGE_ID,
+        "mod_channel_id": LEGACY_MOD_CHANNEL_ID,
+    }.items() if value is not None
+}
+
+
+# Per-guild settings store. The files of the guilds on this process's
+# shards are read once at startup into one GuildConfig per guild, so get()
+# is a dict lookup; /settings updates the guild's entry in place, rewrites
+# its file, and dispatches on_guild_settings_update(guild_id, before, after)
+# for listeners that act on a change. Each guild's file holds the settings
+# it overrides:
+#   guild_settings/123456789012345678.json: {"verified_role_id": 234567890123456789, ...}
+class GuildSettings(commands.Cog):
+
+    settings = app_commands.Group(
+        name="settings", description="View or change this server's bot settings.", guild_only=True
+    )
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.files = GuildFiles(GUILD_SETTINGS_DIR)
+        self.save_lock = asyncio.Lock()
+        self.overrides = {}
+        self.configs = {}
+        self.load()
+
+    def load(self):
+        for guild_id, data in self.files.read_all().items():
+            values = json.loads(data)
+            unknown = set(values) - set(SETTINGS)
+            if unknown:
+                logging.warning(f"Ignoring unknown settings {sorted(unknown)} for guild {guild_id}.")
+            self.overrides[guild_id] = {key: value for key, value in values.items() if key in SETTINGS}
+        self.import_legacy_settings()
+        self.configs = {guild_id: DEFAULT_CONFIG._replace(**values) for guild_id, values in self.overrides.items()}
+        logging.info(f"Loaded settings for {len(self.configs)} guilds.")
+        if not self.configs:
+            logging.warning(
+                "No server has bot settings, so role verification, ticket buttons and reports are off "
+                "until a server admin runs /settings roles and /settings channels. If this bot was "
+                "set up with GUILD_ID, VERIFIED_ROLE_ID, TICKET_CHANNEL_ID and the other old "
+                "constants, copy their values to the LEGACY_ settings in guild_settings.py."
+            )
+
+    # Seed the settings of LEGACY_GUILD_ID from the LEGACY_ constants, unless
+    # it already has settings of its own
+    def import_legacy_settings(self):
+        if LEGACY_GUILD_ID is None or not owns_guild(LEGACY_GUILD_ID) or LEGACY_GUILD_ID in self.overrides:
+            return
+        if not LEGACY_SETTINGS:
+            logging.warning("LEGACY_GUILD_ID is set but no LEGACY_ settings are; nothing to import.")
+            return
+        self.overrides[LEGACY_GUILD_ID] = dict(LEGACY_SETTINGS)
+        self.write_file(LEGACY_GUILD_ID, dict(LEGACY_SETTINGS))
+        logging.info(f"Imported settings {sorted(LEGACY_SETTINGS)} for guild {LEGACY_GUILD_ID} from the LEGACY_ constants.")
+
+    # Settings of a guild, or the defaults if it has none
+    def get(self, guild_id):
+        return self.configs.get(guild_id, DEFAULT_CONFIG)
+
+    # Set settings of a guild; None resets a setting to its default.
+    # Returns the new config.
+    async def update(self, guild_id, **changes):
+        unknown = set(changes) - set(SETTINGS)
+        if unknown:
+            raise ValueError(f"Unknown settings: {sorted(unknown)}")
+        before = self.get(guild_id)
+        values = dict(self.overrides.get(guild_id, {}))
+        for key, value in changes.items():
+            if value is None:
+                values.pop(key, None)
+            else:
+                values[key] = value
+        after = DEFAULT_CONFIG._replace(**values)
+        self.overrides[guild_id] = values
+        self.configs[guild_id] = after
+        await self.save(guild_id)
+        self.bot.dispatch("guild_settings_update", guild_id, before, after)
+        return after
+
+    # Write a guild's settings atomically in a worker thread
+    async def save(self, guild_id):
+        async with self.save_lock:
+            await asyncio.to_thread(self.write_file, guild_id, dict(self.overrides.get(guild_id, {})))
+
+    # A guild left with no overrides has its file removed
+    def write_file(self, guild_id, values):
+        self.files.write(guild_id, json.dumps(values, indent=4) if values else None)
+
+    def describe(self, guild, config):
+        def role(role_id):
+            return f"<@&{role_id}>" if role_id else "Not set"
+
+        def channel(channel_id):
+            return f"<#{channel_id}>" if channel_id else "Not set"
+
+        embed = discord.Embed(title=f"Settings for {guild.name}", color=discord.Color.blue())
+        embed.add_field(name="Verified role", value=role(config.verified_role_id))
+        embed.add_field(name="Unverified role", value=role(config.unverified_role_id))
+        embed.add_field(name="Verified+ role", value=role(config.verified_plus_role_id))
+        embed.add_field(name="Moderator role", value=config.mod_role_name)
+        embed.add_field(name="Administrator role", value=config.admin_role_name)
+        embed.add_field(name="Ticket channel", value=channel(config.ticket_channel_id))
+        embed.add_field(name="Mod channel", value=channel(config.mod_channel_id))
+        return embed
+
+    @settings.command(name="show", description="Show this server's bot settings.")
+    @app_commands.checks.has_permissions(manage_guild=True)
+    async def settings_show(self, interaction: discord.Interaction):
+        embed = self.describe(interaction.guild, self.get(interaction.guild.id))
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @settings.command(name="roles", description="Set the verification and staff roles.")
+    @app_commands.describe(
+        verified="Role given to verified members",
+        unverified="Role given to new members until they are verified",
+        verified_plus="Role given at global level 10",
+        moderator="Role whose members can use staff commands and see tickets",
+        administrator="Role whose members can use staff commands and see tickets"
+    )
+    @app_commands.checks.has_permissions(manage_guild=True)
+    async def settings_roles(
+        self,
+        interaction: discord.Interaction,
+        verified: discord.Role = None,
+        unverified: discord.Role = None,
+        verified_plus: discord.Role = None,
+        moderator: discord.Role = None,
+        administrator: discord.Role = None
+    ):
+        changes = {}
+        if verified:
+            changes["verified_role_id"] = verified.id
+        if unverified:
+            changes["unverified_role_id"] = unverified.id
+        if verified_plus:
+            changes["verified_plus_role_id"] = verified_plus.id
+        if moderator:
+            changes["mod_role_name"] = moderator.name
+        if administrator:
+            changes["admin_role_name"] = administrator.name
+        await self.apply(interaction, changes)
+
+    @settings.command(name="channels", description="Set the ticket and mod channels.")
+    @app_commands.describe(
+        ticket="Channel where the Create Ticket button is posted",
+        mod="Channel where reports are sent"
+    )
+    @app_commands.checks.has_permissions(manage_guild=True)
+    async def settings_channels(
+        self,
+        interaction: discord.Interaction,
+        ticket: discord.TextChannel = None,
+        mod: discord.TextChannel = None
+    ):
+        changes = {}
+        if ticket:
+            # A new button is posted in the new channel
+            changes["ticket_channel_id"] = ticket.id
+            changes["ticket_button_message_id"] = None
+        if mod:
+            changes["mod_channel_id"] = mod.id
+        await self.apply(interaction, changes)
+
+    @settings.command(name="reset", description="Reset all of this server's bot settings to the defaults.")
+    @app_commands.checks.has_permissions(manage_guild=True)
+    async def settings_reset(self, interaction: discord.Interaction):
+        await self.apply(interaction, dict.fromkeys(SETTINGS))
+
+    async def apply(self, interaction, changes):
+        if not changes:
+            await interaction.response.send_message("Nothing to change.", ephemeral=True)
+            return
+        config = await self.update(interaction.guild.id, **changes)
+        await interaction.response.send_message(
+            "Settings updated.", embed=self.describe(interaction.guild, config), ephemeral=True
+        )
+
+
+async def setup(bot):
+    await bot.add_cog(GuildSettings(bot))
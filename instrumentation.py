@@ -0,0 +1,99 @@
+import asyncio
+import logging
+import time
+import discord
+from discord.ext import commands, tasks
+from discord import app_commands
+from atomic_file import atomic_write
+from cluster import CLUSTER_ID, cluster_path
+from metrics import RateLimitLogHandler, instrumented, metrics, record_command
+
+# --- Configuration Values ---
+METRICS_FILE = cluster_path("bot_metrics.prom")  # Prometheus text file for the node exporter's textfile collector
+METRICS_WRITE_INTERVAL = 15  # Seconds between writes of the metrics file
+LOOP_LAG_INTERVAL = 0.5  # Seconds between event loop lag samples
+STATS_TOP_HANDLERS = 10  # Handlers listed by /stats, slowest in total first
+
+# --- End of Configuration Values ---
+
+
+# Collects event loop lag and REST rate limit waits, finishes app command
+# timings, writes the metrics file and serves /stats
+class Instrumentation(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        self.rate_limit_handler = RateLimitLogHandler()
+        self.lag_task = None
+
+    async def cog_load(self):
+        if CLUSTER_ID is not None:
+            metrics.labels["cluster"] = CLUSTER_ID
+        logging.getLogger('discord.http').addHandler(self.rate_limit_handler)
+        self.lag_task = asyncio.create_task(self.sample_loop_lag())
+        self.write_metrics.start()
+
+    async def cog_unload(self):
+        logging.getLogger('discord.http').removeHandler(self.rate_limit_handler)
+        self.lag_task.cancel()
+        self.write_metrics.cancel()
+
+    # A task sleeping for a fixed time wakes up late by however long the
+    # loop was busy with other work
+    async def sample_loop_lag(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(LOOP_LAG_INTERVAL)
+            metrics.loop_lag.observe(max(0.0, time.perf_counter() - start - LOOP_LAG_INTERVAL))
+
+    @tasks.loop(seconds=METRICS_WRITE_INTERVAL)
+    @instrumented("task:write_metrics")
+    async def write_metrics(self):
+        await asyncio.to_thread(self.write_file, metrics.render_prometheus())
+
+    # Written atomically so the collector never reads a partial file
+    def write_file(self, data):
+        atomic_write(METRICS_FILE, data, permissions=0o644)
+
+    @commands.Cog.listener()
+    async def on_app_command_completion(self, interaction, command):
+        record_command(interaction)
+
+    # Stats Command
+    @app_commands.command(
+        name="stats",
+        description="Show handler latency, event loop lag and rate limit statistics."
+    )
+    @app_commands.checks.has_permissions(manage_messages=True)
+    async def stats(self, interaction: discord.Interaction):
+        embed = discord.Embed(title="Bot Statistics", color=discord.Color.blue())
+        uptime = int(time.time() - metrics.started)
+        embed.description = (
+            f"Uptime: {uptime // 3600}h {uptime % 3600 // 60}m\n"
+            f"Gateway latency: {self.bot.latency * 1000:.0f} ms\n"
+            f"Event loop lag: p50 {metrics.loop_lag.quantile(0.5) * 1000:.1f} ms, "
+            f"p99 {metrics.loop_lag.quantile(0.99) * 1000:.1f} ms, "
+            f"max {metrics.loop_lag.max * 1000:.1f} ms\n"
+            f"Rate limit waits: {metrics.rate_limit_waits} "
+            f"({metrics.rate_limit_wait_seconds:.1f} s total)"
+        )
+
+        slowest = sorted(
+            metrics.handlers.items(), key=lambda item: item[1].latency.total, reverse=True
+        )[:STATS_TOP_HANDLERS]
+        for name, handler in slowest:
+            latency = handler.latency
+            embed.add_field(
+                name=name,
+                value=(
+                    f"{handler.calls} calls, {handler.errors} errors\n"
+                    f"p50 {latency.quantile(0.5) * 1000:.1f} ms, "
+                    f"p95 {latency.quantile(0.95) * 1000:.1f} ms, "
+                    f"max {latency.max * 1000:.1f} ms"
+                ),
+                inline=False
+            )
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+
+async def setup(bot):
+    await bot.add_cog(Instrumentation(bot))
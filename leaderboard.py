@@ -0,0 +1,153 @@
+import time
+
+
+# Fenwick (binary indexed) tree of counts over the indexes 1..size, where
+# size is a power of two. Grows on demand so it can be keyed by unbounded levels and XP values.
+class CountTree:
+    def __init__(self, size=64):
+        self.tree = [0] * (size + 1)
+        self.total = 0
+
+    def add(self, index, delta):
+        if index >= len(self.tree):
+            self.grow(index)
+        self.total += delta
+        tree = self.tree
+        while index < len(tree):
+            tree[index] += delta
+            index += index & -index
+
+    # Number of counts at indexes 1..index
+    def prefix(self, index):
+        index = min(index, len(self.tree) - 1)
+        result = 0
+        tree = self.tree
+        while index > 0:
+            result += tree[index]
+            index -= index & -index
+        return result
+
+    # Smallest index whose prefix count is greater than k (k is zero-based)
+    def find(self, k):
+        tree = self.tree
+        position = 0
+        step = 1 << (len(tree) - 1).bit_length()
+        while step:
+            following = position + step
+            if following < len(tree) and tree[following] <= k:
+                position = following
+                k -= tree[following]
+            step >>= 1
+        return position + 1
+
+    # Double the size until index fits. Sizes are powers of two, so existing
+    # nodes keep their ranges and the only new nodes covering old indexes are
+    # the new powers of two, which cover all of them.
+    def grow(self, index):
+        old_size = len(self.tree) - 1
+        size = old_size
+        while size < index:
+            size *= 2
+        old_total = self.prefix(old_size)
+        self.tree.extend([0] * (size - old_size))
+        node = old_size * 2
+        while node <= size:
+            self.tree[node] = old_total
+            node *= 2
+
+
+# Order-statistics index over (level, xp), highest first.
+# Counts per level and per XP value within a level live in Fenwick trees, so
+# ranks and the user at any position are found in O(log n). Users with the
+# same level and XP share a bucket and a rank.
+class LeaderboardIndex:
+    def __init__(self, page_size=10, page_ttl=5):
+        self.level_counts = CountTree()
+        self.xp_counts = {}
+        self.buckets = {}
+        self.positions = {}
+        self.page_size = page_size
+        self.page_ttl = page_ttl
+        self.page_cache = {}
+
+    def __len__(self):
+        return len(self.positions)
+
+    # Build the index from (user_id, record) pairs
+    @classmethod
+    def from_records(cls, records, **kwargs):
+        index = cls(**kwargs)
+        for user_id, record in records:
+            index.update(user_id, record.level, record.xp)
+        return index
+
+    # Insert or move a user
+    def update(self, user_id, level, xp):
+        position = self.positions.get(user_id)
+        if position is not None:
+            if position[0] == level and position[1] == xp:
+                return
+            self.remove(user_id)
+        bucket = self.buckets.setdefault((level, xp), [])
+        self.positions[user_id] = (level, xp, len(bucket))
+        bucket.append(user_id)
+        self.level_counts.add(level, 1)
+        if level not in self.xp_counts:
+            self.xp_counts[level] = CountTree()
+        self.xp_counts[level].add(xp + 1, 1)
+
+    def remove(self, user_id):
+        level, xp, slot = self.positions.pop(user_id)
+        bucket = self.buckets[(level, xp)]
+        # Swap the last user into the freed slot so removal is O(1)
+        last = bucket.pop()
+        if last != user_id:
+            bucket[slot] = last
+            self.positions[last] = (level, xp, slot)
+        if not bucket:
+            del self.buckets[(level, xp)]
+        self.level_counts.add(level, -1)
+        self.xp_counts[level].add(xp + 1, -1)
+        if not self.xp_counts[level].total:
+            del self.xp_counts[level]
+
+    # 1-based rank of a user, or None if they are not ranked
+    def rank(self, user_id):
+        position = self.positions.get(user_id)
+        if position is None:
+            return None
+        level, xp, _ = position
+        higher_levels = len(self) - self.level_counts.prefix(level)
+        level_xp = self.xp_counts[level]
+        higher_xp = level_xp.total - level_xp.prefix(xp + 1)
+        return higher_levels + higher_xp + 1
+
+    # User ID, level, XP and rank at a zero-based position from the top
+    def at(self, offset):
+        k = len(self) - 1 - offset
+        level = self.level_counts.find(k)
+        k -= self.level_counts.prefix(level - 1)
+        level_xp = self.xp_counts[level]
+        xp = level_xp.find(k) - 1
+        k -= level_xp.prefix(xp)
+        bucket = self.buckets[(level, xp)]
+        rank = len(self) - self.level_counts.prefix(level) + level_xp.total - level_xp.prefix(xp + 1) + 1
+        return bucket[len(bucket) - 1 - k], level, xp, rank
+
+    def page_count(self):
+        return max(1, -(-len(self) // self.page_size))
+
+    # Entries on a 1-based page. Pages are cached briefly so a burst of
+    # requests for the same page after a big event costs one lookup.
+    def page(self, number):
+        now = time.monotonic()
+        cached = self.page_cache.get(number)
+        if cached is not None and now - cached[0] < self.page_ttl:
+            return cached[1]
+        start = (number - 1) * self.page_size
+        end = min(start + self.page_size, len(self))
+        entries = [self.at(offset) for offset in range(start, end)]
+        if len(self.page_cache) > 1000:
+            self.page_cache.clear()
+        self.page_cache[number] = (now, entries)
+        return entries
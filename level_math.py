@@ -0,0 +1,31 @@
+# Closed-form XP curve math.
+# Going from level L to L + 1 costs coefficient * L**2 XP, so the total XP
+# needed to reach level L is coefficient * (L - 1) * L * (2L - 1) / 6.
+
+
+# Total XP a user has earned when they reach the start of a level
+def total_xp_for_level(level, coefficient):
+    return coefficient * (level - 1) * level * (2 * level - 1) // 6
+
+
+# Highest level whose starting total is at most the given total XP
+def level_for_total_xp(total, coefficient):
+    # The cube root estimate is at most a level or two off in either direction
+    level = max(1, int((3 * total / coefficient) ** (1 / 3)))
+    while total_xp_for_level(level + 1, coefficient) <= total:
+        level += 1
+    while level > 1 and total_xp_for_level(level, coefficient) > total:
+        level -= 1
+    return level
+
+
+# Total XP for parallel columns of levels and in-level XP
+def totals_for(levels, xps, coefficient):
+    return [total_xp_for_level(level, coefficient) + xp for level, xp in zip(levels, xps)]
+
+
+# Levels and in-level XP for a column of total XP values
+def levels_for(totals, coefficient):
+    levels = [level_for_total_xp(total, coefficient) for total in totals]
+    xps = [total - total_xp_for_level(level, coefficient) for total, level in zip(totals, levels)]
+    return levels, xps
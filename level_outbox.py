@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import discord
+from discord.ext import tasks
+from metrics import instrumented
+
+
+# A pending level-up for one member. Several level-ups before the next
+# delivery collapse into a single notice for the highest level reached.
+class LevelUpNotice:
+    __slots__ = ('member', 'channel', 'level', 'rewards')
+
+    def __init__(self, member, channel, level, rewards):
+        self.member = member
+        self.channel = channel
+        self.level = level
+        self.rewards = list(rewards)
+
+
+# Delivers level-up announcements, DMs and reward roles in the background
+# so the XP handler never waits on a REST call.
+# Announcements go out every interval: channels with only a few level-ups
+# get one message each, busier channels get a single digest. Reward roles
+# and DMs are sent from a queue by a fixed number of workers.
+class LevelUpOutbox:
+    def __init__(self, interval=5, digest_threshold=3, workers=3):
+        self.pending = {}
+        self.queue = asyncio.Queue()
+        self.digest_threshold = digest_threshold
+        self.worker_count = workers
+        self.workers = []
+        self.deliver_loop.change_interval(seconds=interval)
+
+    def start(self):
+        self.workers = [asyncio.create_task(self.worker()) for _ in range(self.worker_count)]
+        self.deliver_loop.start()
+
+    # Deliver what is pending, wait briefly for the queue to drain, then stop
+    async def close(self, timeout=10):
+        self.deliver_loop.cancel()
+        await self.deliver()
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"Dropped {self.queue.qsize()} queued level-up messages on shutdown.")
+        for worker in self.workers:
+            worker.cancel()
+
+    # Record that a member reached a level, with any (role, level) rewards earned
+    def add(self, member, channel, level, rewards=()):
+        notice = self.pending.get(member.id)
+        if notice is None:
+            self.pending[member.id] = LevelUpNotice(member, channel, level, rewards)
+        else:
+            notice.channel = channel
+            notice.level = max(notice.level, level)
+            notice.rewards.extend(rewards)
+
+    @tasks.loop(seconds=5)
+    @instrumented("task:level_outbox.deliver_loop")
+    async def deliver_loop(self):
+        await self.deliver()
+
+    async def deliver(self):
+        if not self.pending:
+            return
+        notices = list(self.pending.values())
+        self.pending = {}
+
+        by_channel = {}
+        for notice in notices:
+            by_channel.setdefault(notice.channel, []).append(notice)
+            self.queue.put_nowait(notice)
+
+        await asyncio.gather(
+            *(self.announce(channel, channel_notices) for channel, channel_notices in by_channel.items())
+        )
+
+    async def announce(self, channel, notices):
+        if len(notices) < self.digest_threshold:
+            messages = [
+                f"{notice.member.display_name} has leveled up to level {notice.level}!"
+                for notice in notices
+            ]
+        else:
+            messages = []
+            current = "Level ups:"
+            for notice in notices:
+                line = f"\n{notice.member.display_name} reached level {notice.level}!"
+                if len(current) + len(line) > 2000:
+                    messages.append(current)
+                    current = "Level ups (continued):"
+                current += line
+            messages.append(current)
+
+        for content in messages:
+            try:
+                await channel.send(content)
+            except discord.HTTPException as e:
+                logging.error(f"Failed to announce level ups in {channel}: {e}")
+
+    # Grant reward roles and send the level-up DM for queued notices
+    async def worker(self):
+        while True:
+            notice = await self.queue.get()
+            try:
+                await self.send_rewards(notice)
+            except Exception as e:
+                logging.error(f"Failed to deliver level up for {notice.member}: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def send_rewards(self, notice):
+        lines = [f"Congratulations! You have leveled up to level {notice.level}!"]
+        if notice.rewards:
+            await notice.member.add_roles(*(role for role, _ in notice.rewards), reason="Level reward")
+            for role, level in notice.rewards:
+                lines.append(f"You have been given the '{role.name}' role for reaching level {level}!")
+        try:
+            await notice.member.send("\n".join(lines))
+        except discord.Forbidden:
+            # Member has DMs closed
+            pass
@@ -0,0 +1,311 @@
+import abc
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import sys
+from atomic_file import atomic_write
+
+
+# Per-user level data. __slots__ keeps each record to a few machine words
+# instead of a dict with string keys; see benchmarks/level_memory.py.
+# XP cooldowns are tracked separately in memory and are not part of it.
+class LevelRecord:
+    __slots__ = ('xp', 'level')
+
+    def __init__(self, xp=0, level=1):
+        self.xp = xp
+        self.level = level
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get('xp', 0), data.get('level', 1))
+
+    def to_dict(self):
+        return {'xp': self.xp, 'level': self.level}
+
+
+NEW_ROW = (0, 1)  # (xp, level) of a new LevelRecord
+
+
+# Base class for level storage backends.
+# Records are LevelRecord objects keyed by integer user ID. Changes are
+# written behind: update() only marks the user dirty and flush() persists
+# everything that changed since the last flush.
+class LevelStore(abc.ABC):
+    def __init__(self):
+        self.dirty_users = set()
+        self.flush_lock = asyncio.Lock()
+
+    # Return a user's record, or None if they have none
+    @abc.abstractmethod
+    def get(self, user_id):
+        ...
+
+    # Store a user's record; it is persisted on the next flush
+    @abc.abstractmethod
+    def update(self, user_id, data):
+        ...
+
+    # Yield (user_id, record) for every stored user
+    @abc.abstractmethod
+    def iter_records(self):
+        ...
+
+    # Persist the records of the given user IDs
+    @abc.abstractmethod
+    async def write_changes(self, user_ids):
+        ...
+
+    # Persist all pending changes, keeping them pending if the write fails
+    async def flush(self):
+        async with self.flush_lock:
+            if not self.dirty_users:
+                return
+            dirty_users = self.dirty_users
+            self.dirty_users = set()
+            try:
+                await self.write_changes(dirty_users)
+            except Exception:
+                self.dirty_users |= dirty_users
+                raise
+
+    async def close(self):
+        await self.flush()
+
+
+# Keeps every record in memory and rewrites the whole JSON file on flush
+class JsonLevelStore(LevelStore):
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.levels = self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, 'r') as f:
+            return {int(user_id): LevelRecord.from_dict(data) for user_id, data in json.load(f).items()}
+
+    def get(self, user_id):
+        return self.levels.get(user_id)
+
+    def update(self, user_id, data):
+        self.levels[user_id] = data
+        self.dirty_users.add(user_id)
+
+    def iter_records(self):
+        return iter(list(self.levels.items()))
+
+    async def write_changes(self, user_ids):
+        # Records keep changing on the loop while the thread serialises, so
+        # their values are copied here; serialising happens off the event loop
+        rows = [(user_id, record.xp, record.level) for user_id, record in self.levels.items()]
+        await asyncio.to_thread(self.save, rows)
+
+    # Atomically replace the levels file with the given (user_id, xp, level) rows
+    def save(self, rows):
+        data = json.dumps({user_id: {'xp': xp, 'level': level} for user_id, xp, level in rows}, separators=(',', ':'))
+        atomic_write(self.path, data)
+
+
+# Embedded SQLite database in WAL mode. Only recently used and unsaved records
+# are kept in memory; everything else is read on demand by primary key.
+#
+# Several processes can share the database (clusters, see
+# cluster_launcher.py); pass merge to do so. Saved records are then never
+# served from memory, since another process may have changed them, and each
+# unsaved record remembers the row it was read from. If the row changed in
+# the meantime, merge(read_row, own_row, current_row) combines the two
+# changes into the row written, each row being an (xp, level) tuple.
+# Records being saved are served from memory until the write commits, and
+# a record changed again meanwhile is rebased onto the row written.
+class SqliteLevelStore(LevelStore):
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS levels (
+            user_id INTEGER PRIMARY KEY,
+            xp INTEGER NOT NULL,
+            level INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS levels_rank ON levels (level DESC, xp DESC);
+    """
+    UPSERT = """
+        INSERT INTO levels (user_id, xp, level) VALUES (?, ?, ?)
+        ON CONFLICT (user_id) DO UPDATE SET
+            xp = excluded.xp,
+            level = excluded.level
+    """
+
+    def __init__(self, path, cache_size=10000, merge=None):
+        super().__init__()
+        self.path = path
+        self.cache_size = 0 if merge is not None else cache_size
+        self.merge = merge
+        self.records = {}
+        self.read_rows = {}
+        self.writing = set()
+        # Flushes run in worker threads on their own connection; reads stay on the loop
+        self.writer = self.connect(check_same_thread=False)
+        self.writer.executescript(self.SCHEMA)
+        self.reader = self.connect()
+
+    def connect(self, **kwargs):
+        connection = sqlite3.connect(self.path, **kwargs)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def get(self, user_id):
+        data = self.records.get(user_id)
+        if data is None or (
+            self.merge is not None and user_id not in self.dirty_users and user_id not in self.writing
+        ):
+            row = self.reader.execute(
+                'SELECT xp, level FROM levels WHERE user_id = ?',
+                (user_id,)
+            ).fetchone()
+            if self.merge is not None:
+                # A missing row counts as a new record's
+                self.read_rows[user_id] = row or NEW_ROW
+            if row is None:
+                return None
+            data = LevelRecord(*row)
+            self.records[user_id] = data
+        return data
+
+    def update(self, user_id, data):
+        self.records[user_id] = data
+        self.dirty_users.add(user_id)
+
+    def iter_records(self):
+        # Unsaved records take precedence over the rows on disk
+        pending = {user_id: self.records[user_id] for user_id in self.dirty_users}
+        rows = self.reader.execute('SELECT user_id, xp, level FROM levels')
+        for user_id, xp, level in rows:
+            yield user_id, pending.pop(user_id, None) or LevelRecord(xp, level)
+        yield from pending.items()
+
+    async def write_changes(self, user_ids):
+        rows = []
+        for user_id in user_ids:
+            data = self.records[user_id]
+            rows.append((user_id, data.xp, data.level))
+        if self.merge is None:
+            await asyncio.to_thread(self.write_rows, rows)
+        else:
+            read_rows = {user_id: self.read_rows.pop(user_id, None) for user_id in user_ids}
+            self.writing = set(user_ids)
+            try:
+                written = await asyncio.to_thread(self.write_shared_rows, rows, read_rows)
+            except Exception:
+                # flush() marks them dirty again; they still derive from the same rows
+                self.read_rows.update((user_id, row) for user_id, row in read_rows.items() if row is not None)
+                raise
+            finally:
+                self.writing = set()
+            for (user_id, own_xp, own_level), (_, xp, level) in zip(rows, written):
+                if user_id not in self.dirty_users:
+                    continue
+                # Changed again while saving: apply those changes to the row written
+                data = self.records[user_id]
+                if (xp, level) != (own_xp, own_level):
+                    data.xp, data.level = self.merge((own_xp, own_level), (data.xp, data.level), (xp, level))
+                self.read_rows[user_id] = (xp, level)
+        self.evict()
+
+    # Upsert a batch of rows in a single transaction
+    def write_rows(self, rows):
+        with self.writer:
+            self.writer.executemany(self.UPSERT, rows)
+
+    # Upsert a batch of rows, merging in changes other processes made to
+    # them since they were read, and return the rows written. The write lock
+    # is taken before reading the current rows, so no other process can
+    # change them in between.
+    def write_shared_rows(self, rows, read_rows):
+        with self.writer:
+            self.writer.execute('BEGIN IMMEDIATE')
+            merged = []
+            for user_id, xp, level in rows:
+                current = self.writer.execute(
+                    'SELECT xp, level FROM levels WHERE user_id = ?',
+                    (user_id,)
+                ).fetchone() or NEW_ROW
+                read_row = read_rows.get(user_id)
+                if read_row is not None and current != read_row:
+                    xp, level = self.merge(read_row, (xp, level), current)
+                merged.append((user_id, xp, level))
+            self.writer.executemany(self.UPSERT, merged)
+        return merged
+
+    # Drop saved records from memory once the cache grows past its limit
+    def evict(self):
+        if self.merge is not None:
+            self.read_rows = {user_id: row for user_id, row in self.read_rows.items() if user_id in self.dirty_users}
+        excess = len(self.records) - self.cache_size
+        if excess <= 0:
+            return
+        clean = [user_id for user_id in self.records if user_id not in self.dirty_users]
+        for user_id in clean[:excess]:
+            del self.records[user_id]
+
+    # One-shot import of an existing levels.json into an empty database.
+    # Emptiness is checked again under the write lock, so processes
+    # starting together import it once.
+    def migrate_from_json(self, json_path):
+        if not os.path.exists(json_path):
+            return 0
+        if self.reader.execute('SELECT 1 FROM levels LIMIT 1').fetchone():
+            return 0
+        rows = [(user_id, data.xp, data.level) for user_id, data in read_level_file(json_path)]
+        with self.writer:
+            self.writer.execute('BEGIN IMMEDIATE')
+            if self.writer.execute('SELECT 1 FROM levels LIMIT 1').fetchone():
+                return 0
+            self.writer.executemany(self.UPSERT, rows)
+        return len(rows)
+
+    async def close(self):
+        await super().close()
+        self.reader.close()
+        self.writer.close()
+
+
+# (user_id, record) pairs of a levels file of either backend, by extension
+def read_level_file(path):
+    if path.endswith('.json'):
+        return list(JsonLevelStore(path).levels.items())
+    connection = sqlite3.connect(path)
+    try:
+        return [(user_id, LevelRecord(xp, level)) for user_id, xp, level in connection.execute(
+            'SELECT user_id, xp, level FROM levels'
+        )]
+    finally:
+        connection.close()
+
+
+# Create the configured backend ("json" or "sqlite"). A store shared by
+# several processes (see SqliteLevelStore) is always SQLite.
+def open_level_store(backend, json_path, db_path, merge=None):
+    if merge is not None and backend != 'sqlite':
+        logging.warning(f"Levels are shared between processes through SQLite; using {db_path} instead of {json_path}.")
+        backend = 'sqlite'
+    if backend == 'json':
+        return JsonLevelStore(json_path)
+    if backend == 'sqlite':
+        store = SqliteLevelStore(db_path, merge=merge)
+        migrated = store.migrate_from_json(json_path)
+        if migrated:
+            logging.info(f"Migrated {migrated} level records from {json_path} to {db_path}.")
+        return store
+    raise ValueError(f"Unknown level storage backend: {backend}")
+
+
+# Usage: python level_storage.py levels.json levels.db
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print("Usage: python level_storage.py <levels.json> <levels.db>")
+        sys.exit(1)
+    store = SqliteLevelStore(sys.argv[2])
+    print(f"Migrated {store.migrate_from_json(sys.argv[1])} level records.")
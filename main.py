@@ -1,33 +1,41 @@
 # Main imports
+import contextlib
+import hashlib
+import json
 import logging
+import os
+import time
 import discord
 from discord.ext import commands, tasks
 from discord import app_commands
 import asyncio
-import os
-import aiofiles
+from bot_logging import setup_logging
+from cluster import CLUSTER_ID, SHARD_COUNT, SHARD_IDS, apply_api_override, cluster_path, is_primary
+from member_cache import guild_members, member_cache_options, resolve_members, role_members
+from metrics import InstrumentedAutoShardedBot, InstrumentedBot, instrumented
+from ticket_counter import TicketCounter
 
 # --- Configuration Values ---
 # Replace the following placeholders with your actual values
 
 BOT_TOKEN = 'YOUR_BOT_TOKEN'  # Replace with your bot token
-GUILD_ID = 123456789012345678  # Replace with your guild ID
-VERIFIED_ROLE_ID = 123456789012345678  # Replace with your verified role ID
-UNVERIFIED_ROLE_ID = 123456789012345678  # Replace with your unverified role ID
-MOD_ROLE_NAME = "MODERATOR_ROLE_NAME"  # Replace with your moderator role name
-ADMIN_ROLE_NAME = "ADMINISTRATOR_ROLE_NAME"  # Replace with your administrator role name
-TICKET_BUTTON_MESSAGE_ID = 123456789012345678  # Replace with the ticket button message ID after the first run
-TICKET_CHANNEL_ID = 123456789012345678  # Replace with the channel ID where the ticket button should be sent
+# Roles and channels are set per server with /settings (see guild_settings.py)
+TICKET_NUMBER_FILE = 'ticket_number.txt'  # Stores the highest reserved ticket number
+TICKET_NUMBER_BLOCK_SIZE = 100  # Ticket numbers reserved per write to the ticket number file
+TICKET_TOPIC_PREFIX = "Ticket opened by "  # Ticket channel topics are this followed by the user ID
+ROLE_RECONCILE_INTERVAL = 5  # Seconds between passes fixing roles of members queued by events
+ROLE_RECONCILE_BATCH_SIZE = 500  # Members fixed per pass at most
+ROLE_RECONCILE_CONCURRENCY = 5  # Role changes sent at once
+ROLE_AUDIT_INTERVAL_HOURS = 6  # Hours between full audits of verified/unverified roles
+COMMAND_TREE_HASH_FILE = 'command_tree_hash.txt'  # Hash of the last synced slash commands; delete it to force a sync
+LOG_FILE = 'bot.log'  # JSON lines log file
+LOG_MAX_BYTES = 10_000_000  # Size at which the log file is rotated
+LOG_BACKUP_COUNT = 5  # Rotated log files kept
+SHARDED = False  # Run as one AutoShardedBot; use cluster_launcher.py to spread shards over several processes
+MEMBER_CACHE_MODE = "full"  # "full" caches every member at startup; "lazy" fetches whole member lists only when needed and leaves role changes of existing members to the role audit (see member_cache.py)
 
 # --- End of Configuration Values ---
 
-# Setup logging
-logging.basicConfig(
-    filename='bot.log',
-    level=logging.INFO,
-    format='%(asctime)s:%(levelname)s:%(name)s:%(message)s'
-)
-
 # Define the required intents for the bot
 intents = discord.Intents.default()
 intents.guilds = True
@@ -36,11 +44,26 @@ intents.messages = True
 intents.reactions = True
 intents.message_content = True
 
-# Initialize the bot with the specified command prefix and intents
-bot = commands.Bot(command_prefix="!", intents=intents)
+# Initialize the bot with the specified command prefix and intents.
+# Event listeners and app commands are timed for /stats and the metrics file.
+if SHARD_IDS is not None:
+    # Started by cluster_launcher.py to run a slice of the shards
+    bot = InstrumentedAutoShardedBot(
+        command_prefix="!", intents=intents, shard_ids=SHARD_IDS, shard_count=SHARD_COUNT,
+        **member_cache_options(MEMBER_CACHE_MODE)
+    )
+elif SHARDED:
+    bot = InstrumentedAutoShardedBot(command_prefix="!", intents=intents, **member_cache_options(MEMBER_CACHE_MODE))
+else:
+    bot = InstrumentedBot(command_prefix="!", intents=intents, **member_cache_options(MEMBER_CACHE_MODE))
 
 async def load_extensions():
     extensions = [
+        'instrumentation',
+        'cluster',
+        'guild_settings',
+        'entity_cache',
+        'moderation_jobs',
         'mod_commands',
         'non_mod',
         'role_selection',
@@ -55,14 +78,30 @@ async def load_extensions():
 
 @bot.event
 async def on_command_completion(ctx):
+    latency = (discord.utils.utcnow() - ctx.message.created_at).total_seconds() * 1000
     logging.info(
-        f"Command: {ctx.command} executed by {ctx.author} in {ctx.channel}"
+        f"Command: {ctx.command} executed by {ctx.author} in {ctx.channel}",
+        extra={
+            "guild_id": ctx.guild.id if ctx.guild else None,
+            "user_id": ctx.author.id,
+            "channel_id": ctx.channel.id,
+            "command": str(ctx.command),
+            "latency_ms": round(latency, 1),
+        }
     )
 
 @bot.event
 async def on_app_command_completion(interaction: discord.Interaction, command: discord.app_commands.Command):
+    latency = (discord.utils.utcnow() - interaction.created_at).total_seconds() * 1000
     logging.info(
-        f"Slash Command: {command.name} executed by {interaction.user} in {interaction.channel}"
+        f"Slash Command: {command.name} executed by {interaction.user} in {interaction.channel}",
+        extra={
+            "guild_id": interaction.guild_id,
+            "user_id": interaction.user.id,
+            "channel_id": interaction.channel_id,
+            "command": command.qualified_name,
+            "latency_ms": round(latency, 1),
+        }
     )
 
 class HelpCommand(commands.Cog):
@@ -83,17 +122,26 @@ class HelpCommand(commands.Cog):
             ("kick", "Kick a member.", True),
             ("kick_role", "Kick all members with a specific role.", True),
             ("unban", "Unban a member from the server.", True),
+            ("bans search", "Search banned users by username.", True),
             ("mute", "Mute a member in the server.", True),
             ("unmute", "Unmute a member in the server.", True),
-            ("purge", "Purge a number of messages from a channel.", True),
+            ("purge", "Purge messages from a channel, optionally by author, pattern or attachments.", True),
             ("announce", "Send an announcement to a specific channel.", True),
             ("warn", "Warn a member in the server.", True),
             ("warns", "List all warnings for a member.", True),
+            ("modlog", "Show a user's moderation history.", True),
+            ("stats", "Show handler latency, event loop lag and rate limit statistics.", True),
             ("give", "Give a role to multiple users.", True),
             ("compliment", "Compliment a user.", False),
             ("eight_ball", "Ask the Magic 8-Ball a question.", False),
             ("hello", "Receive a greeting from the bot.", False),
             ("level", "Check your level or another person’s level.", False),
+            ("leaderboard", "Show the server leaderboard.", False),
+            ("rank", "Check your rank or another person’s rank.", False),
+            ("xp_cooldown", "Set the XP cooldown for the server or a channel.", True),
+            ("xp_grant", "Grant or revoke XP for every member of a role.", True),
+            ("xp_import", "Import XP from another bot's export.", True),
+            ("xp_curve", "Change the XP curve and recompute levels.", True),
             ("report", "Report a user.", False),
             ("set_roles", "Set roles and associated questions.", True),
             ("list_questions", "List all set questions.", True),
@@ -101,6 +149,7 @@ class HelpCommand(commands.Cog):
             ("pick_role", "Pick a role based on a question.", False),
             ("remove_role", "Remove a role.", False),
             ("verify_user", "Verify a user by assigning roles and closing their ticket.", True),
+            ("settings", "View or change this server's roles and channels.", True),
         ]
 
         for name, description, is_mod_only in commands_info:
@@ -112,87 +161,137 @@ class HelpCommand(commands.Cog):
 
         await interaction.response.send_message(embed=embed)
 
+# Members whose verified/unverified roles need checking, as (guild ID, member ID).
+# Filled by member events and the periodic audit, drained by reconcile_member_roles.
+pending_role_checks = set()
+
 # Assign the unverified role upon member join
 @bot.event
 async def on_member_join(member):
-    print(f'{member} joined the server.')
-    unverified_role = member.guild.get_role(UNVERIFIED_ROLE_ID)
-    if unverified_role:
-        try:
-            await member.add_roles(unverified_role)
-            print(f"Assigned role '{unverified_role.name}' to {member.name}.")
-        except discord.Forbidden:
-            print("Bot does not have permission to assign roles.")
-        except discord.HTTPException as e:
-            print(f"Failed to assign role: {e}")
-    else:
-        print(f"Role not found with ID {UNVERIFIED_ROLE_ID}.")
+    logging.info(f'{member} joined the server.', extra={"guild_id": member.guild.id, "user_id": member.id})
+    pending_role_checks.add((member.guild.id, member.id))
 
 # Event listener for role updates
 @bot.event
 async def on_member_update(before, after):
-    guild = after.guild
-    verified_role = guild.get_role(VERIFIED_ROLE_ID)
-    unverified_role = guild.get_role(UNVERIFIED_ROLE_ID)
+    # Only role changes touching the verified or unverified role matter
+    config = bot.get_cog("GuildSettings").get(after.guild.id)
+    for role_id in (config.verified_role_id, config.unverified_role_id):
+        if role_id is None:
+            continue
+        if (before.get_role(role_id) is None) != (after.get_role(role_id) is None):
+            pending_role_checks.add((after.guild.id, after.id))
+            return
 
+# A guild's verified and unverified roles, or None for either when the guild
+# has not set it up. Roles that are set but missing are logged.
+def verification_roles(guild, config):
+    if config.verified_role_id is None or config.unverified_role_id is None:
+        return None, None
+    verified_role = guild.get_role(config.verified_role_id)
+    unverified_role = guild.get_role(config.unverified_role_id)
     if verified_role is None or unverified_role is None:
-        print("Verified or unverified role not found.")
-        return
-
-    # If member gains the verified role
-    if verified_role not in before.roles and verified_role in after.roles:
-        if unverified_role in after.roles:
-            try:
-                await after.remove_roles(unverified_role)
-                print(f"Removed unverified role from {after.name} (gained verified role).")
-            except discord.Forbidden:
-                print(f"Permission error when removing role from {after.name}.")
-            except discord.HTTPException as e:
-                print(f"Failed to remove role from {after.name}: {e}")
+        logging.error("Verified or unverified role not found.", extra={"guild_id": guild.id})
+    return verified_role, unverified_role
+
+# Give a member the unverified role if they have neither role, and remove it
+# if they have both
+async def fix_member_roles(member, verified_role, unverified_role):
+    is_verified = member.get_role(verified_role.id) is not None
+    is_unverified = member.get_role(unverified_role.id) is not None
+    if is_verified and is_unverified:
+        try:
+            await member.remove_roles(unverified_role)
+            logging.info(f"Removed unverified role from {member.name}.", extra={"guild_id": member.guild.id, "user_id": member.id})
+        except discord.Forbidden:
+            logging.error(f"Permission error when removing role from {member.name}.", extra={"guild_id": member.guild.id, "user_id": member.id})
+        except discord.HTTPException as e:
+            logging.error(f"Failed to remove role from {member.name}: {e}", extra={"guild_id": member.guild.id, "user_id": member.id})
+    elif not is_verified and not is_unverified:
+        try:
+            await member.add_roles(unverified_role)
+            logging.info(f"Added unverified role to {member.name}.", extra={"guild_id": member.guild.id, "user_id": member.id})
+        except discord.Forbidden:
+            logging.error(f"Permission error when adding role to {member.name}.", extra={"guild_id": member.guild.id, "user_id": member.id})
+        except discord.HTTPException as e:
+            logging.error(f"Failed to add role to {member.name}: {e}", extra={"guild_id": member.guild.id, "user_id": member.id})
 
-    # If member loses the verified role
-    elif verified_role in before.roles and verified_role not in after.roles:
-        if unverified_role not in after.roles:
-            try:
-                await after.add_roles(unverified_role)
-                print(f"Added unverified role to {after.name} (lost verified role).")
-            except discord.Forbidden:
-                print(f"Permission error when adding role to {after.name}.")
-            except discord.HTTPException as e:
-                print(f"Failed to add role to {after.name}: {e}")
+# Fix the roles of members queued by events, a bounded batch at a time
+@tasks.loop(seconds=ROLE_RECONCILE_INTERVAL)
+@instrumented("task:reconcile_member_roles")
+async def reconcile_member_roles():
+    if not pending_role_checks:
+        return
 
-# Periodic role consistency check
-@tasks.loop(minutes=10)
+    batch = [pending_role_checks.pop() for _ in range(min(ROLE_RECONCILE_BATCH_SIZE, len(pending_role_checks)))]
+    by_guild = {}
+    for guild_id, member_id in batch:
+        by_guild.setdefault(guild_id, []).append(member_id)
+
+    semaphore = asyncio.Semaphore(ROLE_RECONCILE_CONCURRENCY)
+
+    async def reconcile(member, verified_role, unverified_role):
+        async with semaphore:
+            await fix_member_roles(member, verified_role, unverified_role)
+
+    settings = bot.get_cog("GuildSettings")
+    fixes = []
+    for guild_id, member_ids in by_guild.items():
+        guild = bot.get_guild(guild_id)
+        if guild is None:
+            continue
+        verified_role, unverified_role = verification_roles(guild, settings.get(guild_id))
+        if verified_role is None or unverified_role is None:
+            continue
+        # Members queued by the audit may not be in a partial member cache
+        for member in await resolve_members(guild, member_ids):
+            fixes.append(reconcile(member, verified_role, unverified_role))
+
+    await asyncio.gather(*fixes)
+
+@reconcile_member_roles.before_loop
+async def before_reconcile_member_roles():
+    await bot.wait_until_ready()
+
+# Rare full audit in case events were missed, e.g. while the bot was offline.
+# Works on whole role member sets and queues only the members needing a fix.
+@tasks.loop(hours=ROLE_AUDIT_INTERVAL_HOURS)
+@instrumented("task:role_consistency_check")
 async def role_consistency_check():
-    guild = bot.get_guild(GUILD_ID)
-    if guild is None:
-        print("Guild not found.")
-        return
+    settings = bot.get_cog("GuildSettings")
+    for guild in bot.guilds:
+        verified_role, unverified_role = verification_roles(guild, settings.get(guild.id))
+        if verified_role is None or unverified_role is None:
+            continue
+
+        # Fetched on demand, and not kept, when the member cache is partial
+        members = await guild_members(guild)
+        verified = {member.id for member in members if member.get_role(verified_role.id) is not None}
+        unverified = {member.id for member in members if member.get_role(unverified_role.id) is not None}
+        has_both = verified & unverified
+        has_neither = {member.id for member in members} - verified - unverified
+        for member_id in has_both | has_neither:
+            pending_role_checks.add((guild.id, member_id))
+        logging.info(
+            f"Role audit queued {len(has_both)} members with both roles and {len(has_neither)} with neither.",
+            extra={"guild_id": guild.id}
+        )
+        # Let the gateway breathe between guilds
+        await asyncio.sleep(0)
 
-    verified_role = guild.get_role(VERIFIED_ROLE_ID)
-    unverified_role = guild.get_role(UNVERIFIED_ROLE_ID)
+@role_consistency_check.before_loop
+async def before_role_consistency_check():
+    await bot.wait_until_ready()
 
-    if verified_role is None or unverified_role is None:
-        print("Verified or unverified role not found.")
-        return
+# Clusters share one ticket number file, written only by the coordinator
+async def reserve_ticket_numbers(count):
+    return await bot.get_cog("ClusterLink").reserve_tickets(os.path.abspath(TICKET_NUMBER_FILE), count)
 
-    for member in guild.members:
-        if verified_role in member.roles and unverified_role in member.roles:
-            try:
-                await member.remove_roles(unverified_role)
-                print(f"Removed unverified role from {member.name}.")
-            except discord.Forbidden:
-                print(f"Permission error when removing role from {member.name}.")
-            except discord.HTTPException as e:
-                print(f"Failed to remove role from {member.name}: {e}")
-        elif verified_role not in member.roles and unverified_role not in member.roles:
-            try:
-                await member.add_roles(unverified_role)
-                print(f"Added unverified role to {member.name}.")
-            except discord.Forbidden:
-                print(f"Permission error when adding role to {member.name}.")
-            except discord.HTTPException as e:
-                print(f"Failed to add role from {member.name}: {e}")
+# Shared by every TicketButton view so concurrent clicks never get the same number
+ticket_counter = TicketCounter(
+    TICKET_NUMBER_FILE, TICKET_NUMBER_BLOCK_SIZE,
+    reserve=reserve_ticket_numbers if CLUSTER_ID is not None else None
+)
 
 # Ticket Button View
 class TicketButton(discord.ui.View):
@@ -209,12 +308,10 @@ class TicketButton(discord.ui.View):
     ):
         guild = interaction.guild
         user = interaction.user
+        ticket_system = interaction.client.get_cog("TicketSystem")
 
         # Check if the user already has an open ticket
-        existing_channel = discord.utils.get(
-            guild.text_channels,
-            topic=f"Ticket opened by {user.id}"
-        )
+        existing_channel = ticket_system.get_ticket_channel(guild, user.id)
         if existing_channel:
             await interaction.response.send_message(
                 f"You already have an open ticket: {existing_channel.mention}",
@@ -222,6 +319,22 @@ class TicketButton(discord.ui.View):
             )
             return
 
+        # Ignore repeated clicks while the first one is still creating the channel
+        if not ticket_system.start_creating(guild.id, user.id):
+            await interaction.response.send_message(
+                "Your ticket is already being created.", ephemeral=True
+            )
+            return
+
+        try:
+            await self.open_ticket(interaction, ticket_system)
+        finally:
+            ticket_system.finish_creating(guild.id, user.id)
+
+    async def open_ticket(self, interaction, ticket_system):
+        guild = interaction.guild
+        user = interaction.user
+
         # Get the next ticket number
         ticket_number = await self.get_next_ticket_number()
 
@@ -234,8 +347,10 @@ class TicketButton(discord.ui.View):
         }
 
         # Get roles for mods/admins
-        mod_role = discord.utils.get(guild.roles, name=MOD_ROLE_NAME)
-        admin_role = discord.utils.get(guild.roles, name=ADMIN_ROLE_NAME)
+        config = interaction.client.get_cog("GuildSettings").get(guild.id)
+        entity_cache = interaction.client.get_cog("EntityCache")
+        mod_role = entity_cache.get_role(guild, config.mod_role_name)
+        admin_role = entity_cache.get_role(guild, config.admin_role_name)
 
         # Add mods and admins to overwrites
         if mod_role:
@@ -248,9 +363,10 @@ class TicketButton(discord.ui.View):
             )
 
         # Get or create the category for tickets
-        category = discord.utils.get(guild.categories, name="Tickets")
+        category = entity_cache.get_category(guild, "Tickets")
         if category is None:
             category = await guild.create_category("Tickets")
+            entity_cache.invalidate(entity_cache.categories, guild.id, "Tickets")
 
         # Create the ticket channel with the ticket number
         channel_name = f"ticket-{ticket_number}"
@@ -258,8 +374,10 @@ class TicketButton(discord.ui.View):
             channel_name,
             overwrites=overwrites,
             category=category,
-            topic=f"Ticket opened by {user.id}"
+            topic=f"{TICKET_TOPIC_PREFIX}{user.id}"
         )
+        # Register now rather than waiting for the channel create event
+        ticket_system.track(channel)
 
         # Send a message in the ticket channel mentioning the user and staff roles
         staff_roles = []
@@ -278,61 +396,128 @@ class TicketButton(discord.ui.View):
         )
 
     async def get_next_ticket_number(self):
-        # Path to the ticket number file
-        file_path = 'ticket_number.txt'
-
-        # Check if the file exists
-        if not os.path.exists(file_path):
-            # Create the file and initialize the ticket number to 1
-            async with aiofiles.open(file_path, mode='w') as f:
-                await f.write('1')
-            return 1
-
-        # Read the last ticket number
-        async with aiofiles.open(file_path, mode='r') as f:
-            content = await f.read()
-            ticket_number = int(content.strip())
-
-        # Increment the ticket number
-        ticket_number += 1
-
-        # Write the new ticket number back to the file
-        async with aiofiles.open(file_path, mode='w') as f:
-            await f.write(str(ticket_number))
-
-        return ticket_number
-
-# Ensure the ticket button is present in the specified channel
-async def ensure_ticket_button():
-    channel = bot.get_channel(TICKET_CHANNEL_ID)
+        # Numbers come from memory; the file is only written once per block
+        return await ticket_counter.next()
+
+# Ensure the ticket button is present in the guild's ticket channel
+async def ensure_ticket_button(guild):
+    settings = bot.get_cog("GuildSettings")
+    config = settings.get(guild.id)
+    if config.ticket_channel_id is None:
+        return
+    channel = guild.get_channel(config.ticket_channel_id)
     if channel is None:
-        print(f"Channel with ID {TICKET_CHANNEL_ID} not found.")
+        logging.error(f"Channel with ID {config.ticket_channel_id} not found.", extra={"guild_id": guild.id})
         return
 
-    if TICKET_BUTTON_MESSAGE_ID != 123456789012345678:
+    if config.ticket_button_message_id is not None:
         try:
             # Try to fetch the message with the given ID
-            message = await channel.fetch_message(TICKET_BUTTON_MESSAGE_ID)
+            message = await channel.fetch_message(config.ticket_button_message_id)
             if message.author.id == bot.user.id:
-                print("Ticket button already exists in the channel.")
+                logging.info("Ticket button already exists in the channel.", extra={"guild_id": guild.id})
                 return
         except discord.NotFound:
             # Message not found, we need to send a new one
-            print("Ticket button message not found. Creating a new one.")
-    else:
-        print("Ticket button message ID not set. Creating a new one.")
+            logging.warning("Ticket button message not found. Creating a new one.", extra={"guild_id": guild.id})
 
-    # Send the new button message
+    # Send the new button message and remember it for the next start
     view = TicketButton()
     message = await channel.send("Click the button below to create a ticket.", view=view)
     await message.pin()
-    print(f"Ticket button has been sent to the channel. Message ID: {message.id}")
-    print("Please update TICKET_BUTTON_MESSAGE_ID in your code with the above message ID.")
+    await settings.update(guild.id, ticket_button_message_id=message.id)
+    logging.info(
+        f"Ticket button has been sent to the channel. Message ID: {message.id}",
+        extra={"guild_id": guild.id, "channel_id": channel.id}
+    )
+
+# Post the ticket button when a guild sets or changes its ticket channel
+@bot.event
+async def on_guild_settings_update(guild_id, before, after):
+    if after.ticket_channel_id != before.ticket_channel_id:
+        guild = bot.get_guild(guild_id)
+        if guild is not None:
+            await ensure_ticket_button(guild)
 
 # Ticket System Cog
+# Keeps an index of open ticket channels by (guild ID, user ID), built from
+# channel topics at startup and kept current from channel events, so
+# lookups never scan the guild's channels.
 class TicketSystem(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.tickets = {}
+        self.ticket_owners = {}
+        self.creating = set()
+
+    async def cog_load(self):
+        if self.bot.is_ready():
+            self.rebuild()
+
+    # Return the user ID a ticket channel belongs to, or None
+    @staticmethod
+    def ticket_owner(channel):
+        topic = getattr(channel, 'topic', None)
+        if not topic or not topic.startswith(TICKET_TOPIC_PREFIX):
+            return None
+        try:
+            return int(topic[len(TICKET_TOPIC_PREFIX):])
+        except ValueError:
+            return None
+
+    def rebuild(self):
+        self.tickets.clear()
+        self.ticket_owners.clear()
+        for guild in self.bot.guilds:
+            for channel in guild.text_channels:
+                self.track(channel)
+
+    # Index a channel, or drop it if its topic no longer marks it as a ticket
+    def track(self, channel):
+        self.untrack(channel.id)
+        owner_id = self.ticket_owner(channel)
+        if owner_id is not None:
+            key = (channel.guild.id, owner_id)
+            self.tickets[key] = channel.id
+            self.ticket_owners[channel.id] = key
+
+    def untrack(self, channel_id):
+        key = self.ticket_owners.pop(channel_id, None)
+        if key is not None and self.tickets.get(key) == channel_id:
+            del self.tickets[key]
+
+    def get_ticket_channel(self, guild, user_id):
+        channel_id = self.tickets.get((guild.id, user_id))
+        if channel_id is None:
+            return None
+        return guild.get_channel(channel_id)
+
+    def start_creating(self, guild_id, user_id):
+        if (guild_id, user_id) in self.creating:
+            return False
+        self.creating.add((guild_id, user_id))
+        return True
+
+    def finish_creating(self, guild_id, user_id):
+        self.creating.discard((guild_id, user_id))
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        self.rebuild()
+
+    @commands.Cog.listener()
+    async def on_guild_channel_create(self, channel):
+        if isinstance(channel, discord.TextChannel):
+            self.track(channel)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_update(self, before, after):
+        if isinstance(after, discord.TextChannel):
+            self.track(after)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel):
+        self.untrack(channel.id)
 
 # Verification Commands Cog
 class VerificationCommands(commands.Cog):
@@ -348,8 +533,10 @@ class VerificationCommands(commands.Cog):
         self, interaction: discord.Interaction, member: discord.Member
     ):
         # Check if the user has the required role
-        mod_role = discord.utils.get(interaction.guild.roles, name=MOD_ROLE_NAME)
-        admin_role = discord.utils.get(interaction.guild.roles, name=ADMIN_ROLE_NAME)
+        config = self.bot.get_cog("GuildSettings").get(interaction.guild.id)
+        entity_cache = self.bot.get_cog("EntityCache")
+        mod_role = entity_cache.get_role(interaction.guild, config.mod_role_name)
+        admin_role = entity_cache.get_role(interaction.guild, config.admin_role_name)
 
         if mod_role not in interaction.user.roles and admin_role not in interaction.user.roles:
             await interaction.response.send_message(
@@ -358,8 +545,8 @@ class VerificationCommands(commands.Cog):
             return
 
         # Get the roles
-        verified_role = interaction.guild.get_role(VERIFIED_ROLE_ID)
-        unverified_role = interaction.guild.get_role(UNVERIFIED_ROLE_ID)
+        verified_role = interaction.guild.get_role(config.verified_role_id)
+        unverified_role = interaction.guild.get_role(config.unverified_role_id)
 
         if verified_role is None:
             await interaction.response.send_message(
@@ -383,9 +570,8 @@ class VerificationCommands(commands.Cog):
         )
 
         # Delete the user's ticket channel
-        ticket_channel = discord.utils.get(
-            interaction.guild.text_channels,
-            topic=f"Ticket opened by {member.id}"
+        ticket_channel = self.bot.get_cog("TicketSystem").get_ticket_channel(
+            interaction.guild, member.id
         )
         if ticket_channel:
             try:
@@ -409,8 +595,10 @@ class ModerationCommands(commands.Cog):
         self, interaction: discord.Interaction, role: discord.Role
     ):
         # Check if the user has the required role
-        mod_role = discord.utils.get(interaction.guild.roles, name=MOD_ROLE_NAME)
-        admin_role = discord.utils.get(interaction.guild.roles, name=ADMIN_ROLE_NAME)
+        config = self.bot.get_cog("GuildSettings").get(interaction.guild.id)
+        entity_cache = self.bot.get_cog("EntityCache")
+        mod_role = entity_cache.get_role(interaction.guild, config.mod_role_name)
+        admin_role = entity_cache.get_role(interaction.guild, config.admin_role_name)
 
         if mod_role not in interaction.user.roles and admin_role not in interaction.user.roles:
             await interaction.response.send_message(
@@ -418,11 +606,13 @@ class ModerationCommands(commands.Cog):
             )
             return
 
-        # Get members with the specified role
-        members_to_ban = [member for member in role.members if not member.bot]
+        # Get members with the specified role. With a partial member cache
+        # the guild's members are fetched first, which can take a while.
+        await interaction.response.defer(ephemeral=True)
+        members_to_ban = [member for member in await role_members(role) if not member.bot]
 
         if not members_to_ban:
-            await interaction.response.send_message(
+            await interaction.followup.send(
                 f"No members found with the role {role.name}.", ephemeral=True
             )
             return
@@ -440,14 +630,19 @@ class ModerationCommands(commands.Cog):
                     return
 
                 await interaction_button.response.defer()
-                for member in self.members:
-                    try:
-                        await member.ban(reason=f"Banned by {interaction.user} using /ban_role command.")
-                        logging.info(f"Banned {member} (ID: {member.id})")
-                    except Exception as e:
-                        logging.error(f"Failed to ban {member} (ID: {member.id}): {e}")
-
-                await interaction.followup.send(f"Banned {len(self.members)} members with the role {role.name}.")
+                # Runs in the background; progress is posted in this channel
+                await interaction_button.client.get_cog("ModerationJobs").start_job(
+                    guild=interaction.guild,
+                    channel=interaction.channel,
+                    action="ban",
+                    member_ids=[member.id for member in self.members],
+                    reason=f"Banned by {interaction.user} using /ban_role command.",
+                    initiator=interaction.user,
+                    description=f"the role {role.name}"
+                )
+                await interaction.followup.send(
+                    f"Started banning {len(self.members)} members with the role {role.name}.", ephemeral=True
+                )
                 self.stop()
 
             @discord.ui.button(label="Cancel", style=discord.ButtonStyle.gray)
@@ -460,7 +655,7 @@ class ModerationCommands(commands.Cog):
                 self.stop()
 
         view = ConfirmBanView(members_to_ban)
-        await interaction.response.send_message(
+        await interaction.followup.send(
             f"Are you sure you want to ban {len(members_to_ban)} members with the role {role.name}?",
             view=view,
             ephemeral=True
@@ -477,8 +672,10 @@ class ModerationCommands(commands.Cog):
         # Similar implementation to ban_role, replace ban with kick
 
         # Check if the user has the required role
-        mod_role = discord.utils.get(interaction.guild.roles, name=MOD_ROLE_NAME)
-        admin_role = discord.utils.get(interaction.guild.roles, name=ADMIN_ROLE_NAME)
+        config = self.bot.get_cog("GuildSettings").get(interaction.guild.id)
+        entity_cache = self.bot.get_cog("EntityCache")
+        mod_role = entity_cache.get_role(interaction.guild, config.mod_role_name)
+        admin_role = entity_cache.get_role(interaction.guild, config.admin_role_name)
 
         if mod_role not in interaction.user.roles and admin_role not in interaction.user.roles:
             await interaction.response.send_message(
@@ -486,11 +683,13 @@ class ModerationCommands(commands.Cog):
             )
             return
 
-        # Get members with the specified role
-        members_to_kick = [member for member in role.members if not member.bot]
+        # Get members with the specified role. With a partial member cache
+        # the guild's members are fetched first, which can take a while.
+        await interaction.response.defer(ephemeral=True)
+        members_to_kick = [member for member in await role_members(role) if not member.bot]
 
         if not members_to_kick:
-            await interaction.response.send_message(
+            await interaction.followup.send(
                 f"No members found with the role {role.name}.", ephemeral=True
             )
             return
@@ -508,14 +707,19 @@ class ModerationCommands(commands.Cog):
                     return
 
                 await interaction_button.response.defer()
-                for member in self.members:
-                    try:
-                        await member.kick(reason=f"Kicked by {interaction.user} using /kick_role command.")
-                        logging.info(f"Kicked {member} (ID: {member.id})")
-                    except Exception as e:
-                        logging.error(f"Failed to kick {member} (ID: {member.id}): {e}")
-
-                await interaction.followup.send(f"Kicked {len(self.members)} members with the role {role.name}.")
+                # Runs in the background; progress is posted in this channel
+                await interaction_button.client.get_cog("ModerationJobs").start_job(
+                    guild=interaction.guild,
+                    channel=interaction.channel,
+                    action="kick",
+                    member_ids=[member.id for member in self.members],
+                    reason=f"Kicked by {interaction.user} using /kick_role command.",
+                    initiator=interaction.user,
+                    description=f"the role {role.name}"
+                )
+                await interaction.followup.send(
+                    f"Started kicking {len(self.members)} members with the role {role.name}.", ephemeral=True
+                )
                 self.stop()
 
             @discord.ui.button(label="Cancel", style=discord.ButtonStyle.gray)
@@ -528,7 +732,7 @@ class ModerationCommands(commands.Cog):
                 self.stop()
 
         view = ConfirmKickView(members_to_kick)
-        await interaction.response.send_message(
+        await interaction.followup.send(
             f"Are you sure you want to kick {len(members_to_kick)} members with the role {role.name}?",
             view=view,
             ephemeral=True
@@ -541,17 +745,95 @@ async def setup(bot):
     await bot.add_cog(VerificationCommands(bot))
     await bot.add_cog(ModerationCommands(bot))
 
-# On ready event
-@bot.event
-async def on_ready():
-    logging.info(f'Logged in as {bot.user}')
-    bot.add_view(TicketButton())
-    await ensure_ticket_button()
-    await load_extensions()
-    await setup(bot)
+# Startup timing report: (phase, seconds) in the order the phases ran
+startup_timings = []
+startup_started = time.perf_counter()
+gateway_started = startup_started
+ready_handled = False
+
+@contextlib.contextmanager
+def timed_phase(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_timings.append((name, time.perf_counter() - start))
+
+def log_startup_report():
+    lines = [f"  {name}: {seconds * 1000:.0f} ms" for name, seconds in startup_timings]
+    total = time.perf_counter() - startup_started
+    logging.info("Startup took %.2f s:\n%s", total, "\n".join(lines))
+
+# Hash of the application's slash commands as they would be sent to Discord
+def command_tree_hash():
+    commands_to_sync = bot.tree.get_commands()
+    try:
+        payload = [command.to_dict(bot.tree) for command in commands_to_sync]
+    except TypeError:
+        # discord.py before 2.4 serialises commands without the tree
+        payload = [command.to_dict() for command in commands_to_sync]
+    data = json.dumps([bot.application_id, payload], sort_keys=True)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+# Sync slash commands only when they changed since the last sync
+async def sync_command_tree():
+    tree_hash = command_tree_hash()
+    if os.path.exists(COMMAND_TREE_HASH_FILE):
+        with open(COMMAND_TREE_HASH_FILE, 'r') as f:
+            if f.read().strip() == tree_hash:
+                logging.info("Slash commands unchanged, skipping sync.")
+                return
     await bot.tree.sync()
-    logging.info("Bot is ready and slash commands have been synced.")
+    with open(COMMAND_TREE_HASH_FILE, 'w') as f:
+        f.write(tree_hash)
+    logging.info("Slash commands have been synced.")
+
+# One-time startup, run after login and before connecting to the gateway
+@bot.event
+async def setup_hook():
+    with timed_phase("persistent views"):
+        bot.add_view(TicketButton())
+    with timed_phase("extensions"):
+        await load_extensions()
+    with timed_phase("cogs"):
+        await setup(bot)
+    # Commands are global, so with several clusters only the first syncs them
+    if is_primary():
+        with timed_phase("command sync"):
+            await sync_command_tree()
+    if MEMBER_CACHE_MODE == "lazy":
+        logging.warning(
+            "Member cache is lazy: verification role changes of members who were already in a server "
+            f"at startup are only fixed by the role audit, every {ROLE_AUDIT_INTERVAL_HOURS} hours."
+        )
+    reconcile_member_roles.start()
     role_consistency_check.start()
+    global gateway_started
+    gateway_started = time.perf_counter()
 
-# Run the bot
-bot.run(BOT_TOKEN)
+# On ready event. It fires again after every reconnect, so the
+# work that needs the guild cache only runs the first time.
+@bot.event
+async def on_ready():
+    global ready_handled
+    logging.info(f'Logged in as {bot.user}')
+    if ready_handled:
+        return
+    ready_handled = True
+    startup_timings.append(("gateway connect", time.perf_counter() - gateway_started))
+    with timed_phase("ticket buttons"):
+        for guild in bot.guilds:
+            await ensure_ticket_button(guild)
+    logging.info("Bot is ready.")
+    log_startup_report()
+
+# Run the bot. Guarded so benchmarks can import this module without
+# connecting. Log records are written by a background thread so logging
+# never blocks the event loop on disk; discord.py's own logs go through
+# the same root logger.
+if __name__ == '__main__':
+    setup_logging(cluster_path(LOG_FILE), max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT)
+    if CLUSTER_ID is not None:
+        logging.info(f"Starting cluster {CLUSTER_ID} with shards {SHARD_IDS} of {SHARD_COUNT}")
+    apply_api_override()
+    bot.run(BOT_TOKEN, log_handler=None)
@@ -0,0 +1,71 @@
+import asyncio
+import discord
+
+QUERY_CHUNK_SIZE = 100  # Member IDs per gateway query (Discord's maximum)
+
+# Guild ID -> running member list fetch, shared by callers that need the same guild
+_fetching = {}
+
+
+# Bot keyword arguments for a member cache mode:
+#   "full"  caches every member of every guild, chunking them all at startup.
+#   "lazy"  caches the bot's own member in each guild and members who join
+#           while the bot is running. Operations that need a whole member
+#           list fetch it on demand through guild_members(), without
+#           caching it.
+# Discord only dispatches on_member_update for cached members, so in lazy
+# mode role changes of members who were already in a guild at startup are
+# not seen when they happen. The periodic role audit catches those.
+def member_cache_options(mode):
+    if mode == "full":
+        return {}
+    if mode == "lazy":
+        flags = discord.MemberCacheFlags.none()
+        flags.joined = True
+        return {"member_cache_flags": flags, "chunk_guilds_at_startup": False}
+    raise ValueError(f"Unknown member cache mode {mode!r}")
+
+
+async def _fetch_members(guild):
+    return [member async for member in guild.fetch_members(limit=None)]
+
+
+# Every member of a guild. From the cache when it holds the whole guild,
+# otherwise listed over the REST API and not kept. (A chunk request would
+# not do: discord.py caches its result whenever the "joined" flag is on.)
+async def guild_members(guild):
+    if guild.chunked:
+        return guild.members
+    request = _fetching.get(guild.id)
+    if request is None:
+        request = asyncio.ensure_future(_fetch_members(guild))
+        _fetching[guild.id] = request
+        request.add_done_callback(lambda _: _fetching.pop(guild.id, None))
+    return await asyncio.shield(request)
+
+
+# Every member with a role; role.members only sees cached members
+async def role_members(role):
+    if role.guild.chunked:
+        return role.members
+    return [member for member in await guild_members(role.guild) if member.get_role(role.id) is not None]
+
+
+# Members with the given IDs. Cached members are used as they are; the rest
+# are looked up with chunked gateway queries. IDs that are not members are
+# left out of the result.
+async def resolve_members(guild, member_ids, cache=False, chunk_size=QUERY_CHUNK_SIZE):
+    members = []
+    missing = []
+    for member_id in member_ids:
+        member = guild.get_member(member_id)
+        if member is None:
+            missing.append(member_id)
+        else:
+            members.append(member)
+    for start in range(0, len(missing), chunk_size):
+        try:
+            members.extend(await guild.query_members(user_ids=missing[start:start + chunk_size], cache=cache))
+        except asyncio.TimeoutError:
+            pass
+    return members
@@ -0,0 +1,202 @@
+import bisect
+import functools
+import logging
+import re
+import time
+from discord import app_commands
+from discord.ext import commands
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+# Fixed-bucket histogram: recording is a binary search and an increment,
+# and memory does not grow with the number of observations
+class Histogram:
+    __slots__ = ('counts', 'total', 'count', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+        if seconds > self.max:
+            self.max = seconds
+
+    # Upper bound of the bucket holding the given quantile (max for the last bucket)
+    def quantile(self, q):
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class HandlerStats:
+    __slots__ = ('latency', 'calls', 'errors')
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.calls = 0
+        self.errors = 0
+
+
+# Process-wide registry of handler timings, event loop lag and REST rate
+# limit waits. Handlers are named "kind:name", e.g. "event:on_message".
+class Metrics:
+    def __init__(self):
+        self.handlers = {}
+        self.loop_lag = Histogram()
+        self.rate_limit_waits = 0
+        self.rate_limit_wait_seconds = 0.0
+        self.started = time.time()
+        # Labels added to every exported series, e.g. {"cluster": "2"}
+        self.labels = {}
+
+    def observe(self, name, seconds, error=False):
+        stats = self.handlers.get(name)
+        if stats is None:
+            stats = self.handlers[name] = HandlerStats()
+        stats.latency.observe(seconds)
+        stats.calls += 1
+        if error:
+            stats.errors += 1
+
+    def record_rate_limit(self, seconds):
+        self.rate_limit_waits += 1
+        self.rate_limit_wait_seconds += seconds
+
+    # Prometheus text exposition format
+    def render_prometheus(self):
+        base = ','.join(f'{key}="{escape_label(str(value))}"' for key, value in sorted(self.labels.items()))
+
+        def handler_labels(name):
+            label = f'handler="{escape_label(name)}"'
+            return f'{base},{label}' if base else label
+
+        plain = f'{{{base}}}' if base else ''
+        lines = [
+            '# HELP bot_handler_latency_seconds Time spent in event listeners, task loops and app commands.',
+            '# TYPE bot_handler_latency_seconds histogram',
+        ]
+        for name, stats in sorted(self.handlers.items()):
+            lines.extend(histogram_lines('bot_handler_latency_seconds', handler_labels(name), stats.latency))
+        lines.append('# HELP bot_handler_calls_total Handler invocations.')
+        lines.append('# TYPE bot_handler_calls_total counter')
+        for name, stats in sorted(self.handlers.items()):
+            lines.append(f'bot_handler_calls_total{{{handler_labels(name)}}} {stats.calls}')
+        lines.append('# HELP bot_handler_errors_total Handler invocations that raised.')
+        lines.append('# TYPE bot_handler_errors_total counter')
+        for name, stats in sorted(self.handlers.items()):
+            lines.append(f'bot_handler_errors_total{{{handler_labels(name)}}} {stats.errors}')
+        lines.append('# HELP bot_event_loop_lag_seconds How late the event loop woke a sleeping task.')
+        lines.append('# TYPE bot_event_loop_lag_seconds histogram')
+        lines.extend(histogram_lines('bot_event_loop_lag_seconds', base, self.loop_lag))
+        lines.append('# HELP bot_rate_limit_waits_total REST requests that had to wait for a rate limit.')
+        lines.append('# TYPE bot_rate_limit_waits_total counter')
+        lines.append(f'bot_rate_limit_waits_total{plain} {self.rate_limit_waits}')
+        lines.append('# HELP bot_rate_limit_wait_seconds_total Time spent waiting for REST rate limits.')
+        lines.append('# TYPE bot_rate_limit_wait_seconds_total counter')
+        lines.append(f'bot_rate_limit_wait_seconds_total{plain} {self.rate_limit_wait_seconds}')
+        lines.append('# HELP bot_start_time_seconds Unix time the bot started.')
+        lines.append('# TYPE bot_start_time_seconds gauge')
+        lines.append(f'bot_start_time_seconds{plain} {self.started}')
+        return '\n'.join(lines) + '\n'
+
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def histogram_lines(metric, labels, histogram):
+    prefix = labels + ',' if labels else ''
+    cumulative = 0
+    for bound, count in zip(LATENCY_BUCKETS, histogram.counts):
+        cumulative += count
+        yield f'{metric}_bucket{{{prefix}le="{bound}"}} {cumulative}'
+    yield f'{metric}_bucket{{{prefix}le="+Inf"}} {histogram.count}'
+    suffix = f'{{{labels}}}' if labels else ''
+    yield f'{metric}_sum{suffix} {histogram.total}'
+    yield f'{metric}_count{suffix} {histogram.count}'
+
+
+metrics = Metrics()
+
+
+# Decorator recording the latency, calls and errors of a coroutine function.
+# Put it under @tasks.loop to instrument a task loop.
+def instrumented(name):
+    def decorator(coro):
+        @functools.wraps(coro)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            error = False
+            try:
+                return await coro(*args, **kwargs)
+            except Exception:
+                error = True
+                raise
+            finally:
+                metrics.observe(name, time.perf_counter() - start, error)
+        return wrapper
+    return decorator
+
+
+# Times every app command from the tree's checks to completion or error
+class InstrumentedTree(app_commands.CommandTree):
+    async def interaction_check(self, interaction):
+        interaction.extras['started'] = time.perf_counter()
+        return True
+
+    async def on_error(self, interaction, error):
+        record_command(interaction, error=True)
+        await super().on_error(interaction, error)
+
+
+def record_command(interaction, error=False):
+    started = interaction.extras.get('started')
+    if started is not None and interaction.command is not None:
+        metrics.observe(
+            f"command:{interaction.command.qualified_name}", time.perf_counter() - started, error
+        )
+
+
+# Times every event listener, including @bot.event handlers and cog
+# listeners, as "event:<qualified name>". _run_event is where discord.py
+# awaits each listener; it catches exceptions itself, so the timing wrapper
+# sits inside it to see them.
+class InstrumentedMixin:
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('tree_cls', InstrumentedTree)
+        super().__init__(*args, **kwargs)
+
+    async def _run_event(self, coro, event_name, *args, **kwargs):
+        name = f"event:{getattr(coro, '__qualname__', event_name)}"
+        await super()._run_event(instrumented(name)(coro), event_name, *args, **kwargs)
+
+
+class InstrumentedBot(InstrumentedMixin, commands.Bot):
+    pass
+
+
+class InstrumentedAutoShardedBot(InstrumentedMixin, commands.AutoShardedBot):
+    pass
+
+
+# Counts REST rate limit waits from the warnings discord.py logs for them
+class RateLimitLogHandler(logging.Handler):
+    RETRY = re.compile(r'[Rr]etrying in ([\d.]+) seconds')
+
+    def emit(self, record):
+        match = self.RETRY.search(record.getMessage())
+        if match:
+            metrics.record_rate_limit(float(match.group(1)))
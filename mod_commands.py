@@ -1,12 +1,121 @@
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord import app_commands
+import asyncio
+import logging
+import re
+from ban_index import BanIndex
+from case_store import CaseStore
+from member_cache import resolve_members
+from metrics import instrumented
+from mute_provisioning import MuteProvisioner
+from purge_pipeline import PurgePipeline
+
+# --- Configuration Values ---
+MUTED_ROLE_NAME = "Muted"  # Name of the role used by /mute
+GIVE_QUERY_CHUNK_SIZE = 100  # Member IDs per gateway query when /give misses the cache (Discord's maximum)
+GIVE_CONCURRENCY = 5  # Role grants sent at once by /give
+BAN_INDEX_ENABLED = True  # Keep a local copy of each ban list for /unban and /bans search
+MUTE_PROVISIONING_DIR = "mute_provisioning"  # Progress of setting up Muted role permissions, one file per guild
+MUTE_PROVISIONING_CONCURRENCY = 5  # Channel permission updates sent at once
+PURGE_SCAN_LIMIT = 10000  # Messages /purge looks through when filtering by author, pattern or attachments
+PURGE_SINGLE_DELETE_DELAY = 1.0  # Seconds between deletes of messages too old to bulk delete
+PURGE_PROGRESS_INTERVAL = 3  # Seconds between /purge progress updates
+MODERATION_CASES_DB_FILE = "moderation_cases.db"  # Log of warnings, bans, kicks and mutes, shared by all clusters
+CASE_COMPACTION_INTERVAL_HOURS = 6  # How often the case log's write-ahead log is folded into the database
+MODLOG_PAGE_SIZE = 10  # Cases per page of /modlog and /warns
+
+# --- End of Configuration Values ---
+
+# Cancel button shown on a running /purge's progress message
+class PurgeCancelView(discord.ui.View):
+    def __init__(self, pipeline):
+        super().__init__(timeout=None)
+        self.pipeline = pipeline
+
+    @discord.ui.button(label="Cancel", style=discord.ButtonStyle.gray)
+    async def cancel(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.pipeline.cancel()
+        await interaction.response.edit_message(content="Cancelling purge...", view=None)
 
 
 class ModeratorCommands(commands.Cog):
 
+    bans = app_commands.Group(name="bans", description="Look through the server's bans.")
+
     def __init__(self, bot):
         self.bot = bot
+        self.ban_index = BanIndex()
+        self.ban_index_tasks = set()
+        self.mute_provisioner = MuteProvisioner(
+            bot, MUTE_PROVISIONING_DIR, concurrency=MUTE_PROVISIONING_CONCURRENCY
+        )
+        self.case_store = CaseStore(MODERATION_CASES_DB_FILE)
+
+    async def cog_load(self):
+        self.compact_cases.start()
+        if self.bot.is_ready():
+            self.load_ban_indexes()
+            self.mute_provisioner.resume()
+
+    async def cog_unload(self):
+        self.compact_cases.cancel()
+        await self.case_store.close()
+
+    @tasks.loop(hours=CASE_COMPACTION_INTERVAL_HOURS)
+    @instrumented("task:compact_cases")
+    async def compact_cases(self):
+        await self.case_store.compact()
+
+    async def record_case(self, interaction, user, action, reason):
+        return await self.case_store.add(
+            interaction.guild.id, user.id, interaction.user.id, action, reason
+        )
+
+    def format_case(self, case):
+        line = f"**#{case.case_id}** {case.action} <t:{int(case.created_at)}:d> by <@{case.moderator_id}>"
+        if case.reason:
+            line += f": {case.reason}"
+        return line
+
+    # Load the ban list of every guild not loaded yet in the background.
+    # With reload, the given guilds are forgotten and loaded again.
+    def load_ban_indexes(self, guilds=None, reload=False):
+        if not BAN_INDEX_ENABLED:
+            return
+        for guild in self.bot.guilds if guilds is None else guilds:
+            if reload:
+                self.ban_index.forget(guild.id)
+            if not self.ban_index.is_loaded(guild.id) and not self.ban_index.is_loading(guild.id):
+                task = asyncio.create_task(self.load_ban_index(guild))
+                self.ban_index_tasks.add(task)
+                task.add_done_callback(self.ban_index_tasks.discard)
+
+    async def load_ban_index(self, guild):
+        try:
+            await self.ban_index.load(guild)
+        except discord.HTTPException as e:
+            logging.error(f"Failed to load the ban list of {guild}: {e}")
+
+    @commands.Cog.listener()
+    async def on_member_ban(self, guild, user):
+        self.ban_index.add(guild.id, user)
+
+    @commands.Cog.listener()
+    async def on_member_unban(self, guild, user):
+        self.ban_index.remove(guild.id, user.id)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_create(self, channel):
+        await self.mute_provisioner.on_channel_create(channel)
+
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild):
+        self.load_ban_indexes()
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild):
+        self.ban_index.forget(guild.id)
 
     # Ban Command
     @discord.app_commands.command(
@@ -25,6 +134,7 @@ class ModeratorCommands(commands.Cog):
         reason: str = "No reason provided"
     ):
         await member.ban(reason=reason)
+        await self.record_case(interaction, member, "ban", reason)
         await interaction.response.send_message(
             f"{member.display_name} has been banned for: {reason}", ephemeral=True
         )
@@ -46,6 +156,7 @@ class ModeratorCommands(commands.Cog):
         reason: str = "No reason provided"
     ):
         await member.kick(reason=reason)
+        await self.record_case(interaction, member, "kick", reason)
         await interaction.response.send_message(
             f"{member.display_name} has been kicked. Reason: {reason}"
         )
@@ -61,18 +172,63 @@ class ModeratorCommands(commands.Cog):
         interaction: discord.Interaction,
         user: discord.User
     ):
-        banned_users = await interaction.guild.bans()
-        for ban_entry in banned_users:
-            if ban_entry.user == user:
-                await interaction.guild.unban(user)
-                await interaction.response.send_message(
-                    f"{user.mention} has been unbanned."
-                )
-                return
+        guild = interaction.guild
+        # Check just this user: locally if the ban list is indexed. The index
+        # can lag behind Discord, so "not banned" is confirmed with one REST call.
+        banned = self.ban_index.is_banned(guild.id, user.id)
+        if not banned:
+            try:
+                await guild.fetch_ban(user)
+                banned = True
+            except discord.NotFound:
+                banned = False
+
+        if banned:
+            try:
+                await guild.unban(user)
+            except discord.NotFound:
+                # Already unbanned elsewhere
+                banned = False
+            self.ban_index.remove(guild.id, user.id)
+        if banned:
+            await interaction.response.send_message(
+                f"{user.mention} has been unbanned."
+            )
+            return
         await interaction.response.send_message(
             f"{user.mention} is not banned."
         )
 
+    # Ban Search Command
+    @bans.command(
+        name="search",
+        description="Search banned users by username."
+    )
+    @app_commands.describe(prefix="The start of the username")
+    @app_commands.checks.has_permissions(ban_members=True)
+    async def bans_search(
+        self,
+        interaction: discord.Interaction,
+        prefix: str
+    ):
+        if not self.ban_index.is_loaded(interaction.guild.id):
+            await interaction.response.send_message(
+                "The ban list is not loaded. Try again in a moment.", ephemeral=True
+            )
+            return
+
+        results = self.ban_index.search(interaction.guild.id, prefix)
+        if not results:
+            await interaction.response.send_message(
+                f"No banned users found starting with '{prefix}'.", ephemeral=True
+            )
+            return
+
+        lines = [f"{name} ({user_id})" for user_id, name in results]
+        await interaction.response.send_message(
+            "Banned users:\n" + "\n".join(lines), ephemeral=True
+        )
+
     # Mute Command
     @app_commands.command(
         name="mute",
@@ -85,18 +241,15 @@ class ModeratorCommands(commands.Cog):
         member: discord.Member,
         reason: str = None
     ):
-        mute_role = discord.utils.get(interaction.guild.roles, name="Muted")
+        entity_cache = self.bot.get_cog("EntityCache")
+        mute_role = entity_cache.get_role(interaction.guild, MUTED_ROLE_NAME)
         if not mute_role:
-            mute_role = await interaction.guild.create_role(name="Muted")
-            for channel in interaction.guild.channels:
-                await channel.set_permissions(
-                    mute_role,
-                    speak=False,
-                    send_messages=False,
-                    read_message_history=True,
-                    read_messages=False
-                )
+            mute_role = await interaction.guild.create_role(name=MUTED_ROLE_NAME)
+            entity_cache.invalidate(entity_cache.roles, interaction.guild.id, MUTED_ROLE_NAME)
+            # Channel overwrites are set up in the background
+            self.mute_provisioner.start(interaction.guild, mute_role)
         await member.add_roles(mute_role, reason=reason)
+        await self.record_case(interaction, member, "mute", reason)
         await interaction.response.send_message(
             f"{member.mention} has been muted for {reason}."
         )
@@ -112,7 +265,7 @@ class ModeratorCommands(commands.Cog):
         interaction: discord.Interaction,
         member: discord.Member
     ):
-        mute_role = discord.utils.get(interaction.guild.roles, name="Muted")
+        mute_role = self.bot.get_cog("EntityCache").get_role(interaction.guild, MUTED_ROLE_NAME)
         if mute_role in member.roles:
             await member.remove_roles(mute_role)
             await interaction.response.send_message(
@@ -128,16 +281,53 @@ class ModeratorCommands(commands.Cog):
         name="purge",
         description="Purge a number of messages from a channel."
     )
+    @app_commands.describe(
+        amount="Number of matching messages to delete",
+        author="Only delete messages from this user",
+        pattern="Only delete messages matching this regular expression",
+        attachments="Only delete messages with attachments"
+    )
     @app_commands.checks.has_permissions(manage_messages=True)
     async def purge(
         self,
         interaction: discord.Interaction,
-        amount: int
+        amount: app_commands.Range[int, 1],
+        author: discord.User = None,
+        pattern: str = None,
+        attachments: bool = False
     ):
-        await interaction.channel.purge(limit=amount)
-        await interaction.response.send_message(
-            f"Purged {amount} messages.", ephemeral=True
+        try:
+            compiled = re.compile(pattern) if pattern else None
+        except re.error as e:
+            await interaction.response.send_message(f"Invalid pattern: {e}", ephemeral=True)
+            return
+
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        pipeline = PurgePipeline(
+            interaction.channel, amount, author=author, pattern=compiled,
+            attachments_only=attachments, scan_limit=PURGE_SCAN_LIMIT,
+            single_delete_delay=PURGE_SINGLE_DELETE_DELAY
         )
+        view = PurgeCancelView(pipeline)
+        await interaction.edit_original_response(content=pipeline.progress_text(), view=view)
+
+        # Report progress while the pipeline runs
+        run = asyncio.create_task(pipeline.run())
+        while not run.done():
+            await asyncio.wait({run}, timeout=PURGE_PROGRESS_INTERVAL)
+            if not run.done():
+                await self.report_purge_progress(interaction, pipeline.progress_text(), view)
+        view.stop()
+        await self.report_purge_progress(interaction, pipeline.progress_text(finished=True), None)
+        run.result()
+
+    # The interaction token expires after 15 minutes, so very long purges
+    # stop being able to report; the purge itself keeps going
+    async def report_purge_progress(self, interaction, content, view):
+        try:
+            await interaction.edit_original_response(content=content, view=view)
+        except discord.HTTPException:
+            pass
 
     # Announce Command
     @app_commands.command(
@@ -170,8 +360,9 @@ class ModeratorCommands(commands.Cog):
         *,
         reason: str = None
     ):
+        case_id = await self.record_case(interaction, member, "warn", reason)
         await interaction.response.send_message(
-            f"{member.mention} has been warned for {reason}.", ephemeral=True
+            f"{member.mention} has been warned for {reason} (case #{case_id}).", ephemeral=True
         )
         await member.send(
             f"You have been warned in {interaction.guild.name} for: {reason}"
@@ -188,9 +379,46 @@ class ModeratorCommands(commands.Cog):
         interaction: discord.Interaction,
         member: discord.Member
     ):
-        # Placeholder for warn listing logic
+        await self.send_cases(interaction, member, "warn", 1)
+
+    # Moderation History Command
+    @app_commands.command(
+        name="modlog",
+        description="Show a user's moderation history."
+    )
+    @app_commands.describe(
+        user="The user to look up",
+        page="Page of the history, newest first"
+    )
+    @app_commands.checks.has_permissions(manage_messages=True)
+    async def modlog(
+        self,
+        interaction: discord.Interaction,
+        user: discord.User,
+        page: app_commands.Range[int, 1] = 1
+    ):
+        await self.send_cases(interaction, user, None, page)
+
+    async def send_cases(self, interaction, user, action, page):
+        guild_id = interaction.guild.id
+        total = self.case_store.count(guild_id, user.id, action)
+        kind = "warnings" if action == "warn" else "moderation cases"
+        if total == 0:
+            await interaction.response.send_message(
+                f"{user.mention} has no {kind}.", ephemeral=True
+            )
+            return
+
+        pages = (total + MODLOG_PAGE_SIZE - 1) // MODLOG_PAGE_SIZE
+        page = min(page, pages)
+        cases = self.case_store.history(
+            guild_id, user.id, action,
+            limit=MODLOG_PAGE_SIZE, offset=(page - 1) * MODLOG_PAGE_SIZE
+        )
+        lines = [self.format_case(case) for case in cases]
         await interaction.response.send_message(
-            f"{member.mention} has no warnings.", ephemeral=True
+            f"{user.mention} has {total} {kind} (page {page}/{pages}):\n" + "\n".join(lines),
+            ephemeral=True
         )
 
     # Give Role Command
@@ -210,27 +438,56 @@ class ModeratorCommands(commands.Cog):
         users: str
     ):
         await interaction.response.defer(ephemeral=True)
-        user_ids = [user_id.strip() for user_id in users.split(' ')]
+        guild = interaction.guild
         success_users = []
+        already_users = []
         failed_users = []
-        for user_id in user_ids:
-            try:
-                user = await interaction.guild.fetch_member(int(user_id.strip('<@!>')))
-                if role.position < interaction.guild.me.top_role.position:
-                    await user.add_roles(role)
-                    success_users.append(user.display_name)
-                else:
+
+        if role.position >= guild.me.top_role.position:
+            failed_users = users.split()
+            member_ids = {}
+        else:
+            # Map each requested member ID to the text it was given as
+            member_ids = {}
+            for user_id in users.split():
+                try:
+                    member_ids.setdefault(int(user_id.strip('<@!>')), user_id)
+                except ValueError:
                     failed_users.append(user_id)
-            except (discord.NotFound, discord.Forbidden, ValueError):
-                failed_users.append(user_id)
+
+        # Members come from the gateway cache first; misses are fetched with
+        # chunked member queries instead of one REST call per user
+        members = await resolve_members(guild, list(member_ids), cache=True, chunk_size=GIVE_QUERY_CHUNK_SIZE)
+        found_ids = {member.id for member in members}
+        failed_users.extend(text for member_id, text in member_ids.items() if member_id not in found_ids)
+
+        semaphore = asyncio.Semaphore(GIVE_CONCURRENCY)
+
+        async def give(member):
+            if member.get_role(role.id) is not None:
+                already_users.append(member.display_name)
+                return
+            async with semaphore:
+                try:
+                    await member.add_roles(role)
+                    success_users.append(member.display_name)
+                except (discord.NotFound, discord.Forbidden, discord.HTTPException):
+                    failed_users.append(member_ids[member.id])
+
+        await asyncio.gather(*(give(member) for member in members))
+
         messages = []
         if success_users:
             messages.append(
-                f"Successfully given {role.name} to {', '.join(success_users)}."
+                f"Successfully given {role.name} to {self.summarize(success_users)}."
+            )
+        if already_users:
+            messages.append(
+                f"{self.summarize(already_users)} already had {role.name}."
             )
         if failed_users:
             messages.append(
-                f"Failed to give {role.name} to {', '.join(failed_users)}. "
+                f"Failed to give {role.name} to {self.summarize(failed_users)}. "
                 "Check if they're valid users and if I have the correct permissions."
             )
         for message in messages:
@@ -240,9 +497,24 @@ class ModeratorCommands(commands.Cog):
                 allowed_mentions=discord.AllowedMentions.none()
             )
 
+    # Join names for a reply, cutting long lists short to fit in one message
+    def summarize(self, names, limit=50):
+        if len(names) <= limit:
+            return ', '.join(names)
+        return f"{', '.join(names[:limit])} and {len(names) - limit} more"
+
+    # Ready follows every new gateway session (not a resume). Ban events
+    # missed while disconnected are not replayed, so ban lists are reloaded.
     @commands.Cog.listener()
     async def on_ready(self):
-        print(f'Logged in as {self.bot.user}')
+        logging.info(f'Logged in as {self.bot.user}')
+        if not isinstance(self.bot, discord.AutoShardedClient):
+            self.load_ban_indexes(reload=True)
+        self.mute_provisioner.resume()
+
+    @commands.Cog.listener()
+    async def on_shard_ready(self, shard_id):
+        self.load_ban_indexes([guild for guild in self.bot.guilds if guild.shard_id == shard_id], reload=True)
 
 async def setup(bot):
     await bot.add_cog(ModeratorCommands(bot))
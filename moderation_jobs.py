@@ -0,0 +1,252 @@
+import asyncio
+import json
+import logging
+import secrets
+import time
+import discord
+from discord.ext import commands
+from state_files import GuildFiles
+
+# --- Configuration Values ---
+MODERATION_JOBS_DIR = "moderation_jobs"  # Checkpoints of bulk ban/kick jobs, one file per guild
+JOB_CONCURRENCY = 5  # Bans/kicks in flight at once (they share one rate limit bucket per guild)
+JOB_CHECKPOINT_INTERVAL = 5  # Seconds between progress checkpoints and progress message edits
+JOB_HISTORY_LIMIT = 20  # Finished jobs kept in each guild's checkpoint file
+
+# --- End of Configuration Values ---
+
+CANCEL_PREFIX = "moderation_job_cancel:"
+
+ACTIONS = {
+    "ban": ("Banning", "Banned"),
+    "kick": ("Kicking", "Kicked"),
+}
+
+
+# Background engine for bulk bans and kicks.
+# Each job works through its member IDs a few at a time, checkpoints its
+# position to disk so it resumes after a restart, keeps a progress message
+# up to date and can be cancelled from that message.
+class ModerationJobs(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        self.files = GuildFiles(MODERATION_JOBS_DIR)
+        self.jobs = self.load_jobs()
+        self.tasks = {}
+        self.save_lock = asyncio.Lock()
+
+    async def cog_load(self):
+        if self.bot.is_ready():
+            self.resume_jobs()
+
+    async def cog_unload(self):
+        for task in self.tasks.values():
+            task.cancel()
+        for guild_id in {job["guild_id"] for job in self.jobs.values()}:
+            await self.save_jobs(guild_id)
+
+    def load_jobs(self):
+        jobs = {}
+        for data in self.files.read_all().values():
+            jobs.update(json.loads(data))
+        return jobs
+
+    # Write a guild's jobs atomically in a worker thread
+    async def save_jobs(self, guild_id):
+        async with self.save_lock:
+            jobs = {job_id: job for job_id, job in self.jobs.items() if job["guild_id"] == guild_id}
+            await asyncio.to_thread(self.files.write, guild_id, json.dumps(jobs) if jobs else None)
+
+    # Start a job and return its ID. The progress message is posted in channel.
+    async def start_job(self, guild, channel, action, member_ids, reason, initiator, description):
+        job_id = secrets.token_hex(4)
+        job = {
+            "guild_id": guild.id,
+            "channel_id": channel.id,
+            "message_id": None,
+            "action": action,
+            "reason": reason,
+            "initiator_id": initiator.id,
+            "description": description,
+            "member_ids": list(member_ids),
+            "next_index": 0,
+            "attempted": 0,
+            "succeeded": 0,
+            "failed": [],
+            "status": "running",
+            "created_at": time.time(),
+        }
+        self.jobs[job_id] = job
+        message = await channel.send(self.progress_text(job), view=self.cancel_view(job_id))
+        job["message_id"] = message.id
+        await self.save_jobs(guild.id)
+        self.tasks[job_id] = asyncio.create_task(self.run_job(job_id))
+        return job_id
+
+    def resume_jobs(self):
+        for job_id, job in self.jobs.items():
+            if job["status"] == "running" and job_id not in self.tasks:
+                logging.info(f"Resuming moderation job {job_id} at {job['next_index']}/{len(job['member_ids'])}")
+                self.tasks[job_id] = asyncio.create_task(self.run_job(job_id, resumed=True))
+
+    # A resumed job redoes the work done since its last checkpoint, so
+    # members it already banned or kicked may come back as not found. Only
+    # members below "attempted", which is saved before each batch starts,
+    # can have been handled before the restart.
+    async def run_job(self, job_id, resumed=False):
+        job = self.jobs[job_id]
+        attempted = job["attempted"] if resumed else 0
+        guild = self.bot.get_guild(job["guild_id"])
+        if guild is None:
+            logging.error(f"Guild for moderation job {job_id} not found.")
+            job["status"] = "failed"
+            await self.save_jobs(job["guild_id"])
+            return
+
+        semaphore = asyncio.Semaphore(JOB_CONCURRENCY)
+        last_checkpoint = time.monotonic()
+        try:
+            while job["status"] == "running" and job["next_index"] < len(job["member_ids"]):
+                start = job["next_index"]
+                chunk = job["member_ids"][start:start + JOB_CONCURRENCY]
+                job["attempted"] = start + len(chunk)
+                await self.save_jobs(guild.id)
+                results = await asyncio.gather(*(
+                    self.apply_action(guild, job_id, job, member_id, semaphore, start + i < attempted)
+                    for i, member_id in enumerate(chunk)
+                ))
+                for member_id, ok in zip(chunk, results):
+                    if ok:
+                        job["succeeded"] += 1
+                    else:
+                        job["failed"].append(member_id)
+                job["next_index"] = start + len(chunk)
+
+                if time.monotonic() - last_checkpoint >= JOB_CHECKPOINT_INTERVAL:
+                    last_checkpoint = time.monotonic()
+                    await self.save_jobs(guild.id)
+                    await self.update_message(job_id, job)
+
+            if job["status"] == "running":
+                job["status"] = "done"
+            self.prune_jobs(guild.id)
+            await self.save_jobs(guild.id)
+            await self.update_message(job_id, job, finished=True)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logging.exception(f"Moderation job {job_id} stopped unexpectedly")
+            job["status"] = "failed"
+            try:
+                await self.save_jobs(guild.id)
+                await self.update_message(job_id, job, finished=True)
+            except Exception:
+                logging.exception(f"Failed to record the failure of moderation job {job_id}")
+        finally:
+            self.tasks.pop(job_id, None)
+
+    # maybe_done: the member may have been handled before a restart
+    async def apply_action(self, guild, job_id, job, member_id, semaphore, maybe_done=False):
+        async with semaphore:
+            try:
+                target = discord.Object(id=member_id)
+                if job["action"] == "ban":
+                    await guild.ban(target, reason=job["reason"])
+                else:
+                    await guild.kick(target, reason=job["reason"])
+                logging.info(f"{ACTIONS[job['action']][1]} member ID {member_id} (job {job_id})")
+                return True
+            except discord.NotFound as e:
+                if maybe_done:
+                    # Most likely handled before the restart
+                    return True
+                logging.error(f"Failed to {job['action']} member ID {member_id}: {e}")
+                return False
+            except discord.HTTPException as e:
+                logging.error(f"Failed to {job['action']} member ID {member_id}: {e}")
+                return False
+            except Exception:
+                logging.exception(f"Failed to {job['action']} member ID {member_id}")
+                return False
+
+    # Drop a guild's oldest finished jobs beyond JOB_HISTORY_LIMIT
+    def prune_jobs(self, guild_id):
+        finished = sorted(
+            (job["created_at"], job_id) for job_id, job in self.jobs.items()
+            if job["guild_id"] == guild_id and job["status"] != "running"
+        )
+        for _, job_id in finished[:max(0, len(finished) - JOB_HISTORY_LIMIT)]:
+            del self.jobs[job_id]
+
+    def progress_text(self, job, finished=False):
+        doing, done = ACTIONS[job["action"]]
+        total = len(job["member_ids"])
+        processed = job["next_index"]
+        failed = len(job["failed"])
+        if not finished:
+            return f"{doing} {total} members with {job['description']}: {processed}/{total} processed, {failed} failed."
+        if job["status"] == "cancelled":
+            return (
+                f"Cancelled after {processed}/{total} members with {job['description']}. "
+                f"{done} {job['succeeded']}, {failed} failed."
+            )
+        if job["status"] == "failed":
+            text = (
+                f"Stopped by an error after {processed}/{total} members with {job['description']}. "
+                f"{done} {job['succeeded']}, {failed} failed."
+            )
+        else:
+            text = f"{done} {job['succeeded']} of {total} members with {job['description']}. {failed} failed."
+        if job["failed"]:
+            shown = ", ".join(str(member_id) for member_id in job["failed"][:20])
+            more = f" and {failed - 20} more" if failed > 20 else ""
+            text += f"\nFailed member IDs: {shown}{more}"
+        return text
+
+    def cancel_view(self, job_id):
+        view = discord.ui.View(timeout=None)
+        view.add_item(discord.ui.Button(
+            label="Cancel", style=discord.ButtonStyle.gray, custom_id=f"{CANCEL_PREFIX}{job_id}"
+        ))
+        return view
+
+    async def update_message(self, job_id, job, finished=False):
+        channel = self.bot.get_channel(job["channel_id"])
+        if channel is None or job["message_id"] is None:
+            return
+        try:
+            await channel.get_partial_message(job["message_id"]).edit(
+                content=self.progress_text(job, finished),
+                view=None if finished else self.cancel_view(job_id)
+            )
+        except discord.HTTPException as e:
+            logging.error(f"Failed to update progress of moderation job {job_id}: {e}")
+
+    # Cancel buttons are handled here rather than by registered views so
+    # they keep working for jobs resumed after a restart
+    @commands.Cog.listener()
+    async def on_interaction(self, interaction):
+        if interaction.type != discord.InteractionType.component:
+            return
+        custom_id = (interaction.data or {}).get("custom_id", "")
+        if not custom_id.startswith(CANCEL_PREFIX):
+            return
+
+        job = self.jobs.get(custom_id[len(CANCEL_PREFIX):])
+        if job is None or job["status"] != "running":
+            await interaction.response.send_message("This job is no longer running.", ephemeral=True)
+            return
+        if interaction.user.id != job["initiator_id"] and not interaction.user.guild_permissions.administrator:
+            await interaction.response.send_message("You cannot cancel this action.", ephemeral=True)
+            return
+
+        job["status"] = "cancelled"
+        await interaction.response.send_message("Cancelling after the current batch.", ephemeral=True)
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        self.resume_jobs()
+
+
+async def setup(bot):
+    await bot.add_cog(ModerationJobs(bot))
@@ -0,0 +1,130 @@
+import asyncio
+import json
+import logging
+import discord
+from state_files import GuildFiles
+
+
+# Overwrite applied to the Muted role in every channel
+def muted_overwrite():
+    return discord.PermissionOverwrite(
+        speak=False,
+        send_messages=False,
+        read_message_history=True,
+        read_messages=False
+    )
+
+
+# Sets up the Muted role's channel overwrites in the background.
+# Categories are done first. Changing a category's overwrites takes its
+# channels out of sync, so the channels that were synced with their
+# category when provisioning started (recorded in the checkpoint) are
+# re-synced after it instead of given their own overwrite, and stay synced.
+# Channels that already carry the overwrite (for example ones created in a
+# configured category, which inherit it) are skipped. Finished channel IDs
+# are checkpointed to one JSON file per guild in state_directory so a
+# restart resumes where it stopped.
+class MuteProvisioner:
+    def __init__(self, bot, state_directory, concurrency=5, checkpoint_every=25):
+        self.bot = bot
+        self.files = GuildFiles(state_directory)
+        self.concurrency = concurrency
+        self.checkpoint_every = checkpoint_every
+        self.state = self.load_state()
+        self.tasks = {}
+
+    def load_state(self):
+        return {str(guild_id): json.loads(data) for guild_id, data in self.files.read_all().items()}
+
+    async def save_state(self, guild_id):
+        data = json.dumps(self.state[str(guild_id)])
+        await asyncio.to_thread(self.files.write, guild_id, data)
+
+    def is_running(self, guild_id):
+        task = self.tasks.get(guild_id)
+        return task is not None and not task.done()
+
+    # Start provisioning a guild's Muted role unless it is already running
+    def start(self, guild, role):
+        if self.is_running(guild.id):
+            return
+        state = self.state.get(str(guild.id))
+        if state is None or state["role_id"] != role.id:
+            self.state[str(guild.id)] = {"role_id": role.id, "done": [], "complete": False}
+        self.tasks[guild.id] = asyncio.create_task(self.provision(guild, role))
+
+    # Restart provisioning interrupted by a restart
+    def resume(self):
+        for guild_id, state in self.state.items():
+            if state["complete"]:
+                continue
+            guild = self.bot.get_guild(int(guild_id))
+            role = guild.get_role(state["role_id"]) if guild else None
+            if role is not None:
+                self.start(guild, role)
+
+    def needs_overwrite(self, channel, role):
+        return channel.overwrites_for(role) != muted_overwrite()
+
+    # Give a channel the overwrite, or copy its category's if resync
+    async def apply(self, channel, role, resync=False):
+        if resync:
+            await channel.edit(sync_permissions=True)
+        else:
+            await channel.set_permissions(role, overwrite=muted_overwrite())
+
+    async def provision(self, guild, role):
+        state = self.state[str(guild.id)]
+        done = set(state["done"])
+        # Taken before any category changes, which unsync its channels
+        if "synced" not in state:
+            state["synced"] = [
+                channel.id for channel in guild.channels
+                if channel.category is not None and channel.permissions_synced
+            ]
+            await self.save_state(guild.id)
+        synced = set(state["synced"])
+        semaphore = asyncio.Semaphore(self.concurrency)
+        finished_since_checkpoint = 0
+
+        async def provision_channel(channel):
+            nonlocal finished_since_checkpoint
+            if channel.id not in done and self.needs_overwrite(channel, role):
+                # Its category is done by now if it was provisioned at all
+                resync = channel.id in synced and channel.category_id in done
+                async with semaphore:
+                    try:
+                        await self.apply(channel, role, resync)
+                    except discord.HTTPException as e:
+                        logging.error(f"Failed to set Muted permissions in {channel}: {e}")
+                        return
+            done.add(channel.id)
+            state["done"].append(channel.id)
+            finished_since_checkpoint += 1
+            if finished_since_checkpoint >= self.checkpoint_every:
+                finished_since_checkpoint = 0
+                await self.save_state(guild.id)
+
+        # Categories first, so synced channels can be re-synced with them
+        await asyncio.gather(*(provision_channel(category) for category in guild.categories))
+        await asyncio.gather(*(
+            provision_channel(channel) for channel in guild.channels
+            if not isinstance(channel, discord.CategoryChannel)
+        ))
+
+        state["complete"] = all(channel.id in done for channel in guild.channels)
+        await self.save_state(guild.id)
+        logging.info(f"Muted role set up in {len(done)} channels of {guild}.")
+
+    # Cover a channel created after provisioning
+    async def on_channel_create(self, channel):
+        state = self.state.get(str(channel.guild.id))
+        if state is None:
+            return
+        role = channel.guild.get_role(state["role_id"])
+        if role is None or not self.needs_overwrite(channel, role):
+            return
+        try:
+            await self.apply(channel, role)
+        except discord.HTTPException as e:
+            logging.error(f"Failed to set Muted permissions in {channel}: {e}")
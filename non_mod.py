@@ -1,13 +1,37 @@
 import discord
-from discord.ext import commands
-import random
+from discord.ext import commands, tasks
+import asyncio
 import json
-import os
-import time
+import logging
+import random
+from cluster import CLUSTER_ID
+from cooldowns import CooldownSettings, CooldownTracker
+from level_storage import LevelRecord, open_level_store, read_level_file
+from leaderboard import LeaderboardIndex
+from level_math import levels_for, totals_for
+from level_outbox import LevelUpOutbox
+from member_cache import guild_members, role_members
+from metrics import instrumented
+from state_files import SharedFile
 
 # --- Configuration Values ---
-VERIFIED_ROLE_ID = 123456789012345678  # Replace with your verified role ID
-VERIFIED_PLUS_ROLE_ID = 123456789012345678  # Replace with your verified plus role ID
+LEVEL_REWARDS = ((5, "verified_role_id"), (10, "verified_plus_role_id"))  # (global level, guild setting of the role granted)
+LEVELS_BACKEND = "json"  # Level storage backend: "json" or "sqlite"
+LEVELS_FILE = "levels.json"  # Level data used by the "json" backend
+LEVELS_DB_FILE = "levels.db"  # SQLite database used by the "sqlite" backend, and shared by all clusters
+LEVELS_FLUSH_INTERVAL = 10  # Seconds between background saves of the levels file
+LEVELS_FLUSH_THRESHOLD = 500  # Save early once this many users have unsaved changes
+LEADERBOARD_PAGE_SIZE = 10  # Users shown per /leaderboard page
+LEADERBOARD_REFRESH_INTERVAL = 60  # Seconds between leaderboard rebuilds when clusters share the levels
+XP_COOLDOWN_SECONDS = 30  # Default seconds between messages that earn XP
+XP_COOLDOWNS_FILE = "xp_cooldowns.json"  # Per-guild and per-channel cooldown overrides
+XP_CURVE_COEFFICIENT = 50  # Default XP curve: going from level L to L + 1 costs this * L**2 XP
+LEVEL_SETTINGS_FILE = "level_settings.json"  # Stores the XP curve set with /xp_curve
+BULK_XP_BATCH_SIZE = 10000  # Users processed per batch before yielding to the event loop
+ROLE_REWARD_CONCURRENCY = 5  # Role grants sent at once when reconciling level rewards
+LEVEL_UP_DIGEST_INTERVAL = 5  # Seconds between level-up announcement batches
+LEVEL_UP_DIGEST_THRESHOLD = 3  # Level-ups in one channel and batch that become a single digest
+LEVEL_UP_DM_WORKERS = 3  # Level-up DMs and reward roles sent at once
 
 # --- End of Configuration Values ---
 
@@ -32,27 +56,192 @@ class FunAndLevelCommands(commands.Cog):
             "My reply is no.", "My sources say no.", "Outlook not so good.",
             "Very doubtful."
         ]
-        self.levels_file = 'levels.json'
-        self.levels = self.load_levels()
-        self.verified_role_id = VERIFIED_ROLE_ID
-        self.verified_plus_role_id = VERIFIED_PLUS_ROLE_ID
-
-    # Load levels from file
-    def load_levels(self):
-        if os.path.exists(self.levels_file):
-            with open(self.levels_file, 'r') as f:
-                return json.load(f)
-        else:
-            return {}
+        # Clusters share one database; see SqliteLevelStore
+        self.level_store = open_level_store(
+            LEVELS_BACKEND, LEVELS_FILE, LEVELS_DB_FILE,
+            merge=self.merge_level_rows if CLUSTER_ID is not None else None
+        )
+        self.level_outbox = LevelUpOutbox(
+            interval=LEVEL_UP_DIGEST_INTERVAL,
+            digest_threshold=LEVEL_UP_DIGEST_THRESHOLD,
+            workers=LEVEL_UP_DM_WORKERS
+        )
+        self.pending_flush = None
+        self.leaderboard = LeaderboardIndex(page_size=LEADERBOARD_PAGE_SIZE)
+        self.xp_cooldowns = CooldownTracker()
+        self.cooldown_settings = CooldownSettings(XP_COOLDOWNS_FILE, XP_COOLDOWN_SECONDS)
+        self.level_settings = SharedFile(LEVEL_SETTINGS_FILE, {})
+        self.xp_curve = self.load_level_settings().get('xp_curve', XP_CURVE_COEFFICIENT)
+
+    async def cog_load(self):
+        self.leaderboard = LeaderboardIndex.from_records(
+            self.level_store.iter_records(), page_size=LEADERBOARD_PAGE_SIZE
+        )
+        self.flush_levels_loop.start()
+        if CLUSTER_ID is not None:
+            self.refresh_leaderboard.start()
+        self.level_outbox.start()
+
+    async def cog_unload(self):
+        # Also runs from bot.close(), so pending changes are saved on shutdown
+        self.flush_levels_loop.cancel()
+        self.refresh_leaderboard.cancel()
+        await self.level_outbox.close()
+        await self.flush_levels()
+        await self.level_store.close()
 
-    # Save levels to file
-    def save_levels(self):
-        with open(self.levels_file, 'w') as f:
-            json.dump(self.levels, f, indent=4)
+    # Store a user's level data and save early if enough changes have piled up
+    def save_user_level(self, user_id, user_data):
+        self.level_store.update(user_id, user_data)
+        if len(self.level_store.dirty_users) >= LEVELS_FLUSH_THRESHOLD and not self.level_store.flush_lock.locked():
+            if self.pending_flush is None or self.pending_flush.done():
+                self.pending_flush = asyncio.create_task(self.flush_levels())
+
+    # Persist pending level changes through the storage backend
+    async def flush_levels(self):
+        try:
+            await self.level_store.flush()
+        except Exception as e:
+            logging.error(f"Failed to save levels: {e}")
+
+    @tasks.loop(seconds=LEVELS_FLUSH_INTERVAL)
+    @instrumented("task:flush_levels_loop")
+    async def flush_levels_loop(self):
+        await self.flush_levels()
+        self.reload_shared_settings()
+
+    # Load level settings from file
+    def load_level_settings(self):
+        return self.level_settings.read()
+
+    # Save level settings to file
+    def save_level_settings(self):
+        self.level_settings.write({'xp_curve': self.xp_curve})
+
+    # Pick up XP curve and cooldown changes made by other bot processes
+    def reload_shared_settings(self):
+        if self.level_settings.changed():
+            self.xp_curve = self.load_level_settings().get('xp_curve', XP_CURVE_COEFFICIENT)
+        self.cooldown_settings.reload_if_changed()
+
+    # Combine a user's (xp, level) row as changed here with the row another
+    # cluster saved since it was read: the XP gained or lost here is applied
+    # to the saved total. Called by the level store while it saves.
+    def merge_level_rows(self, read_row, own_row, current_row):
+        rows = (read_row, own_row, current_row)
+        read_total, own_total, current_total = totals_for(
+            [level for _, level in rows], [xp for xp, _ in rows], self.xp_curve
+        )
+        levels, xps = levels_for([max(0, current_total + own_total - read_total)], self.xp_curve)
+        return xps[0], levels[0]
+
+    # Rebuild the leaderboard from the levels shared with other clusters,
+    # with the changes not saved yet applied on top
+    @tasks.loop(seconds=LEADERBOARD_REFRESH_INTERVAL)
+    @instrumented("task:refresh_leaderboard")
+    async def refresh_leaderboard(self):
+        leaderboard = await asyncio.to_thread(
+            lambda: LeaderboardIndex.from_records(read_level_file(LEVELS_DB_FILE), page_size=LEADERBOARD_PAGE_SIZE)
+        )
+        for user_id in list(self.level_store.dirty_users):
+            user_data = self.level_store.get(user_id)
+            leaderboard.update(user_id, user_data.level, user_data.xp)
+        self.leaderboard = leaderboard
 
     # Get XP required for next level
     def get_xp_for_next_level(self, current_level):
-        return 50 * (current_level ** 2)
+        return self.xp_curve * (current_level ** 2)
+
+    # Set each user's total XP to new_total(user_id, current_total) using the
+    # closed-form curve, one column-wise batch at a time. A batch reads its
+    # records when it is applied, so XP earned while earlier batches ran is
+    # kept. new_curve is the curve to compute the new levels with, if not
+    # the current one. Returns {user_id: new level}.
+    async def apply_total_xp(self, user_ids, new_total, new_curve=None):
+        if new_curve is None:
+            new_curve = self.xp_curve
+        new_levels = {}
+        for start in range(0, len(user_ids), BULK_XP_BATCH_SIZE):
+            batch = user_ids[start:start + BULK_XP_BATCH_SIZE]
+            records = [self.level_store.get(user_id) or LevelRecord() for user_id in batch]
+            totals = totals_for([r.level for r in records], [r.xp for r in records], self.xp_curve)
+            levels, xps = levels_for(
+                [max(0, new_total(user_id, total)) for user_id, total in zip(batch, totals)], new_curve
+            )
+            for user_id, user_data, level, xp in zip(batch, records, levels, xps):
+                user_data.level = level
+                user_data.xp = xp
+                self.level_store.update(user_id, user_data)
+                self.leaderboard.update(user_id, level, xp)
+                new_levels[user_id] = level
+            # Let the gateway breathe between batches
+            await asyncio.sleep(0)
+        await self.flush_levels()
+        return new_levels
+
+    # (level, role ID) pairs granted when a member of the guild reaches the level
+    def level_rewards(self, guild_id):
+        config = self.bot.get_cog("GuildSettings").get(guild_id)
+        return [
+            (required_level, getattr(config, setting)) for required_level, setting in LEVEL_REWARDS
+            if getattr(config, setting) is not None
+        ]
+
+    # Grant level reward roles that members are missing as one batch of
+    # role changes. Rewards are never taken away, matching on_message.
+    async def reconcile_level_roles(self, guild, new_levels):
+        rewards = [(required_level, guild.get_role(role_id)) for required_level, role_id in self.level_rewards(guild.id)]
+        rewards = [(required_level, role) for required_level, role in rewards if role is not None]
+        if not rewards:
+            return 0, 0
+        # The whole member list, as most of these members may not be cached
+        members = {member.id: member for member in await guild_members(guild)}
+        missing = {}
+        for required_level, role in rewards:
+            for user_id, level in new_levels.items():
+                member = members.get(user_id)
+                if member is not None and level >= required_level and member.get_role(role.id) is None:
+                    missing.setdefault(member, []).append(role)
+
+        semaphore = asyncio.Semaphore(ROLE_REWARD_CONCURRENCY)
+
+        async def grant(member, roles):
+            async with semaphore:
+                try:
+                    await member.add_roles(*roles, reason="Level reward")
+                    return True
+                except discord.HTTPException:
+                    return False
+
+        results = await asyncio.gather(*(grant(member, roles) for member, roles in missing.items()))
+        return results.count(True), results.count(False)
+
+    # Parse an XP export into {user_id: total_xp}. Accepts {id: xp},
+    # {id: {"xp": xp}}, a list of {"id"/"user_id": ..., "xp": ...} entries,
+    # or the same list under a "players" key.
+    def parse_xp_export(self, data):
+        if isinstance(data, dict) and isinstance(data.get('players'), list):
+            data = data['players']
+        totals = {}
+        if isinstance(data, dict):
+            for user_id, value in data.items():
+                xp = value.get('xp', 0) if isinstance(value, dict) else value
+                totals[int(user_id)] = int(xp)
+        elif isinstance(data, list):
+            for entry in data:
+                user_id = entry.get('id', entry.get('user_id'))
+                totals[int(user_id)] = int(entry.get('xp', 0))
+        else:
+            raise ValueError("Unsupported export format.")
+        return totals
+
+    # Levels, the leaderboard and the XP curve are shared by every server the
+    # bot is in, so commands that change them for everyone are for the bot's
+    # owner rather than a server's administrators
+    def is_bot_owner():
+        async def predicate(interaction: discord.Interaction) -> bool:
+            return await interaction.client.is_owner(interaction.user)
+        return discord.app_commands.check(predicate)
 
     # Compliment Command
     @discord.app_commands.command(
@@ -102,56 +291,101 @@ class FunAndLevelCommands(commands.Cog):
         if message.author.bot:
             return
 
-        user_id = str(message.author.id)
-        current_time = time.time()
+        user_id = message.author.id
+        guild_id = message.guild.id if message.guild else None
+        window = self.cooldown_settings.window_for(guild_id, message.channel)
+        if not self.xp_cooldowns.try_start(user_id, window):
+            return
+
+        user_data = self.level_store.get(user_id)
+        if user_data is None:
+            user_data = LevelRecord()
 
-        if user_id not in self.levels:
-            self.levels[user_id] = {'xp': 0, 'level': 1, 'last_message_time': 0}
+        user_data.xp += 10
+        old_level = user_data.level
+        xp_for_next_level = self.get_xp_for_next_level(user_data.level)
 
-        user_data = self.levels[user_id]
+        while user_data.xp >= xp_for_next_level:
+            user_data.xp -= xp_for_next_level
+            user_data.level += 1
+            xp_for_next_level = self.get_xp_for_next_level(user_data.level)
 
-        if current_time - user_data['last_message_time'] < 30:
-            return
+        self.save_user_level(user_id, user_data)
+        self.leaderboard.update(user_id, user_data.level, user_data.xp)
 
-        user_data['last_message_time'] = current_time
-        user_data['xp'] += 10
-        xp_for_next_level = self.get_xp_for_next_level(user_data['level'])
+        if user_data.level > old_level:
+            # Announcements, DMs and reward roles are sent in the background
+            rewards = []
+            if message.guild:
+                for required_level, role_id in self.level_rewards(message.guild.id):
+                    role = message.guild.get_role(role_id)
+                    if role and old_level < required_level <= user_data.level:
+                        rewards.append((role, required_level))
+            self.level_outbox.add(message.author, message.channel, user_data.level, rewards)
 
-        while user_data['xp'] >= xp_for_next_level:
-            user_data['xp'] -= xp_for_next_level
-            user_data['level'] += 1
-            await message.channel.send(
-                f"{message.author.display_name} has leveled up to level {user_data['level']}!"
+    @discord.app_commands.command(
+        name="level",
+        description="Check your level or another person's level"
+    )
+    async def check_level(
+        self,
+        interaction: discord.Interaction,
+        member: discord.Member = None
+    ):
+        if member is None:
+            member = interaction.user
+
+        user_data = self.level_store.get(member.id) or LevelRecord()
+        if member == interaction.user:
+            await interaction.response.send_message(
+                f"{member.mention}, you are currently at level {user_data.level} with {user_data.xp} XP."
             )
-            await message.author.send(
-                f"Congratulations! You have leveled up to level {user_data['level']}!"
+        else:
+            await interaction.response.send_message(
+                f"{member.display_name} is currently at level {user_data.level} with {user_data.xp} XP."
             )
 
-            if user_data['level'] == 5:
-                verified_role = message.guild.get_role(self.verified_role_id)
-                if verified_role:
-                    await message.author.add_roles(verified_role)
-                    await message.author.send(
-                        f"You have been given the '{verified_role.name}' role for reaching level 5!"
-                    )
-
-            if user_data['level'] == 10:
-                verified_plus_role = message.guild.get_role(self.verified_plus_role_id)
-                if verified_plus_role:
-                    await message.author.add_roles(verified_plus_role)
-                    await message.author.send(
-                        f"You have been given the '{verified_plus_role.name}' role for reaching level 10!"
-                    )
+    @discord.app_commands.command(
+        name="leaderboard",
+        description="Show the global leaderboard of all servers"
+    )
+    @discord.app_commands.describe(page="The leaderboard page to show")
+    async def leaderboard_command(
+        self,
+        interaction: discord.Interaction,
+        page: int = 1
+    ):
+        page_count = self.leaderboard.page_count()
+        if page < 1 or page > page_count:
+            await interaction.response.send_message(
+                f"Page must be between 1 and {page_count}.", ephemeral=True
+            )
+            return
 
-            xp_for_next_level = self.get_xp_for_next_level(user_data['level'])
+        entries = self.leaderboard.page(page)
+        if not entries:
+            await interaction.response.send_message(
+                "Nobody has earned any XP yet.", ephemeral=True
+            )
+            return
 
-        self.save_levels()
+        lines = [
+            f"**#{rank}** <@{user_id}> - level {level}, {xp} XP"
+            for user_id, level, xp, rank in entries
+        ]
+        embed = discord.Embed(
+            title="Global Leaderboard", description="\n".join(lines), color=discord.Color.gold()
+        )
+        embed.set_footer(text=f"Page {page}/{page_count}")
+        await interaction.response.send_message(
+            embed=embed, allowed_mentions=discord.AllowedMentions.none()
+        )
 
     @discord.app_commands.command(
-        name="level",
-        description="Check your level or another person's level"
+        name="rank",
+        description="Check your global rank or another person's"
     )
-    async def check_level(
+    async def rank(
         self,
         interaction: discord.Interaction,
         member: discord.Member = None
@@ -159,24 +393,153 @@ class FunAndLevelCommands(commands.Cog):
         if member is None:
             member = interaction.user
 
-        user_id = str(member.id)
-        if user_id not in self.levels:
-            self.levels[user_id] = {'xp': 0, 'level': 1, 'last_message_time': 0}
-            self.save_levels()
+        rank = self.leaderboard.rank(member.id)
+        if rank is None:
+            await interaction.response.send_message(
+                f"{member.display_name} has not earned any XP yet."
+            )
+            return
 
-        user_data = self.levels[user_id]
-        if member == interaction.user:
+        user_data = self.level_store.get(member.id) or LevelRecord()
+        await interaction.response.send_message(
+            f"{member.display_name} is ranked #{rank} of {len(self.leaderboard)} "
+            f"at level {user_data.level} with {user_data.xp} XP."
+        )
+
+    @discord.app_commands.command(
+        name="xp_cooldown",
+        description="Set the XP cooldown for this server or a channel"
+    )
+    @discord.app_commands.describe(
+        seconds="Seconds between messages that earn XP (leave empty to reset)",
+        channel="The channel to set it for (defaults to the whole server)"
+    )
+    @discord.app_commands.checks.has_permissions(manage_guild=True)
+    async def xp_cooldown(
+        self,
+        interaction: discord.Interaction,
+        seconds: int = None,
+        channel: discord.TextChannel = None
+    ):
+        if seconds is not None and seconds < 0:
+            await interaction.response.send_message(
+                "The cooldown cannot be negative.", ephemeral=True
+            )
+            return
+
+        if channel is None:
+            self.cooldown_settings.set_window(self.cooldown_settings.guilds, interaction.guild.id, seconds)
+            target = "this server"
+        else:
+            self.cooldown_settings.set_window(self.cooldown_settings.channels, channel.id, seconds)
+            target = channel.mention
+
+        if seconds is None:
             await interaction.response.send_message(
-                f"{member.mention}, you are currently at level {user_data['level']} with {user_data['xp']} XP."
+                f"The XP cooldown for {target} has been reset.", ephemeral=True
             )
         else:
             await interaction.response.send_message(
-                f"{member.display_name} is currently at level {user_data['level']} with {user_data['xp']} XP."
+                f"The XP cooldown for {target} is now {seconds} seconds.", ephemeral=True
             )
 
+    @discord.app_commands.command(
+        name="xp_grant",
+        description="Grant or revoke XP for every member of a role"
+    )
+    @discord.app_commands.describe(
+        role="The role whose members get the XP",
+        amount="XP to grant (negative to revoke)"
+    )
+    @discord.app_commands.checks.has_permissions(administrator=True)
+    async def xp_grant(
+        self,
+        interaction: discord.Interaction,
+        role: discord.Role,
+        amount: int
+    ):
+        await interaction.response.defer(ephemeral=True)
+        user_ids = [member.id for member in await role_members(role) if not member.bot]
+        new_levels = await self.apply_total_xp(user_ids, lambda user_id, total: total + amount)
+        granted, failed = await self.reconcile_level_roles(interaction.guild, new_levels)
+        await interaction.followup.send(
+            f"Changed XP by {amount} for {len(new_levels)} members of {role.name}. "
+            f"Reward roles granted to {granted} members ({failed} failed).",
+            ephemeral=True
+        )
+
+    @discord.app_commands.command(
+        name="xp_import",
+        description="Bot owner: import global XP of this server's members from another bot's JSON export"
+    )
+    @discord.app_commands.describe(file="The JSON export to import")
+    @discord.app_commands.guild_only()
+    @is_bot_owner()
+    async def xp_import(
+        self,
+        interaction: discord.Interaction,
+        file: discord.Attachment
+    ):
+        await interaction.response.defer(ephemeral=True)
+        try:
+            imported = self.parse_xp_export(json.loads(await file.read()))
+        except (ValueError, TypeError, AttributeError) as e:
+            await interaction.followup.send(f"Could not read the export: {e}", ephemeral=True)
+            return
+
+        # Levels are global, so only this server's members are imported
+        member_ids = {member.id for member in await guild_members(interaction.guild)}
+        skipped = len(imported)
+        imported = {user_id: xp for user_id, xp in imported.items() if user_id in member_ids}
+        skipped -= len(imported)
+
+        new_levels = await self.apply_total_xp(list(imported), lambda user_id, total: imported[user_id])
+        granted, failed = await self.reconcile_level_roles(interaction.guild, new_levels)
+        await interaction.followup.send(
+            f"Imported XP for {len(new_levels)} members ({skipped} users who are not members skipped). "
+            f"Reward roles granted to {granted} members ({failed} failed).",
+            ephemeral=True
+        )
+
+    @discord.app_commands.command(
+        name="xp_curve",
+        description="Bot owner: change the XP curve of all servers and recompute everyone's level"
+    )
+    @discord.app_commands.describe(
+        coefficient="Going from level L to L + 1 costs coefficient * L^2 XP"
+    )
+    @is_bot_owner()
+    async def xp_curve_command(
+        self,
+        interaction: discord.Interaction,
+        coefficient: int
+    ):
+        if coefficient < 1:
+            await interaction.response.send_message(
+                "The coefficient must be at least 1.", ephemeral=True
+            )
+            return
+
+        await interaction.response.defer(ephemeral=True)
+        # Everyone keeps their total XP; only the levels it buys change
+        user_ids = [user_id for user_id, _ in self.level_store.iter_records()]
+        new_levels = await self.apply_total_xp(user_ids, lambda user_id, total: total, new_curve=coefficient)
+        # Switch once the saved levels follow the new curve. Under the flush
+        # lock, so no save merges rows while the curve changes, and other
+        # clusters only load the new curve after the levels are saved.
+        async with self.level_store.flush_lock:
+            self.xp_curve = coefficient
+            self.save_level_settings()
+        granted, failed = await self.reconcile_level_roles(interaction.guild, new_levels)
+        await interaction.followup.send(
+            f"XP curve set to {coefficient} * level^2. Recomputed {len(new_levels)} users. "
+            f"Reward roles granted to {granted} members ({failed} failed).",
+            ephemeral=True
+        )
+
     @commands.Cog.listener()
     async def on_ready(self):
-        print(f'Logged in as {self.bot.user}')
+        logging.info(f'Logged in as {self.bot.user}')
 
 async def setup(bot):
     await bot.add_cog(FunAndLevelCommands(bot))
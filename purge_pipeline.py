@@ -0,0 +1,99 @@
+import asyncio
+import datetime
+import discord
+
+# Messages younger than this can be bulk deleted (Discord allows 14 days;
+# the margin covers clock skew and time spent scanning)
+BULK_DELETE_MAX_AGE = datetime.timedelta(days=14) - datetime.timedelta(minutes=10)
+
+
+# Streams a channel's history, newest first, and deletes up to `limit`
+# messages matching the filters. Recent messages are bulk deleted 100 at a
+# time; older ones go to a throttled lane that deletes them one by one.
+# At most `scan_limit` messages are looked at when filters are used.
+class PurgePipeline:
+    def __init__(self, channel, limit, author=None, pattern=None, attachments_only=False,
+                 scan_limit=10000, single_delete_delay=1.0):
+        self.channel = channel
+        self.limit = limit
+        self.author = author
+        self.pattern = pattern
+        self.attachments_only = attachments_only
+        self.scan_limit = scan_limit
+        self.single_delete_delay = single_delete_delay
+        self.scanned = 0
+        self.matched = 0
+        self.deleted = 0
+        self.failed = 0
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def matches(self, message):
+        if self.author is not None and message.author.id != self.author.id:
+            return False
+        if self.pattern is not None and not self.pattern.search(message.content):
+            return False
+        if self.attachments_only and not message.attachments:
+            return False
+        return True
+
+    async def run(self):
+        old_messages = asyncio.Queue()
+        single_lane = asyncio.create_task(self.delete_singly(old_messages))
+        batch = []
+        cutoff = discord.utils.utcnow() - BULK_DELETE_MAX_AGE
+        filtered = self.author is not None or self.pattern is not None or self.attachments_only
+        scan_limit = self.scan_limit if filtered else self.limit
+        try:
+            async for message in self.channel.history(limit=scan_limit):
+                if self.cancelled:
+                    break
+                self.scanned += 1
+                if not self.matches(message):
+                    continue
+                self.matched += 1
+                if message.created_at > cutoff:
+                    batch.append(message)
+                    if len(batch) == 100:
+                        await self.delete_batch(batch)
+                        batch = []
+                else:
+                    old_messages.put_nowait(message)
+                if self.matched >= self.limit:
+                    break
+            if batch and not self.cancelled:
+                await self.delete_batch(batch)
+        finally:
+            old_messages.put_nowait(None)
+            await single_lane
+
+    async def delete_batch(self, batch):
+        try:
+            await self.channel.delete_messages(batch)
+            self.deleted += len(batch)
+        except discord.HTTPException:
+            self.failed += len(batch)
+
+    async def delete_singly(self, queue):
+        while True:
+            message = await queue.get()
+            if message is None or self.cancelled:
+                return
+            try:
+                await message.delete()
+                self.deleted += 1
+            except discord.HTTPException:
+                self.failed += 1
+            await asyncio.sleep(self.single_delete_delay)
+
+    def progress_text(self, finished=False):
+        if finished:
+            status = "Purge cancelled" if self.cancelled else "Purge finished"
+        else:
+            status = "Purging"
+        return (
+            f"{status}: deleted {self.deleted} of {self.matched} matching messages "
+            f"({self.scanned} scanned, {self.failed} failed)."
+        )
@@ -1,19 +1,38 @@
 import discord
 from discord.ext import commands
+from report_queue import ReportQueue
 
 # --- Configuration Values ---
-MOD_CHANNEL_ID = 123456789012345678  # Replace with your mod channel ID
+REPORTS_DIR = "reports"  # Reports not yet handled, one file per guild, replayed after a restart
+REPORT_GROUP_WINDOW = 600  # Seconds during which reports against the same user share one message
+REPORT_DELIVERY_INTERVAL = 5  # Seconds between updates of the mod channel
 
 # --- End of Configuration Values ---
 
 class ReportCommand(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.queue = ReportQueue(
+            bot, self.mod_channel, REPORTS_DIR,
+            window=REPORT_GROUP_WINDOW, interval=REPORT_DELIVERY_INTERVAL
+        )
+
+    # The guild's mod channel, set with /settings channels
+    def mod_channel(self, guild_id):
+        channel_id = self.bot.get_cog("GuildSettings").get(guild_id).mod_channel_id
+        return self.bot.get_channel(channel_id) if channel_id is not None else None
+
+    async def cog_load(self):
+        self.queue.start()
+
+    async def cog_unload(self):
+        await self.queue.close()
 
     @discord.app_commands.command(
         name="report",
         description="Report a user"
     )
+    @discord.app_commands.guild_only()
     @discord.app_commands.describe(
         user="The user you want to report",
         reason="The reason for reporting the user"
@@ -24,14 +43,17 @@ class ReportCommand(commands.Cog):
         user: discord.User,
         reason: str
     ):
-        mod_channel = self.bot.get_channel(MOD_CHANNEL_ID)
-        if mod_channel:
-            await mod_channel.send(
-                f"Report received:\nReporter: {interaction.user}\nReported User: {user}\nReason: {reason}"
-            )
+        # Commands synced before /report was guild-only can still be used in DMs
+        if interaction.guild is None:
+            await interaction.response.send_message("Reports can only be made in a server.", ephemeral=True)
+            return
+        if self.mod_channel(interaction.guild_id):
+            # Delivered to the mod channel in the background
+            record = self.queue.add(interaction.guild, interaction.user, user, reason)
             await interaction.response.send_message(
                 "Thank you for your report. Our moderators will review it shortly.", ephemeral=True
             )
+            await self.queue.persist(record)
         else:
             await interaction.response.send_message(
                 "Mod channel not found. Please contact an admin.", ephemeral=True
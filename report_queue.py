@@ -0,0 +1,223 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import discord
+from discord.ext import tasks
+from metrics import instrumented
+from state_files import GuildFiles
+
+FIELD_VALUE_LIMIT = 1024  # Discord's maximum length of an embed field value
+
+
+# All reports against one user in one guild within a time window. They are
+# shown in a single mod channel message that is edited as reports arrive.
+class ReportGroup:
+    __slots__ = ('guild_id', 'target_id', 'window_start', 'message_id', 'reports', 'dirty', 'failures')
+
+    def __init__(self, guild_id, target_id, window_start):
+        self.guild_id = guild_id
+        self.target_id = target_id
+        self.window_start = window_start
+        self.message_id = None
+        self.reports = []
+        self.dirty = True
+        self.failures = 0
+
+    @property
+    def key(self):
+        return (self.guild_id, self.target_id, self.window_start)
+
+    def reporter_count(self):
+        return len({report["reporter_id"] for report in self.reports})
+
+
+# Queue between /report and each guild's mod channel.
+# Reports are grouped per reported user for `window` seconds and every
+# `interval` seconds each changed group's message is sent or edited, so a
+# raid produces one updating message per target instead of one per report.
+# Reports and the message each group was posted as are appended to a JSON
+# lines file per guild in `directory`; on startup they are replayed so
+# nothing is lost, and a guild's file is rewritten without finished groups
+# whenever some of its groups expire.
+# A message that Discord rejects (a 4xx other than a rate limit) or that
+# fails max_attempts times in a row is given up on until the group changes
+# again, so the group can still expire.
+class ReportQueue:
+    # channel_for(guild_id) returns the channel a guild's reports go to, or None
+    def __init__(self, bot, channel_for, directory, window=600, interval=5, recent_reasons=5, max_attempts=5):
+        self.bot = bot
+        self.channel_for = channel_for
+        self.files = GuildFiles(directory, extension='.jsonl')
+        self.window = window
+        self.recent_reasons = recent_reasons
+        self.max_attempts = max_attempts
+        self.groups = {}
+        self.current = {}
+        self.file_lock = asyncio.Lock()
+        self.deliver_loop.change_interval(seconds=interval)
+
+    def start(self):
+        self.load()
+        self.deliver_loop.start()
+
+    async def close(self):
+        self.deliver_loop.cancel()
+        await self.deliver()
+
+    # Rebuild the open groups from the logs
+    def load(self):
+        seen = set()
+        for data in self.files.read_all().values():
+            for line in data.splitlines():
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if record["type"] == "report":
+                    # A report persisted while the log was being rewritten can appear twice
+                    report_key = (record["reporter_id"], record["target_id"], record["created_at"])
+                    if report_key not in seen:
+                        seen.add(report_key)
+                        self.add_report(record)
+                elif record["type"] == "message":
+                    group = self.groups.get((record["guild_id"], record["target_id"], record["window_start"]))
+                    if group is not None:
+                        group.message_id = record["message_id"]
+
+    @staticmethod
+    def join_lines(records):
+        return ''.join(json.dumps(record) + '\n' for record in records)
+
+    def add_report(self, record):
+        current_key = (record["guild_id"], record["target_id"])
+        group = self.current.get(current_key)
+        if group is None or record["created_at"] >= group.window_start + self.window:
+            group = ReportGroup(record["guild_id"], record["target_id"], record["created_at"])
+            self.groups[group.key] = group
+            self.current[current_key] = group
+        group.reports.append(record)
+        group.dirty = True
+        return group
+
+    # Queue a report and return its record for persist()
+    def add(self, guild, reporter, target, reason):
+        record = {
+            "type": "report",
+            "guild_id": guild.id,
+            "target_id": target.id,
+            "target_name": str(target),
+            "reporter_id": reporter.id,
+            "reason": reason,
+            "created_at": time.time(),
+        }
+        self.add_report(record)
+        return record
+
+    async def persist(self, record):
+        async with self.file_lock:
+            await asyncio.to_thread(self.append_line, record["guild_id"], json.dumps(record))
+
+    def append_line(self, guild_id, line):
+        os.makedirs(self.files.directory, exist_ok=True)
+        with open(self.files.path(guild_id), 'a') as f:
+            f.write(line + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    @tasks.loop(seconds=5)
+    @instrumented("task:report_queue.deliver_loop")
+    async def deliver_loop(self):
+        await self.deliver()
+
+    async def deliver(self):
+        for group in [group for group in self.groups.values() if group.dirty]:
+            # Kept until the guild has a mod channel again
+            channel = self.channel_for(group.guild_id)
+            if channel is None:
+                continue
+            group.dirty = False
+            try:
+                await self.post(channel, group)
+            except discord.HTTPException as e:
+                group.failures += 1
+                if (400 <= e.status < 500 and e.status != 429) or group.failures >= self.max_attempts:
+                    group.failures = 0
+                    logging.error(f"Giving up on delivering reports against {group.target_id}: {e}")
+                else:
+                    group.dirty = True
+                    logging.error(f"Failed to deliver reports against {group.target_id}, will retry: {e}")
+            else:
+                group.failures = 0
+        await self.expire()
+
+    async def post(self, channel, group):
+        embed = self.build_embed(group)
+        if group.message_id is not None:
+            try:
+                await channel.get_partial_message(group.message_id).edit(embed=embed)
+                return
+            except discord.NotFound:
+                pass
+        message = await channel.send(embed=embed)
+        group.message_id = message.id
+        await self.persist(self.message_record(group))
+
+    # Log record tying a group to the message it was posted as
+    def message_record(self, group):
+        return {
+            "type": "message",
+            "guild_id": group.guild_id,
+            "target_id": group.target_id,
+            "window_start": group.window_start,
+            "message_id": group.message_id,
+        }
+
+    def build_embed(self, group):
+        latest = group.reports[-1]
+        reporters = group.reporter_count()
+        embed = discord.Embed(
+            title=f"Reports against {latest['target_name']}",
+            description=f"<@{group.target_id}> ({group.target_id})",
+            color=discord.Color.red(),
+            timestamp=discord.utils.utcnow()
+        )
+        embed.add_field(name="Reporters", value=str(reporters))
+        embed.add_field(name="Reports", value=str(len(group.reports)))
+        embed.add_field(name="First report", value=f"<t:{int(group.window_start)}:R>")
+        # Newest first, as many as fit in the field
+        lines = []
+        length = 0
+        for report in reversed(group.reports[-self.recent_reasons:]):
+            line = f"<@{report['reporter_id']}>: {report['reason'][:200]}"
+            length += len(line) + (1 if lines else 0)
+            if length > FIELD_VALUE_LIMIT:
+                break
+            lines.append(line)
+        embed.add_field(name="Latest reasons", value="\n".join(lines), inline=False)
+        return embed
+
+    # Drop delivered groups whose window has passed and rewrite their guilds' logs without them
+    async def expire(self):
+        now = time.time()
+        expired = [
+            group for group in self.groups.values()
+            if not group.dirty and now >= group.window_start + self.window
+        ]
+        if not expired:
+            return
+        for group in expired:
+            del self.groups[group.key]
+            current_key = (group.guild_id, group.target_id)
+            if self.current.get(current_key) is group:
+                del self.current[current_key]
+
+        async with self.file_lock:
+            for guild_id in {group.guild_id for group in expired}:
+                records = []
+                for group in self.groups.values():
+                    if group.guild_id == guild_id:
+                        records.extend(group.reports)
+                        if group.message_id is not None:
+                            records.append(self.message_record(group))
+                await asyncio.to_thread(self.files.write, guild_id, self.join_lines(records) if records else None)
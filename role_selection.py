@@ -2,31 +2,62 @@ import discord
 from discord.ext import commands
 from discord import app_commands
 import json
+import logging
 import os
+from cluster import owns_guild
+from guild_settings import LEGACY_GUILD_ID
+from state_files import GuildFiles
 
 # --- Configuration Values ---
-ROLES_FILE = "roles.json"  # Path to the roles file
+ROLES_DIR = "roles"  # Role selection questions, one file per guild
+ROLES_FILE = "roles.json"  # Questions from before they were kept per guild; moved to LEGACY_GUILD_ID (guild_settings.py)
 
 # --- End of Configuration Values ---
 
+
+# Role selection questions of each guild on this process's shards. A
+# guild's file holds {"questions": [{"question": ..., "roles": [{"id": ..., "name": ...}]}]}.
 class RoleSelection(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.roles_file = ROLES_FILE
-        self.roles_data = self.load_roles()
+        self.files = GuildFiles(ROLES_DIR)
+        self.questions = self.load_roles()
+        self.import_roles_file()
 
     def load_roles(self):
-        if os.path.exists(self.roles_file):
-            with open(self.roles_file, "r") as file:
-                data = json.load(file)
-                if "questions" not in data:
-                    data["questions"] = []
-                return data
-        return {"questions": []}
-
-    def save_roles(self):
-        with open(self.roles_file, "w") as file:
-            json.dump(self.roles_data, file, indent=4)
+        return {
+            guild_id: json.loads(data).get("questions", []) for guild_id, data in self.files.read_all().items()
+        }
+
+    # Move the questions of the single roles.json used before to the guild
+    # they were set up for, unless it already has questions of its own
+    def import_roles_file(self):
+        if not os.path.exists(ROLES_FILE):
+            return
+        with open(ROLES_FILE, 'r') as f:
+            legacy_questions = json.load(f).get("questions", [])
+        if not legacy_questions:
+            return
+        if LEGACY_GUILD_ID is None:
+            logging.warning(
+                f"{ROLES_FILE} has {len(legacy_questions)} role selection questions, but no server to move them "
+                f"to; set LEGACY_GUILD_ID in guild_settings.py to the server they were set up for."
+            )
+            return
+        if not owns_guild(LEGACY_GUILD_ID) or LEGACY_GUILD_ID in self.questions:
+            return
+        self.questions[LEGACY_GUILD_ID] = legacy_questions
+        self.save_roles(LEGACY_GUILD_ID)
+        logging.info(f"Moved {len(legacy_questions)} role selection questions from {ROLES_FILE} to guild {LEGACY_GUILD_ID}.")
+
+    # A guild's questions; the list is stored, so changes to it are kept
+    def guild_questions(self, guild_id):
+        return self.questions.setdefault(guild_id, [])
+
+    # A guild keeps its file when its last question is removed, so roles.json
+    # is not moved to it again
+    def save_roles(self, guild_id):
+        self.files.write(guild_id, json.dumps({"questions": self.guild_questions(guild_id)}, indent=4))
 
     def is_moderator_or_admin():
         async def predicate(interaction: discord.Interaction) -> bool:
@@ -37,6 +68,7 @@ class RoleSelection(commands.Cog):
         name="set_roles",
         description="Set roles and associated question."
     )
+    @app_commands.guild_only()
     @app_commands.describe(
         question="The question to ask for role selection",
         role1="First role",
@@ -61,11 +93,11 @@ class RoleSelection(commands.Cog):
         roles = [role for role in [role1, role2, role3, role4, role5, role6] if role]
         role_data = [{"id": role.id, "name": role.name} for role in roles]
 
-        self.roles_data["questions"].append({
+        self.guild_questions(interaction.guild.id).append({
             "question": question,
             "roles": role_data
         })
-        self.save_roles()
+        self.save_roles(interaction.guild.id)
         await interaction.response.send_message(
             f"Roles and question have been set.", ephemeral=True
         )
@@ -74,15 +106,17 @@ class RoleSelection(commands.Cog):
         name="list_questions",
         description="List all set questions."
     )
+    @app_commands.guild_only()
     async def list_questions(self, interaction: discord.Interaction):
-        if not self.roles_data["questions"]:
+        questions = self.guild_questions(interaction.guild.id)
+        if not questions:
             await interaction.response.send_message(
                 "No questions have been set.", ephemeral=True
             )
             return
 
         message = "Current questions:\n"
-        for i, q in enumerate(self.roles_data["questions"]):
+        for i, q in enumerate(questions):
             message += f"{i + 1}: {q['question']} - Roles: {', '.join([role['name'] for role in q['roles']])}\n"
 
         await interaction.response.send_message(message, ephemeral=True)
@@ -91,6 +125,7 @@ class RoleSelection(commands.Cog):
         name="remove_question",
         description="Remove a specific question by number."
     )
+    @app_commands.guild_only()
     @app_commands.describe(question_number="The number of the question to remove")
     @is_moderator_or_admin()
     async def remove_question(
@@ -98,20 +133,21 @@ class RoleSelection(commands.Cog):
         interaction: discord.Interaction,
         question_number: int
     ):
-        if not self.roles_data["questions"]:
+        questions = self.guild_questions(interaction.guild.id)
+        if not questions:
             await interaction.response.send_message(
                 "No questions have been set.", ephemeral=True
             )
             return
 
-        if question_number < 1 or question_number > len(self.roles_data["questions"]):
+        if question_number < 1 or question_number > len(questions):
             await interaction.response.send_message(
                 "Invalid question number.", ephemeral=True
             )
             return
 
-        removed_question = self.roles_data["questions"].pop(question_number - 1)
-        self.save_roles()
+        removed_question = questions.pop(question_number - 1)
+        self.save_roles(interaction.guild.id)
         await interaction.response.send_message(
             f"Removed question: {removed_question['question']}", ephemeral=True
         )
@@ -120,8 +156,10 @@ class RoleSelection(commands.Cog):
         name="pick_role",
         description="Pick a role based on a question."
     )
+    @app_commands.guild_only()
     async def pick_role(self, interaction: discord.Interaction):
-        if not self.roles_data["questions"]:
+        questions = self.guild_questions(interaction.guild.id)
+        if not questions:
             await interaction.response.send_message(
                 "Roles have not been set yet.", ephemeral=True
             )
@@ -130,7 +168,7 @@ class RoleSelection(commands.Cog):
         # Present a list of questions to choose from
         question_options = [
             discord.SelectOption(label=q["question"], value=str(i))
-            for i, q in enumerate(self.roles_data["questions"])
+            for i, q in enumerate(questions)
         ]
 
         class QuestionSelect(discord.ui.Select):
@@ -140,7 +178,11 @@ class RoleSelection(commands.Cog):
 
             async def callback(self, interaction: discord.Interaction):
                 selected_index = int(self.values[0])
-                question_data = self.bot.cogs["RoleSelection"].roles_data["questions"][selected_index]
+                questions = self.bot.cogs["RoleSelection"].guild_questions(interaction.guild.id)
+                if selected_index >= len(questions):
+                    await interaction.response.send_message("That question has been removed.", ephemeral=True)
+                    return
+                question_data = questions[selected_index]
                 question = question_data["question"]
                 roles = question_data["roles"]
 
@@ -180,6 +222,7 @@ class RoleSelection(commands.Cog):
         name="remove_role",
         description="Remove a role."
     )
+    @app_commands.guild_only()
     async def remove_role(self, interaction: discord.Interaction):
         user_roles = interaction.user.roles
         options = [
@@ -215,7 +258,7 @@ class RoleSelection(commands.Cog):
 
     @commands.Cog.listener()
     async def on_ready(self):
-        print(f'Logged in as {self.bot.user}')
+        logging.info(f'Logged in as {self.bot.user}')
 
 async def setup(bot):
     await bot.add_cog(RoleSelection(bot))
@@ -0,0 +1,77 @@
+import copy
+import json
+import os
+from atomic_file import atomic_write
+from cluster import owns_guild
+
+
+# Per-guild state in a directory holding one file per guild, named by guild
+# ID ("guild_settings/123456789012345678.json"). A guild is handled by one
+# process at a time, so clusters (see cluster_launcher.py) never write the
+# same file, and no file depends on which cluster a guild is on, so nothing
+# is orphaned when guilds move to another cluster.
+class GuildFiles:
+    def __init__(self, directory, extension='.json'):
+        self.directory = directory
+        self.extension = extension
+
+    def path(self, guild_id):
+        return os.path.join(self.directory, f"{guild_id}{self.extension}")
+
+    # Contents of every file of a guild on this process's shards, by guild ID
+    def read_all(self):
+        contents = {}
+        if not os.path.isdir(self.directory):
+            return contents
+        for name in os.listdir(self.directory):
+            guild_id, extension = os.path.splitext(name)
+            if extension != self.extension or not guild_id.isdigit() or not owns_guild(int(guild_id)):
+                continue
+            with open(os.path.join(self.directory, name), 'r') as f:
+                contents[int(guild_id)] = f.read()
+        return contents
+
+    # Atomically replace a guild's file; None deletes it
+    def write(self, guild_id, data):
+        if data is None:
+            try:
+                os.unlink(self.path(guild_id))
+            except FileNotFoundError:
+                pass
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        atomic_write(self.path(guild_id), data)
+
+
+# JSON file shared by every process, for settings that are not per guild
+# (the XP curve, XP cooldown overrides, role selection questions). Each
+# process keeps the contents in memory and reloads them when another
+# process has replaced the file; changes are made to freshly read contents
+# so they do not undo another process's change.
+class SharedFile:
+    def __init__(self, path, default):
+        self.path = path
+        self.default = default
+        self.version = None
+
+    def stat(self):
+        try:
+            status = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return status.st_mtime_ns, status.st_ino, status.st_size
+
+    def read(self):
+        self.version = self.stat()
+        if self.version is None:
+            return copy.deepcopy(self.default)
+        with open(self.path, 'r') as f:
+            return json.load(f)
+
+    # Whether the file was replaced since it was last read or written here
+    def changed(self):
+        return self.stat() != self.version
+
+    def write(self, data, indent=4):
+        atomic_write(self.path, json.dumps(data, indent=indent))
+        self.version = self.stat()
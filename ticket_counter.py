@@ -0,0 +1,56 @@
+import asyncio
+import os
+from atomic_file import atomic_write
+
+
+# Ticket number counter that hands out numbers from memory.
+# The file holds the highest number that may have been handed out. Numbers
+# are reserved a block at a time by raising that value durably before any
+# of them is used, so ticket creation does no file I/O until a block runs
+# out, and numbers stay unique and increasing across crashes (a crash only
+# skips the unused rest of the block).
+# Clustered processes pass reserve, an async function that reserves a block
+# for them elsewhere (the coordinator in cluster_launcher.py, which runs
+# reserve_block on the shared file) and returns its highest number.
+class TicketCounter:
+    def __init__(self, path, block_size=100, reserve=None):
+        self.path = path
+        self.block_size = block_size
+        self.reserve = reserve or self.reserve_block
+        self.lock = asyncio.Lock()
+        self.file_lock = asyncio.Lock()
+        self.next_number = None
+        self.reserved = 0
+        self.ceiling = None
+
+    async def next(self):
+        while self.next_number is None or self.next_number > self.reserved:
+            async with self.lock:
+                if self.next_number is None or self.next_number > self.reserved:
+                    self.reserved = await self.reserve(self.block_size)
+                    self.next_number = self.reserved - self.block_size + 1
+        # No await between the check above and here, so this is atomic
+        number = self.next_number
+        self.next_number += 1
+        return number
+
+    # Raise the file's value by count; returns the new value
+    async def reserve_block(self, count):
+        async with self.file_lock:
+            if self.ceiling is None:
+                self.ceiling = await asyncio.to_thread(self.read)
+            ceiling = self.ceiling + count
+            await asyncio.to_thread(self.write, ceiling)
+            self.ceiling = ceiling
+            return ceiling
+
+    def read(self):
+        if not os.path.exists(self.path):
+            return 0
+        with open(self.path, 'r') as f:
+            content = f.read().strip()
+        return int(content) if content else 0
+
+    # Atomically and durably replace the file contents
+    def write(self, value):
+        atomic_write(self.path, str(value))